@@ -4,11 +4,28 @@ import { client, updateLeaderBoard } from './shared/supabase';
 
 const API_URL = import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000';
 
+// crypto.randomUUID only exists in secure contexts (https or localhost), not when
+// the app is opened over plain http on a LAN IP, as when testing on a phone
+const createSessionId = () => {
+  if (typeof crypto !== 'undefined' && crypto.randomUUID) {
+    return crypto.randomUUID();
+  }
+  if (typeof crypto !== 'undefined' && crypto.getRandomValues) {
+    return Array.from(crypto.getRandomValues(new Uint8Array(16)), (b) => b.toString(16).padStart(2, '0')).join('');
+  }
+  return `${Date.now().toString(16)}-${Math.random().toString(16).slice(2)}`;
+};
+
 const VideoBox = ({ surveyId }) => {
   const videoRef = useRef(null);
   const canvasRef = useRef(null);
   const streamRef = useRef(null);
   const animationFrameRef = useRef(null);
+  // Per-tab session id so concurrent users keep separate exercise counters on the backend
+  const sessionIdRef = useRef(null);
+  if (!sessionIdRef.current) {
+    sessionIdRef.current = createSessionId();
+  }
 
   
   const [isActive, setIsActive] = useState(false);
@@ -222,7 +239,10 @@ const VideoBox = ({ surveyId }) => {
 
   const resetCounters = async () => {
     try {
-      await fetch(`${API_URL}/api/reset-counters`, { method: 'POST' });
+      await fetch(`${API_URL}/api/reset-counters`, {
+        method: 'POST',
+        headers: { 'X-Session-Id': sessionIdRef.current }
+      });
       const zeroCounters = { push_up: 0, squat: 0, jumping_jack: 0, arm_circle: 0 };
       setCounters(zeroCounters);
       baselineCountersRef.current = { ...zeroCounters };
@@ -389,8 +409,12 @@ const VideoBox = ({ surveyId }) => {
     });
   }, []);
 
-  // Process video frames and detect exercises (throttled to ~10fps)
+  // Process video frames and detect exercises (throttled to the rate the backend recommends)
   const lastFrameTime = useRef(0);
+  // Capture rate, upload width and JPEG quality; updated from each response's capture_hints
+  const captureHintsRef = useRef({ fps: 10, width: 640, jpeg_quality: 0.8 });
+  // Offscreen canvas the uploaded frame is drawn to (video only, scaled to the hinted width)
+  const uploadCanvasRef = useRef(null);
   const processFrame = useCallback(async () => {
     // Check if we should continue processing
     // Allow processing during countdown so landmarks can show up and calibrate
@@ -408,8 +432,9 @@ const VideoBox = ({ surveyId }) => {
     }
     
     const now = Date.now();
-    // Throttle to ~10fps (100ms between frames)
-    if (now - lastFrameTime.current < 100) {
+    const hints = captureHintsRef.current;
+    // Throttle to the recommended frame rate
+    if (now - lastFrameTime.current < 1000 / hints.fps) {
       animationFrameRef.current = requestAnimationFrame(processFrame);
       return;
     }
@@ -429,6 +454,22 @@ const VideoBox = ({ surveyId }) => {
       // Clear and draw video frame
       ctx.clearRect(0, 0, canvas.width, canvas.height);
       ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
+      // Capture time of this frame; the backend times holds and velocities with it
+      const capturedAt = performance.now();
+      
+      // Frame to upload: the bare video frame, no wider than the recommended width
+      if (!uploadCanvasRef.current) {
+        uploadCanvasRef.current = document.createElement('canvas');
+      }
+      const uploadCanvas = uploadCanvasRef.current;
+      const uploadScale = Math.min(1, hints.width / video.videoWidth);
+      const uploadWidth = Math.round(video.videoWidth * uploadScale);
+      const uploadHeight = Math.round(video.videoHeight * uploadScale);
+      if (uploadCanvas.width !== uploadWidth || uploadCanvas.height !== uploadHeight) {
+        uploadCanvas.width = uploadWidth;
+        uploadCanvas.height = uploadHeight;
+      }
+      uploadCanvas.getContext('2d').drawImage(video, 0, 0, uploadWidth, uploadHeight);
       
       // Draw landmarks if available (from previous frame response)
       // Always draw landmarks on every frame if they exist in state
@@ -448,8 +489,8 @@ const VideoBox = ({ surveyId }) => {
         }
       }
       
-      // Convert canvas to blob and send to backend
-      canvas.toBlob(async (blob) => {
+      // Convert the upload canvas to a JPEG blob and send to backend
+      uploadCanvas.toBlob(async (blob) => {
         if (!blob) {
           animationFrameRef.current = requestAnimationFrame(processFrame);
           return;
@@ -461,6 +502,10 @@ const VideoBox = ({ surveyId }) => {
           
           const response = await fetch(`${API_URL}/api/process-frame`, {
             method: 'POST',
+            headers: {
+              'X-Session-Id': sessionIdRef.current,
+              'X-Capture-Timestamp': capturedAt.toFixed(1)
+            },
             body: formData
           });
           
@@ -471,6 +516,10 @@ const VideoBox = ({ surveyId }) => {
           
           const data = await response.json();
           
+          if (data.capture_hints) {
+            captureHintsRef.current = data.capture_hints;
+          }
+          
           if (data.exercises) {
             // Backend now only returns the 4 hardcoded exercises: push_up, squat, jumping_jack, arm_circle
             setCounters(data.exercises);
@@ -521,7 +570,7 @@ const VideoBox = ({ surveyId }) => {
             animationFrameRef.current = requestAnimationFrame(processFrame);
           }
         }
-      }, 'image/jpeg', 0.8);
+      }, 'image/jpeg', hints.jpeg_quality);
     } else {
       // Video not ready yet, wait a bit longer and try again
       if (videoRef.current) {
@@ -739,6 +788,24 @@ const VideoBox = ({ surveyId }) => {
     setPreviousCounters({ ...baselineCountersRef.current });
   }, [survey, workout, currentQuestionIndex]); // Only run when question changes
 
+  // Only run the detectors for the current question's exercises on the backend
+  useEffect(() => {
+    if (!survey || !workout) return;
+
+    const currentQuestion = survey.questions[currentQuestionIndex];
+    const segment = currentQuestion && (
+      workout.segments.find(s => s.question_id === currentQuestion.id) ||
+      workout.segments.find(s => s.question_id === `q${currentQuestionIndex + 1}`)
+    );
+
+    fetch(`${API_URL}/api/session/exercises`, {
+      method: 'PUT',
+      headers: { 'Content-Type': 'application/json', 'X-Session-Id': sessionIdRef.current },
+      // No mapped exercises (breaks, open-ended questions) restores the default set
+      body: JSON.stringify(segment && segment.option_exercise_mapping ? { segment } : {})
+    }).catch(err => console.error('Error setting active exercises:', err));
+  }, [survey, workout, currentQuestionIndex]);
+
   // Auto-advance to next question when exercise is complete (after 5 reps)
   useEffect(() => {
     if (!isExerciseComplete || !survey) return;
@@ -805,7 +872,10 @@ const VideoBox = ({ surveyId }) => {
       
       // Reset counters to 0 when advancing to next question
       try {
-        await fetch(`${API_URL}/api/reset-counters`, { method: 'POST' });
+        await fetch(`${API_URL}/api/reset-counters`, {
+          method: 'POST',
+          headers: { 'X-Session-Id': sessionIdRef.current }
+        });
         const zeroCounters = { push_up: 0, squat: 0, jumping_jack: 0, arm_circle: 0 };
         setCounters(zeroCounters);
         countersRef.current = zeroCounters;
@@ -6,8 +6,145 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # MediaPipe Configuration
-MODEL_PATH = "pose_landmarker_full.task"
-MODEL_URL = "https://storage.googleapis.com/mediapipe-models/pose_landmarker/pose_landmarker_full/float16/1/pose_landmarker_full.task"
+# Pose landmarker model tiers, from fastest to most accurate
+MODEL_TIERS = ["lite", "full", "heavy"]
+MODEL_PATHS = {tier: f"pose_landmarker_{tier}.task" for tier in MODEL_TIERS}
+MODEL_URLS = {
+    tier: f"https://storage.googleapis.com/mediapipe-models/pose_landmarker/pose_landmarker_{tier}/float16/1/pose_landmarker_{tier}.task"
+    for tier in MODEL_TIERS
+}
+# Tiers sessions may be moved between (must be a subset of MODEL_TIERS)
+POSE_MODEL_TIERS = [tier for tier in MODEL_TIERS if tier in os.getenv("POSE_MODEL_TIERS", "lite,full,heavy").split(",")]
+POSE_DEFAULT_TIER = os.getenv("POSE_DEFAULT_TIER", "full")
+# Target per-frame inference latency; sessions step down a tier above it and back up with headroom
+POSE_LATENCY_BUDGET_MS = float(os.getenv("POSE_LATENCY_BUDGET_MS", "40"))
+# MediaPipe frames whose mean landmark presence is below this are re-run on the next bigger tier (0 disables)
+POSE_RERUN_PRESENCE_THRESHOLD = float(os.getenv("POSE_RERUN_PRESENCE_THRESHOLD", "0.5"))
+# Landmarker instances per inference process; sessions lease one and keep it while active
+POSE_POOL_SIZE = int(os.getenv("POSE_POOL_SIZE", str(os.cpu_count() or 1)))
+
+# Pose Backend Configuration
+# Pose model run on camera frames: "mediapipe" (the tiers above) or "yolo" (Ultralytics YOLO-pose on the CPU)
+POSE_BACKEND = os.getenv("POSE_BACKEND", "mediapipe")
+# YOLO-pose weights per model tier (downloaded by Ultralytics on first use)
+YOLO_POSE_MODELS = {
+    "lite": os.getenv("YOLO_POSE_MODEL_LITE", "yolo11n-pose.pt"),
+    "full": os.getenv("YOLO_POSE_MODEL_FULL", "yolo11s-pose.pt"),
+    "heavy": os.getenv("YOLO_POSE_MODEL_HEAVY", "yolo11m-pose.pt"),
+}
+# YOLO-pose input size in pixels (multiple of 32); smaller is faster and misses small people
+YOLO_POSE_IMAGE_SIZE = int(os.getenv("YOLO_POSE_IMAGE_SIZE", "320"))
+# People detected with less confidence than this are ignored
+YOLO_POSE_MIN_CONFIDENCE = float(os.getenv("YOLO_POSE_MIN_CONFIDENCE", "0.5"))
+# YOLO frames whose mean keypoint confidence is below this are re-run on the next bigger tier (0 disables);
+# keypoint confidences run lower than MediaPipe's presence for the same pose
+YOLO_POSE_RERUN_CONFIDENCE_THRESHOLD = float(os.getenv("YOLO_POSE_RERUN_CONFIDENCE_THRESHOLD", "0.4"))
+# Torch threads per inference process (0 keeps torch's default of one per core)
+YOLO_POSE_TORCH_THREADS = int(os.getenv("YOLO_POSE_TORCH_THREADS", "1"))
+
+# Frame Preprocessing Configuration
+# Frames are decoded/resized to at most this width before pose inference
+FRAME_TARGET_WIDTH = int(os.getenv("FRAME_TARGET_WIDTH", "640"))
+# Sessions that keep reusable decode buffers per inference process (least recently used lose theirs)
+FRAME_BUFFER_SESSIONS = int(os.getenv("FRAME_BUFFER_SESSIONS", "256"))
+# Crop each frame to the previous frame's pose box (plus a margin) before inference; only for pose
+# backends that do not track the pose themselves (YOLO-pose), MediaPipe VIDEO mode picks its own region
+POSE_ROI_ENABLED = os.getenv("POSE_ROI_ENABLED", "true").lower() == "true"
+POSE_ROI_MARGIN = float(os.getenv("POSE_ROI_MARGIN", "0.25"))
+# Crops covering more of the frame than this are not worth it; the full frame is used
+POSE_ROI_MAX_AREA = float(os.getenv("POSE_ROI_MAX_AREA", "0.7"))
+
+# Motion Gating Configuration
+# Frames that barely differ from the last inferred frame reuse its landmarks instead of running inference
+MOTION_GATE_ENABLED = os.getenv("MOTION_GATE_ENABLED", "true").lower() == "true"
+# A downsampled grayscale pixel counts as changed when it differs by more than this many gray levels
+MOTION_GATE_PIXEL_DELTA = int(os.getenv("MOTION_GATE_PIXEL_DELTA", "12"))
+# Frames with fewer changed pixels than this fraction are static
+MOTION_GATE_THRESHOLD = float(os.getenv("MOTION_GATE_THRESHOLD", "0.01"))
+# Static frames in a row after which inference runs anyway, to refresh the landmarks
+MOTION_GATE_MAX_SKIPPED_FRAMES = int(os.getenv("MOTION_GATE_MAX_SKIPPED_FRAMES", "5"))
+
+# Capture Hints Configuration
+# Bounds of the capture rate recommended to clients (each exercise declares the rate it needs)
+CAPTURE_MIN_FPS = float(os.getenv("CAPTURE_MIN_FPS", "2"))
+CAPTURE_MAX_FPS = float(os.getenv("CAPTURE_MAX_FPS", "30"))
+# Rate recommended to sessions that have not chosen their exercises (the frontend's default rate)
+CAPTURE_DEFAULT_FPS = float(os.getenv("CAPTURE_DEFAULT_FPS", "10"))
+# Frame width recommended while the server is at capacity (FRAME_TARGET_WIDTH otherwise)
+CAPTURE_MIN_WIDTH = int(os.getenv("CAPTURE_MIN_WIDTH", "384"))
+# JPEG quality recommended by default, and the lowest it steps down to for large frames
+CAPTURE_JPEG_QUALITY = float(os.getenv("CAPTURE_JPEG_QUALITY", "0.8"))
+CAPTURE_MIN_JPEG_QUALITY = float(os.getenv("CAPTURE_MIN_JPEG_QUALITY", "0.5"))
+# Sessions whose frames are larger than this are asked for a lower JPEG quality
+CAPTURE_TARGET_FRAME_KB = float(os.getenv("CAPTURE_TARGET_FRAME_KB", "48"))
+
+# Group Mode Configuration
+# Most people one group session's camera tracks (landmarker num_poses)
+GROUP_MAX_PEOPLE = int(os.getenv("GROUP_MAX_PEOPLE", "8"))
+# A pose continues a track when their landmark boxes overlap at least this much (IoU)
+GROUP_TRACK_MIN_IOU = float(os.getenv("GROUP_TRACK_MIN_IOU", "0.3"))
+# Tracks without a matching pose for this many frames are closed (their counts are kept)
+GROUP_TRACK_MAX_MISSED_FRAMES = int(os.getenv("GROUP_TRACK_MAX_MISSED_FRAMES", "30"))
+# Closed tracks listed with their own counts; older ones only add to the group's finished total
+GROUP_MAX_FINISHED_TRACKS = int(os.getenv("GROUP_MAX_FINISHED_TRACKS", "32"))
+
+# Inference Executor Configuration
+# "thread" runs pose inference on per-shard worker threads, "process" on per-shard worker processes
+INFERENCE_EXECUTOR = os.getenv("INFERENCE_EXECUTOR", "thread")
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(os.cpu_count() or 1)))
+# Frames waiting for a free inference worker beyond this are rejected
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "64"))
+# Frames from different sessions arriving within this window are dispatched together (0 disables batching)
+INFERENCE_BATCH_WINDOW_MS = float(os.getenv("INFERENCE_BATCH_WINDOW_MS", "5"))
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "32"))
+
+# Exercise Session Configuration
+# Upper bound on live sessions held in memory (least recently used are evicted first)
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "5000"))
+# Sessions that have not sent a frame for this long are dropped
+SESSION_IDLE_TIMEOUT_SECONDS = float(os.getenv("SESSION_IDLE_TIMEOUT_SECONDS", "600"))
+# Session rows the detector state arrays start with (they double when full)
+DETECTOR_STORE_INITIAL_ROWS = int(os.getenv("DETECTOR_STORE_INITIAL_ROWS", "256"))
+
+# Frame Timing Configuration
+# Interval assumed between frames when there is no earlier frame to measure from (~30 FPS)
+DEFAULT_FRAME_INTERVAL_MS = float(os.getenv("DEFAULT_FRAME_INTERVAL_MS", "33"))
+# Client capture timestamps further than this from zero are rejected (Date.now() is ~1.8e12 ms);
+# huge values overflow the smoother and predictor state
+CAPTURE_TIMESTAMP_MAX_MS = float(os.getenv("CAPTURE_TIMESTAMP_MAX_MS", "1e15"))
+# Time-based detector rules (plank holds, velocities) see at most this much time between two
+# frames of a session; longer gaps (pose lost, stream paused) count as this long
+DETECTOR_MAX_FRAME_INTERVAL_MS = float(os.getenv("DETECTOR_MAX_FRAME_INTERVAL_MS", "1000"))
+# Skip exercises whose landmarks are not visible (legs out of frame) instead of running them on guesses
+DETECTOR_VISIBILITY_GATING_ENABLED = os.getenv("DETECTOR_VISIBILITY_GATING_ENABLED", "true").lower() == "true"
+# A skipped exercise starts over from its first stage once its landmarks were hidden this long;
+# shorter dropouts (one low-visibility frame mid-rep) resume where they left off
+DETECTOR_HIDDEN_RESET_MS = float(os.getenv("DETECTOR_HIDDEN_RESET_MS", "1000"))
+
+# Landmark Prediction Configuration
+# Gaps between a session's frames (dropped, throttled) are filled with predicted landmarks so the
+# detectors don't miss a short "down" stage
+LANDMARK_PREDICTION_ENABLED = os.getenv("LANDMARK_PREDICTION_ENABLED", "true").lower() == "true"
+# Predicted frames are spaced like the session's own frames (their median spacing), at least this far apart
+LANDMARK_PREDICTION_MIN_INTERVAL_MS = float(os.getenv("LANDMARK_PREDICTION_MIN_INTERVAL_MS", "33"))
+# Longer gaps are not filled: the pose may have changed in ways a motion model can't follow
+LANDMARK_PREDICTION_MAX_GAP_MS = float(os.getenv("LANDMARK_PREDICTION_MAX_GAP_MS", "400"))
+
+# Landmark Smoothing Configuration
+# One-Euro filter on landmarks before the detectors (each exercise sets its minimum cutoff)
+LANDMARK_SMOOTHING_ENABLED = os.getenv("LANDMARK_SMOOTHING_ENABLED", "true").lower() == "true"
+# Cutoff added per unit/second of landmark speed, so moving landmarks lag less
+LANDMARK_SMOOTHING_BETA = float(os.getenv("LANDMARK_SMOOTHING_BETA", "8"))
+# Cutoff of the speed estimate itself
+LANDMARK_SMOOTHING_DERIVATIVE_CUTOFF_HZ = float(os.getenv("LANDMARK_SMOOTHING_DERIVATIVE_CUTOFF_HZ", "1"))
+
+# Landmark Recording Configuration
+# Directory session recordings are written to (replay them with `python -m benchmarks.replay`)
+LANDMARK_RECORDING_DIR = os.getenv("LANDMARK_RECORDING_DIR", "recordings")
+# Frames kept per recording (30 minutes at 30fps); later frames are not recorded
+LANDMARK_RECORDING_MAX_FRAMES = int(os.getenv("LANDMARK_RECORDING_MAX_FRAMES", "54000"))
+# Sessions recorded at once (a full recording buffers ~30 MB); further starts are refused
+LANDMARK_RECORDING_MAX_SESSIONS = int(os.getenv("LANDMARK_RECORDING_MAX_SESSIONS", "16"))
 
 # SurveyMonkey Configuration
 SURVEYMONKEY_TOKEN = os.getenv("SURVEYMONKEY_ACCESS_TOKEN", "")
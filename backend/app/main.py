@@ -3,8 +3,12 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from app.config import CORS_ORIGINS
-from app.routers import health, exercise, workout, survey, tts
+from app.routers import health, exercise, workout, survey, tts, metrics
 from app.utils.database import connect_to_mongo, close_mongo_connection
+from app.services.inference_executor import inference_executor
+from app.services.pose_detection import warm_up_pose_model
+from app.services.metrics import metrics_registry, REQUEST_BUCKETS_MS
+from app.utils.metrics import RequestMetricsMiddleware
 
 
 @asynccontextmanager
@@ -12,8 +16,10 @@ async def lifespan(app: FastAPI):
     """Lifespan context manager for startup and shutdown events"""
     # Startup
     await connect_to_mongo()
+    inference_executor.start(initializer=warm_up_pose_model)
     yield
     # Shutdown
+    inference_executor.shutdown()
     await close_mongo_connection()
 
 
@@ -32,6 +38,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Capture-Hints"],
+)
+
+# Latency histogram of every HTTP request, per route, exposed on /metrics
+app.add_middleware(
+    RequestMetricsMiddleware,
+    registry=metrics_registry,
+    name="hiit_http_request_duration_seconds",
+    buckets_ms=REQUEST_BUCKETS_MS,
 )
 
 # Include routers
@@ -40,3 +55,4 @@ app.include_router(exercise.router, prefix="/api", tags=["exercise"])
 app.include_router(workout.router, prefix="/api", tags=["workout"])
 app.include_router(survey.router, tags=["survey"])  # No prefix to match frontend expectations
 app.include_router(tts.router, prefix="/api", tags=["tts"])
+app.include_router(metrics.router, tags=["metrics"])  # No prefix: Prometheus scrapes /metrics
@@ -19,6 +19,10 @@ from .workout import (
     ExerciseMapping,
     WorkoutSegment,
     GeneratedWorkout,
+    ActiveExercisesRequest,
+    GroupModeRequest,
+    RecordingStartRequest,
+    RecordingStopRequest,
 )
 
 # Resolve forward references after all imports
@@ -46,4 +50,8 @@ __all__ = [
     "ExerciseMapping",
     "WorkoutSegment",
     "GeneratedWorkout",
+    "ActiveExercisesRequest",
+    "GroupModeRequest",
+    "RecordingStartRequest",
+    "RecordingStopRequest",
 ]
@@ -1,5 +1,5 @@
 """Workout-related Pydantic models"""
-from typing import List, Optional, Literal, TYPE_CHECKING
+from typing import Dict, List, Optional, Literal, TYPE_CHECKING
 from pydantic import BaseModel
 
 if TYPE_CHECKING:
@@ -41,6 +41,27 @@ class WorkoutSegment(BaseModel):
     is_break: bool = False  # True for short_answer questions
 
 
+class ActiveExercisesRequest(BaseModel):
+    """Exercises to detect for a session: exercise names / detector keys, or a workout segment"""
+    exercises: Optional[List[str]] = None
+    segment: Optional[WorkoutSegment] = None  # Uses every exercise mapped to the segment's options
+
+
+class GroupModeRequest(BaseModel):
+    """Count several people on one camera separately"""
+    max_people: int  # People searched for on each frame; 1 returns the session to one person
+
+
+class RecordingStartRequest(BaseModel):
+    """Start recording a session's landmarks"""
+    name: Optional[str] = None  # File name of the recording (default: session id + start time)
+
+
+class RecordingStopRequest(BaseModel):
+    """Stop recording a session's landmarks"""
+    ground_truth: Optional[Dict[str, int]] = None  # Labeled reps per exercise name / detector key
+
+
 class GeneratedWorkout(BaseModel):
     """Generated workout response model"""
     total_duration: int  # in minutes
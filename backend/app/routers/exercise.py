@@ -1,97 +1,471 @@
 """Exercise detection router"""
-from fastapi import APIRouter, UploadFile, File, HTTPException
-import numpy as np
-import cv2
-import mediapipe as mp
-from app.services.pose_detection import pose_detection_service
-from app.services.exercise_detection import exercise_detection_service
+import asyncio
+import json
+import time
+from typing import Optional
+from fastapi import (
+    APIRouter, UploadFile, File, HTTPException, Header, Query, Depends,
+    Request, Response, WebSocket, WebSocketDisconnect
+)
+from app.models.workout import (
+    ActiveExercisesRequest, GroupModeRequest, WorkoutSegment, RecordingStartRequest, RecordingStopRequest
+)
+from app.services.frame_pipeline import (
+    frame_pipeline, frame_timestamp, check_capture_timestamp, InvalidFrameError, LatestFrameSlot,
+    TRACKED_EXERCISES
+)
+from app.services.inference_executor import inference_executor, InferenceQueueFullError
+from app.services.landmark_recorder import landmark_recorder, RecordingLimitError
+from app.services.pose_detection import inference_scheduler, model_tier_controller, get_pose_stats
+from app.services.session_registry import session_registry, DEFAULT_SESSION_ID
+from app.utils.landmarks import parse_landmark_bytes, parse_landmark_json
+from app.utils.landmark_encoding import (
+    LandmarkEncoder, RESPONSE_FORMATS, STREAM_ONLY_FORMATS, BINARY_MEDIA_TYPE, parse_response_format
+)
 
 router = APIRouter()
 
+MAX_SESSION_ID_LENGTH = 128
+CAPTURE_HINTS_HEADER = "X-Capture-Hints"
+EXERCISES_HEADER = "X-Exercises"
+
+
+def get_session_id(
+    x_session_id: Optional[str] = Header(None),
+    session_id: Optional[str] = Query(None)
+) -> str:
+    """Resolve the session id from the `session_id` query param or `X-Session-Id` header"""
+    resolved = session_id or x_session_id or DEFAULT_SESSION_ID
+    if len(resolved) > MAX_SESSION_ID_LENGTH:
+        raise HTTPException(status_code=400, detail="Session id is too long")
+    return resolved
+
+
+def get_response_format(
+    accept: Optional[str] = Header(None),
+    response_format: Optional[str] = Query(None, alias="format")
+) -> str:
+    """
+    Resolve the response format from the `format` query param or the Accept
+    header (`application/x-landmarks-<format>`); JSON unless asked otherwise
+    """
+    if response_format is not None:
+        resolved = parse_response_format(response_format)
+        if resolved is None:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown format, expected one of: {', '.join(RESPONSE_FORMATS)}"
+            )
+        return resolved
+    return parse_response_format(accept) or "json"
+
+
+def get_capture_timestamp(
+    x_capture_timestamp: Optional[float] = Header(None),
+    timestamp_ms: Optional[float] = Query(None)
+) -> Optional[float]:
+    """
+    Resolve the client's capture time of a frame in milliseconds (any clock,
+    e.g. performance.now()) from the `timestamp_ms` query param or the
+    `X-Capture-Timestamp` header; None means the server's receive time is used
+    """
+    resolved = timestamp_ms if timestamp_ms is not None else x_capture_timestamp
+    if resolved is None:
+        return None
+    try:
+        return check_capture_timestamp(resolved)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 
 @router.post("/process-frame")
-async def process_frame(file: UploadFile = File(...)):
-    """Process a video frame and detect exercises"""
+async def process_frame(
+    file: UploadFile = File(...),
+    session_id: str = Depends(get_session_id),
+    response_format: str = Depends(get_response_format),
+    timestamp_ms: Optional[float] = Depends(get_capture_timestamp)
+):
+    """
+    Process a video frame and detect exercises.
+    Binary formats (float32, int16) return a packed result; see
+    app/utils/landmark_encoding.py for the layout. int16-delta is only
+    served on the WebSocket stream, where responses arrive in order. Time-based rules (plank
+    holds, velocities) use the frame's capture timestamp when the client sends
+    one, so counts don't depend on the frame rate. The recommended capture
+    rate / width / JPEG quality come back as `capture_hints` in JSON results
+    and as an X-Capture-Hints JSON header with binary formats, whose
+    X-Exercises header names the packed counters in order.
+    Group sessions (PUT /session/group) return JSON with a result per person.
+    """
+    if response_format in STREAM_ONLY_FORMATS:
+        raise HTTPException(
+            status_code=400, detail=f"The {response_format} format is only available on WS /api/ws/frames"
+        )
+    session = session_registry.get(session_id)
+    if session.group_tracker is not None and response_format != "json":
+        raise HTTPException(status_code=400, detail="Group sessions only return JSON results")
     try:
+        timestamp_ms = frame_timestamp(timestamp_ms)
+        
         # Read image data
+        started = time.perf_counter()
         contents = await file.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        # Use faster decode flags
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
-        
-        if img is None:
-            raise HTTPException(status_code=400, detail="Invalid image data")
-        
-        # Resize image early for faster processing (before color conversion)
-        height, width = img.shape[:2]
-        if width > 640:
-            scale = 640 / width
-            new_width = 640
-            new_height = int(height * scale)
-            img = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
-        
-        # Convert BGR to RGB and ensure contiguous array
-        rgb_image = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        rgb_image = np.ascontiguousarray(rgb_image)
-        
-        # Create MediaPipe Image
-        mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_image)
-        
-        # Process with MediaPipe Pose Landmarker (VIDEO mode for better performance)
-        detection_result = pose_detection_service.detect_pose(mp_image)
-        
-        # Only track the 4 hardcoded exercises: push_up, squat, jumping_jack, arm_circle
-        four_exercises = ["push_up", "squat", "jumping_jack", "arm_circle"]
-        
-        if not detection_result.pose_landmarks or len(detection_result.pose_landmarks) == 0:
-            all_counters = exercise_detection_service.get_counters()
-            filtered_counters = {key: all_counters.get(key, 0) for key in four_exercises}
-            return {
-                "detected": False,
-                "exercises": filtered_counters,
-                "landmarks": None
-            }
+        frame_pipeline.stage_ms["upload"].observe((time.perf_counter() - started) * 1000)
+        if response_format == "json":
+            result = await frame_pipeline.process_frame(session, contents, timestamp_ms)
+            return Response(content=frame_pipeline.encode_json(result), media_type="application/json")
         
-        # Get first pose landmarks
-        landmarks = detection_result.pose_landmarks[0]
-        
-        # Detect exercises (still detects all, but we'll filter the response)
-        current_detections = exercise_detection_service.detect_all_exercises(landmarks)
-        
-        # Get all counters and filter to only the 4 we care about
-        all_counters = exercise_detection_service.get_counters()
-        filtered_counters = {key: all_counters.get(key, 0) for key in four_exercises}
-        
-        # Convert landmarks to list for JSON serialization
-        landmarks_list = [
-            {"x": lm.x, "y": lm.y, "z": lm.z, "visibility": lm.visibility}
-            for lm in landmarks
-        ]
-        
-        # Filter current_detections to only the 4 exercises
-        filtered_current_detections = {key: current_detections.get(key, False) for key in four_exercises}
-        
-        return {
-            "detected": True,
-            "exercises": filtered_counters,
-            "landmarks": landmarks_list,
-            "current_detections": filtered_current_detections
-        }
+        encoder = session.landmark_encoder
+        if encoder is None or encoder.response_format != response_format:
+            encoder = session.landmark_encoder = LandmarkEncoder(response_format)
+        body = await frame_pipeline.process_frame_packed(session, contents, encoder, timestamp_ms=timestamp_ms)
+        return Response(content=body, media_type=f"{BINARY_MEDIA_TYPE}-{response_format}",
+                        headers={CAPTURE_HINTS_HEADER: json.dumps(session.capture_hints),
+                                 EXERCISES_HEADER: ",".join(encoder.exercises)})
     
+    except InvalidFrameError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except InferenceQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/process-landmarks")
+async def process_landmarks(
+    request: Request,
+    session_id: str = Depends(get_session_id),
+    timestamp_ms: Optional[float] = Depends(get_capture_timestamp)
+):
+    """
+    Run exercise detection on landmarks computed by the client, skipping image
+    decoding and pose inference. The body is either a packed little-endian
+    float32 (33, 4) array (`application/octet-stream`, empty body = no pose) or
+    JSON `{"landmarks": [[x, y, z, visibility], ...]}` (`null` = no pose).
+    """
+    session = session_registry.get(session_id)
+    timestamp_ms = frame_timestamp(timestamp_ms)
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith("application/octet-stream"):
+            landmarks = parse_landmark_bytes(body)
+        else:
+            payload = json.loads(body)
+            if not isinstance(payload, dict):
+                raise ValueError("Expected a JSON object with a \"landmarks\" field")
+            landmarks = parse_landmark_json(payload.get("landmarks"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return await frame_pipeline.process_landmarks(session, landmarks, include_landmarks=False,
+                                                  timestamp_ms=timestamp_ms)
+
+
+@router.websocket("/ws/frames")
+async def frames_websocket(
+    websocket: WebSocket,
+    session_id: str = Depends(get_session_id),
+    response_format: str = Depends(get_response_format)
+):
+    """
+    Stream binary JPEG frames over one long-lived connection.
+    Each processed frame is answered with a JSON result (counters, landmarks and
+    rep events), or a binary message when a binary `format` was requested.
+    If a newer frame arrives before the previous one was processed, the older
+    frame is dropped. Frames are timed by when they arrive. Results carry the
+    recommended `capture_hints`; with a binary format they are sent as a
+    {"type": "capture_hints", ...} message whenever they change. Text messages
+    are JSON control commands: {"type": "reset"} and {"type": "set_exercises",
+    "exercises": [...]}. Group sessions answer with a result per person and
+    need the JSON format.
+    """
+    await websocket.accept()
+    slot = LatestFrameSlot()
+    encoder = LandmarkEncoder(response_format) if response_format != "json" else None
+    processor = asyncio.create_task(_stream_frame_results(websocket, session_id, slot, encoder))
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes") is not None:
+                slot.put((message["bytes"], frame_timestamp()))
+            elif message.get("text") is not None:
+                await _handle_control_message(websocket, session_id, message["text"])
+    except WebSocketDisconnect:
+        pass
+    finally:
+        slot.close()
+        processor.cancel()
+        try:
+            await processor
+        except (asyncio.CancelledError, WebSocketDisconnect, RuntimeError):
+            pass
+
+
+async def _stream_frame_results(
+    websocket: WebSocket, session_id: str, slot: LatestFrameSlot, encoder: Optional[LandmarkEncoder]
+):
+    """Process the newest pending frame of a connection and push back the result"""
+    sent_hints = None
+    sent_exercises = None
+    while True:
+        item = await slot.get()
+        if item is None:
+            return
+        frame_id, (contents, timestamp_ms) = item
+        session = session_registry.get(session_id)
+        if encoder is not None and session.group_tracker is not None:
+            await websocket.send_json({"type": "error", "frame_id": frame_id,
+                                       "detail": "Group sessions only return JSON results"})
+            continue
+        try:
+            if encoder is not None:
+                body = await frame_pipeline.process_frame_packed(
+                    session, contents, encoder, frame_id, slot.dropped, timestamp_ms
+                )
+            else:
+                result = await frame_pipeline.process_frame(session, contents, timestamp_ms)
+        except InferenceQueueFullError:
+            # Server is saturated: treat the frame as dropped and wait for the next one
+            slot.dropped += 1
+            continue
+        except Exception as e:
+            await websocket.send_json({"type": "error", "frame_id": frame_id, "detail": str(e)})
+            continue
+        
+        if encoder is not None:
+            if session.capture_hints != sent_hints:
+                sent_hints = session.capture_hints
+                await websocket.send_json({"type": "capture_hints", **sent_hints})
+            if encoder.exercises != sent_exercises:
+                sent_exercises = encoder.exercises
+                await websocket.send_json({"type": "exercises", "exercises": sent_exercises})
+            await websocket.send_bytes(body)
+        else:
+            await websocket.send_text(frame_pipeline.encode_json(_stream_result(result, frame_id, slot.dropped)))
+
+
+@router.websocket("/ws/landmarks")
+async def landmarks_websocket(websocket: WebSocket, session_id: str = Depends(get_session_id)):
+    """
+    Stream client-computed landmarks over one long-lived connection.
+    Binary messages are packed little-endian float32 (33, 4) arrays (empty = no
+    pose); text messages are JSON, either `{"landmarks": [...]}` (with an
+    optional capture `"timestamp_ms"`; frames are otherwise timed by when they
+    arrive) or a control command such as {"type": "reset"} or {"type": "set_exercises"}. Detection costs microseconds, so every
+    message is processed in order and answered with a JSON result.
+    """
+    await websocket.accept()
+    frame_id = 0
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            
+            timestamp_ms = frame_timestamp()
+            try:
+                if message.get("bytes") is not None:
+                    landmarks = parse_landmark_bytes(message["bytes"])
+                elif message.get("text") is not None:
+                    payload = json.loads(message["text"])
+                    if not isinstance(payload, dict) or "landmarks" not in payload:
+                        await _handle_control_message(websocket, session_id, message["text"])
+                        continue
+                    landmarks = parse_landmark_json(payload["landmarks"])
+                    if payload.get("timestamp_ms") is not None:
+                        timestamp_ms = _parse_timestamp(payload["timestamp_ms"])
+                else:
+                    continue
+            except ValueError as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                continue
+            
+            frame_id += 1
+            session = session_registry.get(session_id)
+            result = await frame_pipeline.process_landmarks(
+                session, landmarks, include_landmarks=False, timestamp_ms=timestamp_ms
+            )
+            await websocket.send_json(_stream_result(result, frame_id, 0))
+    except WebSocketDisconnect:
+        pass
+
+
+def _parse_timestamp(value) -> float:
+    """Validate a capture timestamp sent in a JSON message"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError("\"timestamp_ms\" must be a number")
+    return check_capture_timestamp(value)
+
+
+def _stream_result(result: dict, frame_id: int, dropped_frames: int) -> dict:
+    """Add streaming metadata (frame id, drop count, rep events) to a detection result"""
+    current_detections = result.get("current_detections") or {}
+    result["type"] = "result"
+    result["frame_id"] = frame_id
+    result["dropped_frames"] = dropped_frames
+    result["rep_events"] = [name for name, completed in current_detections.items() if completed]
+    return result
+
+
+async def _handle_control_message(websocket: WebSocket, session_id: str, text: str):
+    """Handle a JSON control message sent on the frame stream"""
+    try:
+        command = json.loads(text)
+    except ValueError:
+        await websocket.send_json({"type": "error", "detail": "Control messages must be JSON"})
+        return
+    
+    if not isinstance(command, dict):
+        await websocket.send_json({"type": "error", "detail": "Control messages must be JSON objects"})
+        return
+    
+    if command.get("type") == "reset":
+        session = session_registry.get(session_id)
+        frame_pipeline.reset_counters(session)
+        await websocket.send_json({"type": "reset", "exercises": frame_pipeline.get_counters(session)})
+    elif command.get("type") == "set_exercises":
+        session = session_registry.get(session_id)
+        exercises = command.get("exercises")
+        if exercises is not None and not (
+            isinstance(exercises, list) and all(isinstance(name, str) for name in exercises)
+        ):
+            await websocket.send_json({"type": "error", "detail": "\"exercises\" must be a list of names"})
+            return
+        try:
+            active = frame_pipeline.set_active_exercises(session, exercises)
+        except ValueError as e:
+            await websocket.send_json({"type": "error", "detail": str(e)})
+            return
+        await websocket.send_json({"type": "set_exercises", "active_exercises": active})
+    else:
+        await websocket.send_json({"type": "error", "detail": f"Unknown control message: {command.get('type')}"})
+
+
 @router.post("/reset-counters")
-async def reset_counters():
-    """Reset all exercise counters"""
-    exercise_detection_service.reset_counters()
+async def reset_counters(session_id: str = Depends(get_session_id)):
+    """Reset the exercise counters of one session (and the people of a group session)"""
+    session = session_registry.peek(session_id)
+    if session is not None:
+        frame_pipeline.reset_counters(session)
     return {"message": "Counters reset"}
 
 
 @router.get("/counters")
-async def get_counters():
-    """Get current exercise counters (only the 4 hardcoded exercises)"""
-    all_counters = exercise_detection_service.get_counters()
-    four_exercises = ["push_up", "squat", "jumping_jack", "arm_circle"]
-    return {key: all_counters.get(key, 0) for key in four_exercises}
+async def get_counters(session_id: str = Depends(get_session_id)):
+    """
+    Get current exercise counters of one session (the 4 hardcoded exercises
+    plus any other active ones); group sessions also list each person's counters
+    """
+    session = session_registry.peek(session_id)
+    if session is None:
+        return {key: 0 for key in TRACKED_EXERCISES}
+    counters = frame_pipeline.get_counters(session)
+    if session.group_tracker is not None:
+        counters.update(frame_pipeline.get_group_counters(session))
+    return counters
+
+
+@router.put("/session/exercises")
+async def set_active_exercises(request: ActiveExercisesRequest, session_id: str = Depends(get_session_id)):
+    """
+    Choose which exercise detectors run on a session's frames, e.g. the
+    exercises mapped to the current survey question's options. An empty
+    request restores the default tracked exercises. Can change mid-session.
+    """
+    names = list(request.exercises or [])
+    if request.segment is not None:
+        names.extend(_segment_exercise_names(request.segment))
+    session = session_registry.get(session_id)
+    try:
+        active = frame_pipeline.set_active_exercises(session, names)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"active_exercises": active}
+
+
+@router.put("/session/group")
+async def set_group_mode(request: GroupModeRequest, session_id: str = Depends(get_session_id)):
+    """
+    Count several people in front of one camera separately: each frame runs
+    one inference for up to `max_people` poses, people keep a track id across
+    frames and every track has its own counters. 1 returns to one person.
+    Sessions being recorded can't switch to several people (409).
+    """
+    session = session_registry.get(session_id)
+    try:
+        max_people = frame_pipeline.set_group_mode(session, request.max_people)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"max_people": max_people}
+
+
+def _segment_exercise_names(segment: WorkoutSegment) -> list:
+    """Names of the exercises a workout segment can ask for"""
+    names = [mapping.exercise.name for mapping in segment.option_exercise_mapping or []]
+    names.extend(exercise.name for exercise in segment.exercises)
+    return names
+
+
+@router.post("/session/recording")
+async def start_recording(request: RecordingStartRequest, session_id: str = Depends(get_session_id)):
+    """
+    Start recording the landmarks of a session's frames (restarts a running
+    recording); group sessions can't be recorded (409)
+    """
+    session = session_registry.get(session_id)
+    try:
+        name = frame_pipeline.start_recording(session, request.name)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except RecordingLimitError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"recording": name}
+
+
+@router.post("/session/recording/stop")
+async def stop_recording(request: RecordingStopRequest, session_id: str = Depends(get_session_id)):
+    """
+    Stop recording a session and write the recording to disk, labeled with
+    the true rep counts when given (e.g. {"ground_truth": {"Squats": 10}})
+    """
+    session = session_registry.peek(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    try:
+        recording = frame_pipeline.stop_recording(session, request.ground_truth)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if recording is None:
+        raise HTTPException(status_code=404, detail="Session is not being recorded")
+    # Compressing a long recording takes a while, keep it off the event loop
+    path = await asyncio.to_thread(landmark_recorder.save, recording)
+    return {"recording": recording.meta["name"], "path": path, "frames": len(recording.present)}
+
+
+@router.delete("/session")
+async def end_session(session_id: str = Depends(get_session_id)):
+    """End a session and release its detection state"""
+    removed = session_registry.remove(session_id)
+    return {"message": "Session ended" if removed else "Session not found"}
+
+
+@router.get("/inference/stats")
+async def get_inference_stats():
+    """Get inference statistics (queue depth, rejections, batching histograms, landmarker pools)"""
+    stats = inference_executor.stats()
+    stats["scheduler"] = inference_scheduler.stats()
+    stats["model_tiers"] = model_tier_controller.stats()
+    stats["frames"] = frame_pipeline.stats()
+    stats["pose_pools"] = await inference_executor.broadcast(get_pose_stats)
+    return stats
+
+
+@router.get("/sessions/stats")
+async def get_session_stats():
+    """Get session registry and landmark recorder statistics"""
+    session_registry.evict_idle()
+    stats = session_registry.stats()
+    stats["recordings"] = landmark_recorder.stats()
+    return stats
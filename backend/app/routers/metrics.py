@@ -0,0 +1,12 @@
+"""Prometheus metrics router"""
+from fastapi import APIRouter, Response
+from app.services.metrics import metrics_registry
+from app.utils.metrics import PROMETHEUS_CONTENT_TYPE
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+def get_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    return Response(content=metrics_registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,118 @@
+"""Capture rate, resolution and JPEG quality recommended to each streaming client"""
+import time
+from app.config import (
+    FRAME_TARGET_WIDTH, CAPTURE_MIN_FPS, CAPTURE_MAX_FPS, CAPTURE_DEFAULT_FPS, CAPTURE_MIN_WIDTH,
+    CAPTURE_JPEG_QUALITY, CAPTURE_MIN_JPEG_QUALITY, CAPTURE_TARGET_FRAME_KB
+)
+from app.services.exercise_detection import exercise_engine
+from app.services.inference_executor import inference_executor
+
+# Capture advisor tuning
+WORKER_SMOOTHING = 0.05  # EWMA weight of the newest frame's worker time (shared by all sessions)
+STREAMING_WINDOW_SECONDS = 2.0  # sessions that sent a frame within this window share the capacity
+TARGET_UTILIZATION = 0.8  # share of the workers' measured capacity handed out to sessions
+BACKLOG_SLOWDOWN = 0.5  # capacity cut while frames wait for a free worker
+QUALITY_STEP = 0.05  # JPEG quality change per frame above / well below the target size
+
+
+class CaptureAdvisor:
+    """
+    Recommends how each client should capture frames:
+    - fps: the rate the session's active exercises need to be followed (their
+      `capture_fps`: arm circles more than planks; `default_fps` while the
+      session has not chosen any), capped by the session's
+      share of what the workers can process at the measured worker time per
+      frame (of frames that ran inference), and cut while frames queue for a worker
+    - width: the width frames are decoded to anyway, or CAPTURE_MIN_WIDTH
+      while the capacity cap applies, so uploads and decodes get cheaper
+    - jpeg_quality: stepped down while the session's frames are larger than
+      CAPTURE_TARGET_FRAME_KB and back up once they are well below it
+    Hints are kept on the session (`capture_hints`) and sent with results.
+    """
+
+    def __init__(self, engine=exercise_engine, executor=inference_executor, target_width=FRAME_TARGET_WIDTH,
+                 min_fps=CAPTURE_MIN_FPS, max_fps=CAPTURE_MAX_FPS, default_fps=CAPTURE_DEFAULT_FPS,
+                 min_width=CAPTURE_MIN_WIDTH,
+                 jpeg_quality=CAPTURE_JPEG_QUALITY, min_jpeg_quality=CAPTURE_MIN_JPEG_QUALITY,
+                 target_frame_kb=CAPTURE_TARGET_FRAME_KB):
+        self.min_fps = min_fps
+        self.max_fps = max_fps
+        self.default_fps = default_fps
+        self.target_width = target_width
+        self.min_width = min(min_width, target_width)
+        self.jpeg_quality = jpeg_quality
+        self.min_jpeg_quality = min(min_jpeg_quality, jpeg_quality)
+        self.target_frame_bytes = target_frame_kb * 1024
+        self.worker_ms = None
+        self.streaming_sessions = 0
+        self._engine = engine
+        self._executor = executor
+        self._exercise_fps = {}
+        self._window_sessions = set()
+        self._window_started = time.monotonic()
+
+    def exercise_fps(self, exercises):
+        """Frame rate the fastest of a tuple of detector keys needs (cached per tuple; `default_fps` for none)"""
+        fps = self._exercise_fps.get(exercises)
+        if fps is None:
+            definitions = self._engine.definitions
+            fps = max([definitions[self._engine.index[name]].capture_fps for name in exercises] or [self.default_fps])
+            self._exercise_fps[exercises] = fps
+        return fps
+
+    def capacity_fps(self):
+        """Frames per second all workers can take at the measured worker time, with headroom"""
+        if not self.worker_ms:
+            return self.max_fps * max(1, self.streaming_sessions)
+        capacity = self._executor.workers * 1000 / self.worker_ms * TARGET_UTILIZATION
+        if self._executor.queue_depth > 0:
+            capacity *= BACKLOG_SLOWDOWN
+        return capacity
+
+    def record(self, session, exercises, frame_bytes, worker_ms=None):
+        """
+        Record a processed camera frame of a session and update its hints:
+        `exercises` are the detector keys the session chose (empty for none),
+        `worker_ms` the frame's total worker time, None when it skipped
+        inference (reused landmarks), so cheap frames don't lower the measured cost
+        """
+        now = time.monotonic()
+        if now - self._window_started >= STREAMING_WINDOW_SECONDS:
+            self.streaming_sessions = len(self._window_sessions)
+            self._window_sessions = set()
+            self._window_started = now
+        self._window_sessions.add(session.session_id)
+        if worker_ms is not None:
+            if self.worker_ms is None:
+                self.worker_ms = worker_ms
+            else:
+                self.worker_ms += WORKER_SMOOTHING * (worker_ms - self.worker_ms)
+
+        wanted = self.exercise_fps(tuple(exercises))
+        share = self.capacity_fps() / max(1, self.streaming_sessions, len(self._window_sessions))
+        fps = min(self.max_fps, max(self.min_fps, min(wanted, share)))
+
+        quality = session.jpeg_quality or self.jpeg_quality
+        if frame_bytes > self.target_frame_bytes:
+            quality = max(self.min_jpeg_quality, quality - QUALITY_STEP)
+        elif frame_bytes < self.target_frame_bytes / 2:
+            quality = min(self.jpeg_quality, quality + QUALITY_STEP)
+        session.jpeg_quality = quality
+
+        session.capture_hints = {
+            "fps": round(fps),
+            "width": self.min_width if share < wanted else self.target_width,
+            "jpeg_quality": round(quality, 2),
+        }
+
+    def stats(self):
+        """Get advisor statistics"""
+        return {
+            "worker_ms": self.worker_ms,
+            "capacity_fps": self.capacity_fps(),
+            "streaming_sessions": self.streaming_sessions,
+        }
+
+
+# Singleton instance
+capture_advisor = CaptureAdvisor()
@@ -0,0 +1,353 @@
+"""Struct-of-arrays exercise detector state for every live session"""
+import asyncio
+import math
+import threading
+import time
+import numpy as np
+from app.config import (
+    DETECTOR_STORE_INITIAL_ROWS, DEFAULT_FRAME_INTERVAL_MS, DETECTOR_MAX_FRAME_INTERVAL_MS,
+    DETECTOR_VISIBILITY_GATING_ENABLED, DETECTOR_HIDDEN_RESET_MS
+)
+from app.utils.kinematics import compute_features
+from app.utils.metrics import Histogram
+
+STEP_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 50)
+
+# Frames with the same or an earlier timestamp than the previous one count as this far apart
+MIN_FRAME_INTERVAL_MS = 1.0
+
+
+class DetectorStore:
+    """
+    Exercise detector state of all sessions in a few NumPy arrays, one row per
+    session: stage codes (int8), rep counts (int32), whether the landmarks
+    of the last frame were visible enough to run it (bool) and for how long
+    they have been hidden (float32 ms) per exercise, the
+    registers of every exercise packed into float64 columns, and the capture
+    timestamp of the session's previous frame. A session costs about a
+    hundred bytes and any set of sessions - each with its own active
+    exercises - is advanced by one exercise engine step; a lone session's
+    frame skips the array bookkeeping (_step_one).
+
+    Rows are handed out by allocate() and recycled by release(); the arrays
+    double in size when they run out of free rows.
+    """
+
+    def __init__(self, engine, capacity=DETECTOR_STORE_INITIAL_ROWS, hidden_reset_ms=DETECTOR_HIDDEN_RESET_MS):
+        self.engine = engine
+        self.hidden_reset_ms = hidden_reset_ms
+        exercise_count = len(engine.names)
+        # Packed column of each (exercise, register slot); unused slots share the last, scratch column
+        offsets = np.cumsum([0] + [len(names) for names in engine.register_names])
+        self.register_width = int(offsets[-1]) + 1
+        self.register_columns = np.full((exercise_count, engine.register_count), self.register_width - 1, np.intp)
+        self.initial_registers = np.zeros(self.register_width)
+        for exercise_id, names in enumerate(engine.register_names):
+            columns = np.arange(offsets[exercise_id], offsets[exercise_id + 1])
+            self.register_columns[exercise_id, :len(names)] = columns
+            self.initial_registers[columns] = engine.initial_registers[exercise_id, :len(names)]
+        # The same as lists, for _step_one
+        self._register_lists = self.register_columns.tolist()
+        self._initial_register_list = self.initial_registers.tolist()
+
+        capacity = max(1, capacity)
+        self.stage = np.zeros((capacity, exercise_count), dtype=np.int8)
+        self.count = np.zeros((capacity, exercise_count), dtype=np.int32)
+        self.visible = np.ones((capacity, exercise_count), dtype=bool)
+        self.hidden_ms = np.zeros((capacity, exercise_count), dtype=np.float32)
+        self.registers = np.zeros((capacity, self.register_width))
+        # NaN until a row has seen a timestamped frame
+        self.last_timestamp_ms = np.full(capacity, np.nan)
+        self._free = list(range(capacity - 1, -1, -1))
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self):
+        return len(self.stage)
+
+    @property
+    def bytes_per_session(self):
+        """Array bytes held per session row"""
+        return self.stage.itemsize * self.stage.shape[1] + self.count.itemsize * self.count.shape[1] \
+            + self.visible.itemsize * self.visible.shape[1] + self.hidden_ms.itemsize * self.hidden_ms.shape[1] \
+            + self.registers.itemsize * self.register_width \
+            + self.last_timestamp_ms.itemsize
+
+    def allocate(self):
+        """Take a free row, initialized to the first stage of every exercise with zero counts"""
+        with self._lock:
+            if not self._free:
+                self._grow()
+            row = self._free.pop()
+            self.stage[row] = 0
+            self.count[row] = 0
+            self.visible[row] = True
+            self.hidden_ms[row] = 0
+            self.registers[row] = self.initial_registers
+            self.last_timestamp_ms[row] = np.nan
+            return row
+
+    def release(self, row):
+        """Give a row back for reuse"""
+        with self._lock:
+            self._free.append(row)
+
+    def _grow(self):
+        """Double the arrays (caller holds the lock)"""
+        old = self.capacity
+        self.stage = np.concatenate([self.stage, np.zeros_like(self.stage)])
+        self.count = np.concatenate([self.count, np.zeros_like(self.count)])
+        self.visible = np.concatenate([self.visible, np.ones_like(self.visible)])
+        self.hidden_ms = np.concatenate([self.hidden_ms, np.zeros_like(self.hidden_ms)])
+        self.registers = np.concatenate([self.registers, np.zeros_like(self.registers)])
+        self.last_timestamp_ms = np.concatenate([self.last_timestamp_ms, np.full(old, np.nan)])
+        self._free.extend(range(2 * old - 1, old - 1, -1))
+
+    def reset_counts(self, row):
+        """Zero a row's rep counts"""
+        with self._lock:
+            self.count[row] = 0
+
+    def reset_stage(self, row, exercise_id):
+        """Reset one exercise of a row to its first stage and initial registers, keeping the count"""
+        with self._lock:
+            self.stage[row, exercise_id] = 0
+            columns = self.register_columns[exercise_id]
+            self.registers[row, columns] = self.initial_registers[columns]
+
+    def counts(self, row):
+        """A row's rep counts as a list, in engine exercise order"""
+        return self.count[row].tolist()
+
+    def visibility(self, row):
+        """Whether each exercise of a row could run on its last frame, as a list in engine exercise order"""
+        return self.visible[row].tolist()
+
+    def elapsed_ms(self, rows, timestamps_ms):
+        """
+        Time since each row's previous frame, recording `timestamps_ms` as the
+        new previous frames (caller holds the lock). The first frame of a row,
+        or one without a timestamp (NaN), counts as DEFAULT_FRAME_INTERVAL_MS
+        and a frame without one leaves the row's previous timestamp as it was;
+        gaps are capped at DETECTOR_MAX_FRAME_INTERVAL_MS.
+        """
+        previous_ms = self.last_timestamp_ms[rows]
+        elapsed = np.clip(timestamps_ms - previous_ms, MIN_FRAME_INTERVAL_MS, DETECTOR_MAX_FRAME_INTERVAL_MS)
+        self.last_timestamp_ms[rows] = np.where(np.isnan(timestamps_ms), previous_ms, timestamps_ms)
+        return np.where(np.isnan(elapsed), DEFAULT_FRAME_INTERVAL_MS, elapsed)
+
+    def step(self, rows, exercise_ids, features, timestamps_ms=None, visibility=None):
+        """
+        Advance sessions by one frame each. `rows` are distinct store rows,
+        `exercise_ids` one int array of active exercise ids per row,
+        `features` an (n, NUM_FEATURES) array (or, for one row, a list holding
+        its feature list) and `timestamps_ms` the capture
+        time of each row's frame (None: frames are DEFAULT_FRAME_INTERVAL_MS
+        apart). With `visibility`, the (n, 33) landmark visibilities of the
+        frames, exercises whose landmarks are not visible enough are skipped,
+        so occluded joints can't complete phantom reps; once hidden for
+        `hidden_reset_ms` they start over from their first stage (their count
+        is kept). Returns, per row, a bool array of the exercises that
+        completed a rep.
+        """
+        if len(rows) == 1:
+            timestamp_ms = np.nan if timestamps_ms is None else timestamps_ms[0]
+            return [self._step_one(rows[0], exercise_ids[0], features[0], timestamp_ms,
+                                   None if visibility is None else visibility[0])]
+        lengths = [len(ids) for ids in exercise_ids]
+        session = np.repeat(np.arange(len(rows)), lengths)
+        rows = np.asarray(rows, dtype=np.intp)
+        row = rows[session]
+        exercise = np.concatenate(exercise_ids)
+        completed = np.zeros(len(exercise), dtype=bool)
+        run = slice(None)
+        if visibility is not None and DETECTOR_VISIBILITY_GATING_ENABLED:
+            run = self.engine.visible(exercise, np.asarray(visibility)[session])
+        if timestamps_ms is None:
+            timestamps_ms = np.full(len(rows), np.nan)
+        with self._lock:
+            elapsed = self.elapsed_ms(rows, np.asarray(timestamps_ms, dtype=np.float64))
+            if not isinstance(run, slice):
+                self.visible[row, exercise] = run
+                hidden_ms = np.where(run, 0, self.hidden_ms[row, exercise] + elapsed[session])
+                self.hidden_ms[row, exercise] = hidden_ms
+                if not run.all():
+                    expired = ~run & (hidden_ms >= self.hidden_reset_ms)
+                    hidden_row, hidden_exercise = row[expired], exercise[expired]
+                    hidden_columns = self.register_columns[hidden_exercise]
+                    self.stage[hidden_row, hidden_exercise] = 0
+                    self.registers[hidden_row[:, None], hidden_columns] = self.initial_registers[hidden_columns]
+                    session, row, exercise = session[run], row[run], exercise[run]
+            if len(exercise):
+                columns = self.register_columns[exercise]
+                stage, count, registers, completed[run] = self.engine.step(
+                    exercise, self.stage[row, exercise], self.count[row, exercise],
+                    self.registers[row[:, None], columns], features[session], elapsed[session],
+                )
+                self.stage[row, exercise] = stage
+                self.count[row, exercise] = count
+                self.registers[row[:, None], columns] = registers
+        return np.split(completed, np.cumsum(lengths)[:-1])
+
+    def _step_one(self, row, exercise_ids, features, timestamp_ms, visibility):
+        """
+        step() of a single row, in Python scalars and engine.step_row calls:
+        for one session NumPy's per-call overhead costs more than the work, so
+        the row is read and written back whole instead of by fancy indexing.
+        `features` and `visibility` may be lists or arrays.
+        """
+        exercise_list = exercise_ids.tolist()
+        run = None
+        if visibility is not None and DETECTOR_VISIBILITY_GATING_ENABLED:
+            if isinstance(visibility, np.ndarray):
+                visibility = visibility.tolist()
+            run = [self.engine.visible_row(exercise_id, visibility) for exercise_id in exercise_list]
+        if isinstance(features, np.ndarray):
+            features = features.tolist()
+        completed = [False] * len(exercise_list)
+        with self._lock:
+            timestamp_ms = float(timestamp_ms)
+            elapsed = timestamp_ms - float(self.last_timestamp_ms[row])
+            if not math.isnan(timestamp_ms):
+                self.last_timestamp_ms[row] = timestamp_ms
+            if math.isnan(elapsed):
+                elapsed = DEFAULT_FRAME_INTERVAL_MS
+            else:
+                elapsed = min(max(elapsed, MIN_FRAME_INTERVAL_MS), DETECTOR_MAX_FRAME_INTERVAL_MS)
+            stages = self.stage[row].tolist()
+            registers = self.registers[row].tolist()
+            if run is not None:
+                visible = self.visible[row].tolist()
+                hidden_ms = self.hidden_ms[row].tolist()
+            for index, exercise_id in enumerate(exercise_list):
+                columns = self._register_lists[exercise_id]
+                if run is not None:
+                    visible[exercise_id] = run[index]
+                    if not run[index]:
+                        hidden_ms[exercise_id] += elapsed
+                        if hidden_ms[exercise_id] >= self.hidden_reset_ms:
+                            stages[exercise_id] = 0
+                            for column in columns:
+                                registers[column] = self._initial_register_list[column]
+                        continue
+                    hidden_ms[exercise_id] = 0.0
+                stages[exercise_id], increment, row_registers = self.engine.step_row(
+                    exercise_id, stages[exercise_id], [registers[column] for column in columns], features, elapsed
+                )
+                for column, value in zip(columns, row_registers):
+                    registers[column] = value
+                if increment:
+                    completed[index] = True
+                    self.count[row, exercise_id] += 1
+            if run is not None:
+                self.visible[row] = visible
+                self.hidden_ms[row] = hidden_ms
+            self.stage[row] = stages
+            self.registers[row] = registers
+        return np.array(completed)
+
+
+class DetectionBatcher:
+    """
+    Collects the frames every session submits during one event-loop turn and
+    runs them through one feature pass and one DetectorStore step. Inference
+    results of a batch are fanned out together, so their detector updates land
+    in the same turn. A session's second frame in a turn waits for the next
+    step, keeping its frames in order.
+    """
+
+    def __init__(self):
+        self._pending = []
+        self._flush_handle = None
+        self.steps = 0
+        self.frames = 0
+        # Time of each step (feature pass + store step), shared by every frame in it
+        self.step_ms = Histogram(STEP_BUCKETS_MS)
+
+    async def detect(self, service, landmarks, exercises, timestamp_ms=None):
+        """
+        Queue one frame of a session (an ExerciseDetectionService), captured
+        at `timestamp_ms`, and wait for its results: {exercise: completed a
+        rep} for `exercises`
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        timestamp_ms = np.nan if timestamp_ms is None else timestamp_ms
+        self._pending.append((service, landmarks, tuple(exercises), timestamp_ms, future))
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_soon(self._flush)
+        return await future
+
+    def _flush(self):
+        """Step every queued session once; repeated sessions go to the next turn"""
+        self._flush_handle = None
+        if len(self._pending) == 1 and self._pending[0][0].row is not None:
+            # The usual case of one session in the turn
+            batch, self._pending = self._pending, []
+            self._run(batch)
+            return
+        batch, seen, later = [], set(), []
+        for item in self._pending:
+            key = (id(item[0].store), item[0].row)
+            if item[0].row is None:
+                # Session closed while its frame waited: nothing to update
+                item[4].set_result({name: False for name in item[2]})
+            elif key in seen:
+                later.append(item)
+            else:
+                seen.add(key)
+                batch.append(item)
+        self._pending = later
+        if later:
+            self._flush_handle = asyncio.get_running_loop().call_soon(self._flush)
+
+        # Sessions of other stores (only used standalone) are stepped on their own
+        by_store = {}
+        for item in batch:
+            by_store.setdefault(id(item[0].store), []).append(item)
+        for items in by_store.values():
+            self._run(items)
+
+    def _run(self, items):
+        """One feature pass and one store step for a list of queued frames of the same store"""
+        started = time.perf_counter()
+        try:
+            if len(items) == 1:
+                # A lone session's frame: the service's scalar path, without the batch bookkeeping
+                service, landmarks, exercises, timestamp_ms, _ = items[0]
+                results = [service.detect_exercises(landmarks, exercises, timestamp_ms)]
+            else:
+                frames = np.stack([landmarks for _, landmarks, _, _, _ in items])
+                features = compute_features(frames)
+                completed = items[0][0].store.step(
+                    [service.row for service, _, _, _, _ in items],
+                    [service.exercise_ids(exercises) for service, _, exercises, _, _ in items],
+                    features,
+                    [timestamp_ms for _, _, _, timestamp_ms, _ in items],
+                    frames[:, :, 3],
+                )
+                results = []
+                for (service, _, exercises, _, _), vector, flags in zip(items, features, completed):
+                    service.features = vector
+                    results.append(dict(zip(exercises, flags.tolist())))
+        except Exception as e:
+            results = [e] * len(items)
+        self.step_ms.observe((time.perf_counter() - started) * 1000)
+        self.steps += 1
+        self.frames += len(items)
+        for (_, _, _, _, future), result in zip(items, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        """Get batching statistics"""
+        return {
+            "steps": self.steps,
+            "frames": self.frames,
+            "mean_batch_size": self.frames / self.steps if self.steps else 0.0,
+        }
+
@@ -0,0 +1,248 @@
+"""Exercise state machines, declared as data for the exercise engine"""
+from app.services.exercise_engine import (
+    ExerciseDefinition, Transition, Condition, Write, Update, Accumulate, AbsDiff, AngleDiff,
+    Velocity, AngularVelocity, ELAPSED_MS
+)
+from app.utils.kinematics import Feature as F
+
+SQUAT = ExerciseDefinition(
+    name="squat",
+    stages=("up", "down"),
+    smoothing_cutoff_hz=0.5,
+    transitions=(
+        Transition("up", "down", when=(Condition(F.LEFT_KNEE_ANGLE, "<", 90),)),
+        Transition("down", "up", when=(Condition(F.LEFT_KNEE_ANGLE, ">", 160),), count=True),
+    ),
+)
+
+# Slightly stricter thresholds to avoid walking false positives: BOTH arms AND
+# legs must be spread, and arms raised (walking swings them lower)
+JUMPING_JACK = ExerciseDefinition(
+    name="jumping_jack",
+    stages=("closed", "open"),
+    capture_fps=15,
+    transitions=(
+        Transition("closed", "open", when=(
+            Condition(F.ARM_SPAN, ">", 0.28),
+            Condition(F.LEG_SPAN, ">", 0.20),
+            Condition(F.WRIST_Y, "<", 0.05, relative_to=F.SHOULDER_Y),
+        )),
+        Transition("open", "closed", when=(
+            Condition(F.ARM_SPAN, "<", 0.22),
+            Condition(F.LEG_SPAN, "<", 0.16),
+        ), count=True),
+    ),
+)
+
+# Hip direction checks compare with the previous frame's height; only the sign
+# matters, so they hold at any frame rate
+BURPEE = ExerciseDefinition(
+    name="burpee",
+    stages=("standing", "squat", "plank", "jump"),
+    capture_fps=12,
+    registers=(("prev_hip_y", 0.0),),
+    transitions=(
+        Transition("standing", "squat", when=(Condition(F.LEFT_KNEE_ANGLE, "<", 100),)),
+        # Hands down, hips dropping
+        Transition("squat", "plank", when=(
+            Condition(F.LEFT_WRIST_Y, ">", 0, relative_to=F.LEFT_HIP_Y),
+            Condition(F.LEFT_HIP_Y, ">", 0, relative_to="prev_hip_y"),
+        )),
+        # Arms up, body rising
+        Transition("plank", "jump", when=(
+            Condition(F.LEFT_WRIST_Y, "<", 0, relative_to=F.LEFT_SHOULDER_Y),
+            Condition(F.LEFT_HIP_Y, "<", 0, relative_to="prev_hip_y"),
+        )),
+        Transition("jump", "standing", when=(
+            Condition(F.LEFT_KNEE_ANGLE, ">", 150),
+            Condition(F.LEFT_HIP_Y, "<", 0.6),
+        ), count=True),
+    ),
+    updates=(Update(Write("prev_hip_y", F.LEFT_HIP_Y)),),
+)
+
+# Outside a plank (hands on the ground, level with the hips) the cycle resets;
+# a rep is two knee drives
+MOUNTAIN_CLIMBER = ExerciseDefinition(
+    name="mountain_climber",
+    stages=("neutral", "knee_up"),
+    capture_fps=15,
+    registers=(("knee_cycle", 0.0),),
+    transitions=(
+        Transition(None, "neutral", when=(Condition(F.WRIST_Y, "<=", 0, relative_to=F.HIP_Y),),
+                   writes=(Write("knee_cycle"),)),
+        Transition(None, "neutral", when=(Condition(AbsDiff(F.WRIST_Y, F.HIP_Y), ">=", 0.15),),
+                   writes=(Write("knee_cycle"),)),
+        Transition("neutral", "knee_up", when=(Condition(F.LEFT_KNEE_Y, "<", -0.1, relative_to=F.LEFT_HIP_Y),),
+                   writes=(Write("knee_cycle", "knee_cycle", 1),)),
+        Transition("neutral", "knee_up", when=(Condition(F.RIGHT_KNEE_Y, "<", -0.1, relative_to=F.RIGHT_HIP_Y),),
+                   writes=(Write("knee_cycle", "knee_cycle", 1),)),
+        Transition("knee_up", "neutral", when=(
+            Condition(F.LEFT_KNEE_Y, ">=", -0.1, relative_to=F.LEFT_HIP_Y),
+            Condition(F.RIGHT_KNEE_Y, ">=", -0.1, relative_to=F.RIGHT_HIP_Y),
+            Condition("knee_cycle", ">=", 2),
+        ), writes=(Write("knee_cycle"),), count=True),
+        Transition("knee_up", "neutral", when=(
+            Condition(F.LEFT_KNEE_Y, ">=", -0.1, relative_to=F.LEFT_HIP_Y),
+            Condition(F.RIGHT_KNEE_Y, ">=", -0.1, relative_to=F.RIGHT_HIP_Y),
+        )),
+    ),
+)
+
+# Either knee raised counts (more lenient, like squats)
+HIGH_KNEE = ExerciseDefinition(
+    name="high_knee",
+    stages=("down", "up"),
+    capture_fps=15,
+    transitions=(
+        Transition("down", "up", when=(Condition(F.LEFT_KNEE_Y, "<", -0.08, relative_to=F.LEFT_HIP_Y),)),
+        Transition("down", "up", when=(Condition(F.RIGHT_KNEE_Y, "<", -0.08, relative_to=F.RIGHT_HIP_Y),)),
+        Transition("up", "down", when=(
+            Condition(F.LEFT_KNEE_Y, ">=", -0.08, relative_to=F.LEFT_HIP_Y),
+            Condition(F.RIGHT_KNEE_Y, ">=", -0.08, relative_to=F.RIGHT_HIP_Y),
+        ), count=True),
+    ),
+)
+
+# Push-ups are the only exercise on the ground (y grows downwards): ankles and
+# knees low, body horizontal and low, hands on the ground. Filmed from the side,
+# the far arm and leg are partly hidden behind the body, so push-ups and planks
+# accept lower landmark visibility
+GROUND_MIN_VISIBILITY = 0.2
+
+ON_THE_GROUND = (
+    Condition(F.ANKLE_Y, ">", 0.55),
+    Condition(F.KNEE_Y, ">", 0.45),
+    Condition(AbsDiff(F.HIP_Y, F.SHOULDER_Y), "<", 0.20),
+    Condition(F.HIP_Y, ">", 0.45),
+    Condition(F.WRIST_Y, ">=", -0.10, relative_to=F.SHOULDER_Y),
+)
+
+PUSH_UP = ExerciseDefinition(
+    name="push_up",
+    stages=("up", "down"),
+    smoothing_cutoff_hz=0.5,
+    min_visibility=GROUND_MIN_VISIBILITY,
+    transitions=(
+        Transition("up", "down", when=ON_THE_GROUND + (Condition(F.ELBOW_ANGLE, "<", 100),)),
+        Transition("down", "up", when=ON_THE_GROUND + (Condition(F.ELBOW_ANGLE, ">", 150),), count=True),
+    ),
+)
+
+# Down on whichever leg is forward (ankle in front of hip)
+LUNGE = ExerciseDefinition(
+    name="lunge",
+    stages=("standing", "down"),
+    capture_fps=8,
+    smoothing_cutoff_hz=0.5,
+    transitions=(
+        Transition("standing", "down", when=(
+            Condition(F.LEFT_ANKLE_X, "<", 0, relative_to=F.LEFT_HIP_X),
+            Condition(F.LEFT_KNEE_ANGLE, "<", 90),
+        )),
+        Transition("standing", "down", when=(
+            Condition(F.RIGHT_ANKLE_X, ">", 0, relative_to=F.RIGHT_HIP_X),
+            Condition(F.RIGHT_KNEE_ANGLE, "<", 90),
+        )),
+        Transition("down", "standing", when=(
+            Condition(F.LEFT_KNEE_ANGLE, ">", 150),
+            Condition(F.RIGHT_KNEE_ANGLE, ">", 150),
+        ), count=True),
+    ),
+)
+
+# Body straight (angle ~180) with hands on the ground; counts one rep per
+# second held. The hold adds up the real time between frames, so it counts the
+# same at any frame rate (a few frames per second are enough); time past a full
+# second carries into the next rep. The body angle band is narrow, so landmarks
+# are smoothed hard to keep jitter from breaking the hold
+PLANK_REP_MS = 1000
+
+PLANK = ExerciseDefinition(
+    name="plank",
+    stages=("not_plank", "plank"),
+    capture_fps=4,
+    smoothing_cutoff_hz=0.3,
+    min_visibility=GROUND_MIN_VISIBILITY,
+    registers=(("hold_ms", 0.0),),
+    accumulate=(Accumulate("hold_ms", ELAPSED_MS),),
+    transitions=(
+        Transition(None, "not_plank", when=(Condition(F.LEFT_BODY_ANGLE, "<=", 170),), writes=(Write("hold_ms"),)),
+        Transition(None, "not_plank", when=(Condition(F.LEFT_BODY_ANGLE, ">=", 190),), writes=(Write("hold_ms"),)),
+        Transition(None, "not_plank", when=(Condition(F.WRIST_Y, "<=", 0, relative_to=F.LEFT_HIP_Y),),
+                   writes=(Write("hold_ms"),)),
+        Transition(None, "not_plank", when=(Condition(AbsDiff(F.WRIST_Y, F.LEFT_HIP_Y), ">=", 0.2),),
+                   writes=(Write("hold_ms"),)),
+        Transition("not_plank", "plank", writes=(Write("hold_ms"),)),
+        Transition("plank", None, when=(Condition("hold_ms", ">=", PLANK_REP_MS),),
+                   writes=(Write("hold_ms", "hold_ms", -PLANK_REP_MS),), count=True),
+    ),
+)
+
+# The jump is the hip rising faster than 1.5 image heights per second (0.05 per
+# frame at 30fps), landing is it slowing below 0.6 per second
+HIP_VELOCITY = Velocity(F.LEFT_HIP_Y, "prev_hip_y")
+
+JUMP_SQUAT = ExerciseDefinition(
+    name="jump_squat",
+    stages=("up", "down", "jump"),
+    capture_fps=15,
+    registers=(("prev_hip_y", 0.0),),
+    transitions=(
+        Transition("up", "down", when=(Condition(F.LEFT_KNEE_ANGLE, "<", 90),),
+                   writes=(Write("prev_hip_y", F.LEFT_HIP_Y),)),
+        # Hip moves up fast
+        Transition("down", "jump", when=(Condition(HIP_VELOCITY, "<", -1.5),)),
+        Transition("jump", "up", when=(
+            Condition(F.LEFT_KNEE_ANGLE, ">", 160),
+            Condition(HIP_VELOCITY, ">", -0.6),
+        ), count=True),
+    ),
+    updates=(Update(Write("prev_hip_y", F.LEFT_HIP_Y), stages=("down", "jump")),),
+)
+
+# Arms and legs spread wide with arms above the head, then back together
+STAR_JUMP = ExerciseDefinition(
+    name="star_jump",
+    stages=("closed", "open"),
+    capture_fps=15,
+    transitions=(
+        Transition("closed", "open", when=(
+            Condition(F.ARM_SPAN, ">", 0.4),
+            Condition(F.LEG_SPAN, ">", 0.25),
+            Condition(F.WRIST_Y, "<", -0.1, relative_to=F.LEFT_SHOULDER_Y),
+        )),
+        Transition("open", "closed", when=(
+            Condition(F.ARM_SPAN, "<", 0.2),
+            Condition(F.LEG_SPAN, "<", 0.15),
+        ), count=True),
+    ),
+)
+
+# Accumulates how far the wrists turn around the shoulders; ~270 degrees turned
+# faster than 150 degrees/second (5 degrees per frame at 30fps) is one rep,
+# slowing below 30 degrees/second resets
+WRIST_TURN = AngleDiff(F.WRIST_DIRECTION, "prev_wrist_angle")
+WRIST_SPEED = AngularVelocity(F.WRIST_DIRECTION, "prev_wrist_angle")
+
+ARM_CIRCLE = ExerciseDefinition(
+    name="arm_circle",
+    stages=("neutral",),
+    capture_fps=20,
+    registers=(("cycle_count", 0.0), ("prev_wrist_angle", 0.0)),
+    accumulate=(Accumulate("cycle_count", WRIST_TURN, when=(Condition(WRIST_SPEED, ">", 150),)),),
+    transitions=(
+        Transition(None, None, when=(
+            Condition(WRIST_SPEED, ">", 150),
+            Condition("cycle_count", ">=", 270),
+        ), writes=(Write("cycle_count"), Write("prev_wrist_angle", F.WRIST_DIRECTION)), count=True),
+        Transition(None, None, when=(Condition(WRIST_SPEED, "<", 30),), writes=(Write("cycle_count"),)),
+    ),
+    updates=(Update(Write("prev_wrist_angle", F.WRIST_DIRECTION)),),
+)
+
+# Every exercise the engine can detect, in the order results are reported
+EXERCISE_DEFINITIONS = (
+    SQUAT, JUMPING_JACK, BURPEE, MOUNTAIN_CLIMBER, HIGH_KNEE, PUSH_UP,
+    LUNGE, PLANK, JUMP_SQUAT, STAR_JUMP, ARM_CIRCLE,
+)
@@ -0,0 +1,544 @@
+"""Table-driven exercise state machines, compiled to NumPy arrays and stepped in bulk"""
+from typing import NamedTuple, Optional, Union
+import numpy as np
+from app.utils.kinematics import NUM_FEATURES, FEATURE_LANDMARKS
+from app.utils.landmarks import NUM_LANDMARKS
+
+
+class AbsDiff(NamedTuple):
+    """|a - b| of two features / registers"""
+    a: Union[int, str]
+    b: Union[int, str]
+
+
+class AngleDiff(NamedTuple):
+    """Difference of two angles in degrees, wrapped to 0-180"""
+    a: Union[int, str]
+    b: Union[int, str]
+
+
+class Velocity(NamedTuple):
+    """(a - b) per second of the time elapsed since the session's previous frame"""
+    a: Union[int, str]
+    b: Union[int, str]
+
+
+class AngularVelocity(NamedTuple):
+    """AngleDiff of two angles per second of the time elapsed since the previous frame"""
+    a: Union[int, str]
+    b: Union[int, str]
+
+
+# Reference to the milliseconds elapsed since the session's previous frame
+ELAPSED_MS = "elapsed_ms"
+
+
+class Condition(NamedTuple):
+    """
+    `value op threshold`, or `value op relative_to + threshold`.
+    Values and `relative_to` are feature indices (Feature.*), register names or
+    ELAPSED_MS; `value` can also be an AbsDiff / AngleDiff / Velocity / AngularVelocity.
+    """
+    value: Union[int, str, AbsDiff, AngleDiff, Velocity, AngularVelocity]
+    op: str  # "<", "<=", ">" or ">="
+    threshold: float
+    relative_to: Union[int, str, None] = None
+
+
+class Write(NamedTuple):
+    """Set `register` to `source + add` (source: feature index, register name, ELAPSED_MS, or None for 0)"""
+    register: str
+    source: Union[int, str, None] = None
+    add: float = 0.0
+
+
+class Transition(NamedTuple):
+    """
+    Move from stage `source` (None = any stage) to `target` (None = stay) when
+    every condition holds, applying `writes`; `count` completes a rep
+    """
+    source: Optional[str]
+    target: Optional[str]
+    when: tuple = ()
+    writes: tuple = ()
+    count: bool = False
+
+
+class Accumulate(NamedTuple):
+    """Before transitions are checked, add `value` to `register` when every condition holds"""
+    register: str
+    value: Union[int, str, AbsDiff, AngleDiff, Velocity, AngularVelocity]
+    when: tuple = ()
+
+
+class Update(NamedTuple):
+    """Write applied at the end of every frame that did not complete a rep (in `stages`, None = all)"""
+    write: Write
+    stages: Optional[tuple] = None
+
+
+class ExerciseDefinition(NamedTuple):
+    """
+    An exercise as a state machine: stages (the first is the initial one),
+    float registers with their initial values, and rules evaluated once per
+    frame in this order: accumulations, the first matching transition, updates.
+    `capture_fps` is the frame rate needed to follow the exercise's motion,
+    `smoothing_cutoff_hz` the One-Euro minimum cutoff its landmarks may be
+    smoothed with (lower removes more jitter but lags slow moves; 0 turns
+    smoothing off). The exercise only runs on frames where every landmark its
+    rules read (through their features) has at least `min_visibility`.
+    """
+    name: str
+    stages: tuple
+    transitions: tuple
+    registers: tuple = ()  # (name, initial value) pairs
+    accumulate: tuple = ()
+    updates: tuple = ()
+    capture_fps: float = 10.0
+    smoothing_cutoff_hz: float = 1.0
+    min_visibility: float = 0.5
+
+
+# Stage code for "any stage" in transition sources, and for padding rows that never match
+ANY_STAGE = -1
+NO_STAGE = -2
+
+# Term kinds: plain difference, absolute difference, wrapped angle difference, and the
+# per-second rates of the plain and angle differences
+TERM_DIFF = 0
+TERM_ABS = 1
+TERM_ANGLE = 2
+TERM_VELOCITY = 3
+TERM_ANGULAR_VELOCITY = 4
+
+# Conditions are limited to the bits of one int64 mask
+MAX_CONDITIONS = 63
+
+# Steps of at most this many rows run row by row in plain Python: NumPy's per-call overhead
+# outweighs the vectorized work for one session's few exercises
+SCALAR_MAX_ROWS = 32
+
+
+def _gather(matrix, index):
+    """matrix[row, index[row, k]] for every row and k (take_along_axis without its overhead)"""
+    rows = np.arange(matrix.shape[0])[:, None] * matrix.shape[1]
+    return matrix.ravel()[index + rows]
+
+
+class ExerciseEngine:
+    """
+    Compiles exercise definitions into padded per-exercise tables (integer
+    stage ids, term and condition arrays, transition guard bit masks, register
+    writes) and advances any number of detector rows - each one exercise of
+    one session - by a frame in a single vectorized step. Steps of up to
+    SCALAR_MAX_ROWS rows run row by row (step_row) on the same rules as tuples.
+
+    Each row's value vector is its frame's features, then its registers, the
+    milliseconds elapsed since the row's previous frame, then a constant 0
+    slot. Rules that depend on time (hold durations, velocities) read the
+    elapsed slot, so they count the same at any frame rate. Conditions are compiled to `sign * value < sign * rhs`
+    (or `<=`), so all four comparison operators share one code path.
+    """
+
+    def __init__(self, definitions):
+        self.definitions = tuple(definitions)
+        self.names = tuple(definition.name for definition in self.definitions)
+        self.index = {name: exercise_id for exercise_id, name in enumerate(self.names)}
+        self.stage_names = tuple(definition.stages for definition in self.definitions)
+        self.register_names = tuple(tuple(name for name, _ in definition.registers) for definition in self.definitions)
+        self.register_count = max([len(names) for names in self.register_names] + [1])
+        # Value vector layout: features, registers, elapsed milliseconds, constant zero
+        self.elapsed_slot = NUM_FEATURES + self.register_count
+        self.zero_slot = self.elapsed_slot + 1
+        self.value_count = self.zero_slot + 1
+        # Writes per transition, padded to the longest list
+        self.write_width = max([1] + [len(t.writes) for d in self.definitions for t in d.transitions])
+        self._compile()
+
+    def _slot(self, exercise_id, ref):
+        """Value-vector slot of a feature index, a register name, ELAPSED_MS or None (the zero slot)"""
+        if ref is None:
+            return self.zero_slot
+        if ref == ELAPSED_MS:
+            return self.elapsed_slot
+        if isinstance(ref, str):
+            try:
+                return NUM_FEATURES + self.register_names[exercise_id].index(ref)
+            except ValueError:
+                raise ValueError(f"{self.names[exercise_id]}: unknown register {ref!r}")
+        if not 0 <= ref < NUM_FEATURES:
+            raise ValueError(f"{self.names[exercise_id]}: unknown feature {ref!r}")
+        return int(ref)
+
+    def _stage(self, exercise_id, name, default):
+        """Stage id of a stage name (`default` for None)"""
+        if name is None:
+            return default
+        try:
+            return self.definitions[exercise_id].stages.index(name)
+        except ValueError:
+            raise ValueError(f"{self.names[exercise_id]}: unknown stage {name!r}")
+
+    def _compile(self):
+        """Build the padded lookup tables, one row per exercise"""
+        compiled = [self._compile_exercise(exercise_id) for exercise_id in range(len(self.definitions))]
+
+        def pad(key, fill, dtype, inner=()):
+            """Stack one per-exercise list into an (exercises, longest list) + inner array"""
+            rows = [entry[key] for entry in compiled]
+            table = np.full((len(rows), max([len(row) for row in rows] + [1])) + inner, fill, dtype=dtype)
+            for exercise_id, row in enumerate(rows):
+                if row:
+                    table[exercise_id, :len(row)] = row
+            return table
+
+        # Terms: (kind, a, b); padding terms read the zero slot
+        self.term_kind = pad("term_kind", TERM_DIFF, np.int8)
+        self.term_a = pad("term_a", self.zero_slot, np.intp)
+        self.term_b = pad("term_b", self.zero_slot, np.intp)
+        # Conditions: sign * term (<, <=) sign * (value[relative_to] + threshold)
+        self.condition_term = pad("condition_term", 0, np.intp)
+        self.condition_sign = pad("condition_sign", 1.0, np.float64)
+        self.condition_strict = pad("condition_strict", True, bool)
+        self.condition_relative = pad("condition_relative", self.zero_slot, np.intp)
+        self.condition_threshold = pad("condition_threshold", 0.0, np.float64)
+        self.condition_bits = np.left_shift(np.int64(1), np.arange(self.condition_term.shape[1], dtype=np.int64))
+        # Transitions: padding never matches (source NO_STAGE)
+        self.transition_source = pad("transition_source", NO_STAGE, np.int16)
+        self.transition_target = pad("transition_target", ANY_STAGE, np.int16)
+        self.transition_guard = pad("transition_guard", 0, np.int64)
+        self.transition_count = pad("transition_count", 0, np.int32)
+        # Writes of each transition: (register slot or -1, source slot, add)
+        width = (self.write_width,)
+        self.write_register = pad("write_register", -1, np.intp, width)
+        self.write_source = pad("write_source", self.zero_slot, np.intp, width)
+        self.write_add = pad("write_add", 0.0, np.float64, width)
+        # End-of-frame updates: (register slot or -1, source slot, add, stage bit mask)
+        self.update_register = pad("update_register", -1, np.intp)
+        self.update_source = pad("update_source", self.zero_slot, np.intp)
+        self.update_add = pad("update_add", 0.0, np.float64)
+        self.update_stages = pad("update_stages", 0, np.int64)
+        # Accumulations: (register slot or -1, term, guard mask)
+        self.accumulate_register = pad("accumulate_register", -1, np.intp)
+        self.accumulate_term = pad("accumulate_term", 0, np.intp)
+        self.accumulate_guard = pad("accumulate_guard", 0, np.int64)
+        self.has_accumulators = (self.accumulate_register >= 0).any(axis=1)
+
+        self.initial_registers = np.zeros((len(self.definitions), self.register_count))
+        for exercise_id, definition in enumerate(self.definitions):
+            for slot, (_, initial) in enumerate(definition.registers):
+                self.initial_registers[exercise_id, slot] = initial
+
+        # Landmarks each exercise depends on: those of every feature its terms, comparisons and writes read
+        self.required_landmarks = np.zeros((len(self.definitions), NUM_LANDMARKS), dtype=bool)
+        for exercise_id in range(len(self.definitions)):
+            slots = np.concatenate([
+                self.term_a[exercise_id], self.term_b[exercise_id], self.condition_relative[exercise_id],
+                self.write_source[exercise_id].ravel(), self.update_source[exercise_id],
+            ])
+            for feature in np.unique(slots[slots < NUM_FEATURES]):
+                self.required_landmarks[exercise_id, list(FEATURE_LANDMARKS[feature])] = True
+        self.min_visibility = np.array([definition.min_visibility for definition in self.definitions])
+        self._row_landmarks = [tuple(np.flatnonzero(required).tolist()) for required in self.required_landmarks]
+        self._row_tables = [self._row_table(entry) for entry in compiled]
+
+    def _row_table(self, entry):
+        """
+        An exercise's unpadded rules as tuples for step_row: terms, conditions
+        (with their bit), accumulations, transitions with their writes and
+        updates, registers as offsets into the register list
+        """
+        register = NUM_FEATURES
+        conditions = tuple(zip(entry["condition_term"], entry["condition_sign"], entry["condition_strict"],
+                               entry["condition_relative"], entry["condition_threshold"],
+                               [1 << bit for bit in range(len(entry["condition_term"]))]))
+        accumulations = tuple((target - register, term, guard) for target, term, guard in zip(
+            entry["accumulate_register"], entry["accumulate_term"], entry["accumulate_guard"]))
+        transitions = tuple(
+            (source, target, guard, count, tuple(
+                (write - register, slot, add) for write, slot, add in zip(writes, slots, adds) if write >= 0
+            ))
+            for source, target, guard, count, writes, slots, adds in zip(
+                entry["transition_source"], entry["transition_target"], entry["transition_guard"],
+                entry["transition_count"], entry["write_register"], entry["write_source"], entry["write_add"])
+        )
+        updates = tuple((target - register, slot, add, stages) for target, slot, add, stages in zip(
+            entry["update_register"], entry["update_source"], entry["update_add"], entry["update_stages"]))
+        terms = tuple(zip(entry["term_kind"], entry["term_a"], entry["term_b"]))
+        return terms, conditions, accumulations, transitions, updates
+
+    def _compile_exercise(self, exercise_id):
+        """Compile one definition into flat lists of term, condition, transition and write entries"""
+        definition = self.definitions[exercise_id]
+        out = {key: [] for key in (
+            "term_kind", "term_a", "term_b",
+            "condition_term", "condition_sign", "condition_strict", "condition_relative", "condition_threshold",
+            "transition_source", "transition_target", "transition_guard", "transition_count",
+            "write_register", "write_source", "write_add",
+            "update_register", "update_source", "update_add", "update_stages",
+            "accumulate_register", "accumulate_term", "accumulate_guard",
+        )}
+        terms = {}
+        conditions = {}
+
+        def term(value):
+            """Index of a term (deduplicated)"""
+            if isinstance(value, AbsDiff):
+                key = (TERM_ABS, self._slot(exercise_id, value.a), self._slot(exercise_id, value.b))
+            elif isinstance(value, AngleDiff):
+                key = (TERM_ANGLE, self._slot(exercise_id, value.a), self._slot(exercise_id, value.b))
+            elif isinstance(value, Velocity):
+                key = (TERM_VELOCITY, self._slot(exercise_id, value.a), self._slot(exercise_id, value.b))
+            elif isinstance(value, AngularVelocity):
+                key = (TERM_ANGULAR_VELOCITY, self._slot(exercise_id, value.a), self._slot(exercise_id, value.b))
+            else:
+                key = (TERM_DIFF, self._slot(exercise_id, value), self.zero_slot)
+            if key not in terms:
+                terms[key] = len(terms)
+                for name, item in zip(("term_kind", "term_a", "term_b"), key):
+                    out[name].append(item)
+            return terms[key]
+
+        def guard(when):
+            """Bit mask of a list of conditions (deduplicated)"""
+            mask = 0
+            for condition in when:
+                if condition.op not in ("<", "<=", ">", ">="):
+                    raise ValueError(f"{definition.name}: unknown operator {condition.op!r}")
+                key = (
+                    term(condition.value),
+                    -1.0 if condition.op.startswith(">") else 1.0,
+                    condition.op in ("<", ">"),
+                    self._slot(exercise_id, condition.relative_to),
+                    float(condition.threshold),
+                )
+                if key not in conditions:
+                    if len(conditions) == MAX_CONDITIONS:
+                        raise ValueError(f"{definition.name}: more than {MAX_CONDITIONS} conditions")
+                    conditions[key] = len(conditions)
+                    for name, item in zip(("condition_term", "condition_sign", "condition_strict",
+                                           "condition_relative", "condition_threshold"), key):
+                        out[name].append(item)
+                mask |= 1 << conditions[key]
+            return mask
+
+        def write(entry):
+            """(register slot, source slot, add) of a Write"""
+            return register(entry.register), self._slot(exercise_id, entry.source), float(entry.add)
+
+        def register(name):
+            """Value-vector slot of a register that is written to"""
+            if not isinstance(name, str) or name == ELAPSED_MS:
+                raise ValueError(f"{definition.name}: writes must target a register")
+            return self._slot(exercise_id, name)
+
+        for accumulate in definition.accumulate:
+            out["accumulate_register"].append(register(accumulate.register))
+            out["accumulate_term"].append(term(accumulate.value))
+            out["accumulate_guard"].append(guard(accumulate.when))
+
+        for transition in definition.transitions:
+            out["transition_source"].append(self._stage(exercise_id, transition.source, ANY_STAGE))
+            out["transition_target"].append(self._stage(exercise_id, transition.target, ANY_STAGE))
+            out["transition_guard"].append(guard(transition.when))
+            out["transition_count"].append(1 if transition.count else 0)
+            writes = [write(entry) for entry in transition.writes]
+            writes += [(-1, self.zero_slot, 0.0)] * (self.write_width - len(writes))
+            out["write_register"].append([entry[0] for entry in writes])
+            out["write_source"].append([entry[1] for entry in writes])
+            out["write_add"].append([entry[2] for entry in writes])
+
+        for update in definition.updates:
+            register, source, add = write(update.write)
+            stages = update.stages if update.stages is not None else definition.stages
+            mask = 0
+            for stage in stages:
+                mask |= 1 << self._stage(exercise_id, stage, None)
+            out["update_register"].append(register)
+            out["update_source"].append(source)
+            out["update_add"].append(add)
+            out["update_stages"].append(mask)
+        return out
+
+    def initial_state(self, exercise_ids):
+        """(stage, count, registers) arrays for new rows of the given exercises"""
+        exercise_ids = np.asarray(exercise_ids, dtype=np.intp)
+        return (
+            np.zeros(len(exercise_ids), dtype=np.int8),
+            np.zeros(len(exercise_ids), dtype=np.int32),
+            self.initial_registers[exercise_ids].copy(),
+        )
+
+    def visible(self, exercise, visibility):
+        """
+        Whether every landmark each row's exercise depends on is visible enough:
+        `exercise` is an int array of exercise ids, `visibility` the (rows, 33)
+        landmark visibilities of their frames
+        """
+        hidden = self.required_landmarks[exercise] & (visibility < self.min_visibility[exercise, None])
+        return ~hidden.any(axis=1)
+
+    def visible_row(self, exercise_id, visibility):
+        """visible() of one row with plain Python scalars: `visibility` is its frame's list of 33 visibilities"""
+        threshold = self.definitions[exercise_id].min_visibility
+        return all(visibility[landmark] >= threshold for landmark in self._row_landmarks[exercise_id])
+
+    def _evaluate(self, exercise, values):
+        """Compute the terms and the condition bit mask of every row"""
+        a = _gather(values, self.term_a[exercise])
+        b = _gather(values, self.term_b[exercise])
+        kind = self.term_kind[exercise]
+        terms = a - b
+        magnitude = np.abs(terms)
+        angle = (kind == TERM_ANGLE) | (kind == TERM_ANGULAR_VELOCITY)
+        terms = np.where(angle, np.minimum(magnitude, 360 - magnitude), np.where(kind == TERM_ABS, magnitude, terms))
+        per_second = kind >= TERM_VELOCITY
+        if per_second.any():
+            terms = np.where(per_second, terms * (1000 / values[:, self.elapsed_slot])[:, None], terms)
+
+        sign = self.condition_sign[exercise]
+        left = sign * _gather(terms, self.condition_term[exercise])
+        right = sign * (_gather(values, self.condition_relative[exercise]) + self.condition_threshold[exercise])
+        passed = np.where(self.condition_strict[exercise], left < right, left <= right)
+        return terms, passed.astype(np.int64) @ self.condition_bits
+
+    def step(self, exercise, stage, count, registers, features, elapsed_ms):
+        """
+        Advance detector rows by one frame.
+        `exercise`, `stage` and `count` are (n,) arrays, `registers` is
+        (n, register_count), `features` is (n, NUM_FEATURES) or one shared
+        (NUM_FEATURES,) vector and `elapsed_ms` the (n,) or shared time since
+        each row's previous frame (must be positive). Returns new (stage,
+        count, registers) arrays and an (n,) bool array of rows that completed
+        a rep this frame.
+        """
+        n = len(exercise)
+        if n <= SCALAR_MAX_ROWS:
+            return self._step_rows(exercise, stage, count, registers, features, elapsed_ms)
+        registers = registers.copy()
+        values = np.empty((n, self.value_count))
+        values[:, :NUM_FEATURES] = features
+        values[:, NUM_FEATURES:self.elapsed_slot] = registers
+        values[:, self.elapsed_slot] = elapsed_ms
+        values[:, self.zero_slot] = 0.0
+        terms, bits = self._evaluate(exercise, values)
+
+        if self.has_accumulators[exercise].any():
+            target = self.accumulate_register[exercise]
+            apply = (target >= 0) & ((self.accumulate_guard[exercise] & ~bits[:, None]) == 0)
+            added = _gather(terms, self.accumulate_term[exercise])
+            for column in range(target.shape[1]):
+                hit = apply[:, column]
+                if hit.any():
+                    registers[hit, target[hit, column] - NUM_FEATURES] += added[hit, column]
+            values[:, NUM_FEATURES:self.elapsed_slot] = registers
+            terms, bits = self._evaluate(exercise, values)
+
+        # First transition whose source stage and guard both match
+        source = self.transition_source[exercise]
+        matches = ((source == ANY_STAGE) | (source == stage[:, None])) & (
+            (self.transition_guard[exercise] & ~bits[:, None]) == 0
+        )
+        fired = matches.any(axis=1)
+        chosen = matches.argmax(axis=1)
+        increment = np.where(fired, self.transition_count[exercise, chosen], 0)
+
+        target = self.write_register[exercise, chosen]
+        source = self.write_source[exercise, chosen]
+        add = self.write_add[exercise, chosen]
+        for column in range(target.shape[1]):
+            hit = fired & (target[:, column] >= 0)
+            if hit.any():
+                registers[hit, target[hit, column] - NUM_FEATURES] = values[hit, source[hit, column]] + add[hit, column]
+
+        # Updates of the stage the frame started in, skipped when a rep completed
+        target = self.update_register[exercise]
+        source = self.update_source[exercise]
+        add = self.update_add[exercise]
+        in_stage = ((self.update_stages[exercise] >> stage.astype(np.int64)[:, None]) & 1) == 1
+        apply = (target >= 0) & in_stage & (increment == 0)[:, None]
+        for column in range(target.shape[1]):
+            hit = apply[:, column]
+            if hit.any():
+                registers[hit, target[hit, column] - NUM_FEATURES] = values[hit, source[hit, column]] + add[hit, column]
+
+        next_stage = self.transition_target[exercise, chosen]
+        stage = np.where(fired & (next_stage >= 0), next_stage, stage).astype(stage.dtype)
+        count = count + increment.astype(count.dtype)
+        return stage, count, registers, increment > 0
+
+    def _step_rows(self, exercise, stage, count, registers, features, elapsed_ms):
+        """step() for a few rows, one step_row call each; same arguments and results"""
+        n = len(exercise)
+        features = np.broadcast_to(features, (n, NUM_FEATURES)).tolist()
+        elapsed_ms = np.broadcast_to(elapsed_ms, (n,)).tolist()
+        next_stage = np.empty_like(stage)
+        increment = np.zeros(n, dtype=count.dtype)
+        next_registers = np.empty_like(registers)
+        for row, (exercise_id, row_stage, row_registers) in enumerate(
+                zip(exercise.tolist(), stage.tolist(), registers.tolist())):
+            next_stage[row], increment[row], next_registers[row] = self.step_row(
+                exercise_id, row_stage, row_registers, features[row], elapsed_ms[row]
+            )
+        return next_stage, count + increment, next_registers, increment > 0
+
+    def _evaluate_row(self, terms, conditions, values):
+        """_evaluate of one row: its term values and condition bit mask"""
+        elapsed = values[self.elapsed_slot]
+        results = []
+        for kind, a, b in terms:
+            term = values[a] - values[b]
+            if kind != TERM_DIFF:
+                magnitude = abs(term)
+                if kind == TERM_ANGLE or kind == TERM_ANGULAR_VELOCITY:
+                    term = min(magnitude, 360 - magnitude)
+                elif kind == TERM_ABS:
+                    term = magnitude
+                if kind >= TERM_VELOCITY:
+                    term *= 1000 / elapsed
+            results.append(term)
+        bits = 0
+        for term, sign, strict, relative, threshold, bit in conditions:
+            left = sign * results[term]
+            right = sign * (values[relative] + threshold)
+            if left < right if strict else left <= right:
+                bits |= bit
+        return results, bits
+
+    def step_row(self, exercise_id, stage, registers, features, elapsed_ms):
+        """
+        Advance one detector row by a frame with plain Python scalars, as step()
+        does: `registers` is the row's register list (register_count long,
+        updated in place) and `features` its feature list. Returns (new stage,
+        1 if a rep completed else 0, registers).
+        """
+        terms, conditions, accumulations, transitions, updates = self._row_tables[exercise_id]
+        values = features + registers + [elapsed_ms, 0.0]
+        results, bits = self._evaluate_row(terms, conditions, values)
+
+        if accumulations:
+            added = results
+            for target, term, guard in accumulations:
+                if guard & ~bits == 0:
+                    registers[target] += added[term]
+            values[NUM_FEATURES:self.elapsed_slot] = registers
+            results, bits = self._evaluate_row(terms, conditions, values)
+
+        # First transition whose source stage and guard both match
+        increment = 0
+        next_stage = stage
+        for source, target, guard, count, writes in transitions:
+            if (source == ANY_STAGE or source == stage) and guard & ~bits == 0:
+                increment = count
+                for register, slot, add in writes:
+                    registers[register] = values[slot] + add
+                if target >= 0:
+                    next_stage = target
+                break
+
+        # Updates of the stage the frame started in, skipped when a rep completed
+        if not increment:
+            for register, slot, add, stages in updates:
+                if (stages >> stage) & 1:
+                    registers[register] = values[slot] + add
+        return next_stage, increment, registers
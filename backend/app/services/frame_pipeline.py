@@ -0,0 +1,541 @@
+"""Frame processing pipeline shared by the HTTP and WebSocket endpoints"""
+import asyncio
+import json
+import math
+import time
+from typing import NamedTuple, Optional
+import numpy as np
+from app.config import MODEL_TIERS, GROUP_MAX_PEOPLE, CAPTURE_TIMESTAMP_MAX_MS
+from app.services.pose_detection import (
+    pose_backend, inference_scheduler, model_tier_controller, release_pose_session
+)
+from app.services.frame_preprocessing import frame_preprocessor
+from app.services.capture_advisor import capture_advisor
+from app.services.exercise_detection import resolve_exercise_key, smoothing_cutoff
+from app.services.detector_store import DetectionBatcher
+from app.services.group_tracking import GroupTracker
+from app.services.inference_executor import inference_executor
+from app.services.landmark_recorder import landmark_recorder
+from app.services.session_registry import session_registry
+from app.utils.landmarks import array_to_json
+from app.utils.metrics import Histogram
+from app.utils.roi import map_landmarks_from_roi
+
+# Only track the 4 hardcoded exercises: push_up, squat, jumping_jack, arm_circle
+TRACKED_EXERCISES = ["push_up", "squat", "jumping_jack", "arm_circle"]
+
+# Stages timed on the inference worker
+WORKER_STAGES = ("decode", "resize", "color", "motion", "crop", "detect_pose")
+# Every timed stage of a frame: upload read, the worker stages, detection step, response encoding
+FRAME_STAGES = ("upload",) + WORKER_STAGES + ("detect_exercises", "serialize")
+STAGE_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 50, 100, 250)
+
+
+class InvalidFrameError(ValueError):
+    """Raised when frame bytes cannot be decoded as an image"""
+
+
+def check_capture_timestamp(timestamp_ms):
+    """
+    Validate a client's capture timestamp: a finite number of milliseconds at
+    most CAPTURE_TIMESTAMP_MAX_MS from zero; raises ValueError otherwise
+    """
+    if not math.isfinite(timestamp_ms) or abs(timestamp_ms) > CAPTURE_TIMESTAMP_MAX_MS:
+        raise ValueError(f"Capture timestamp must be a finite number of at most {CAPTURE_TIMESTAMP_MAX_MS:g} ms")
+    return float(timestamp_ms)
+
+
+def frame_timestamp(timestamp_ms=None):
+    """
+    Capture time of a frame in milliseconds: the client's capture timestamp
+    when it sent one, otherwise the time the server received the frame.
+    Only differences between frames of one session are used.
+    """
+    return time.monotonic() * 1000 if timestamp_ms is None else float(timestamp_ms)
+
+
+class LatestFrameSlot:
+    """
+    Single-slot mailbox for a streaming connection.
+    Only the newest pending frame is kept: a frame that arrives before the
+    previous one was picked up replaces it and the old one counts as dropped.
+    """
+
+    def __init__(self):
+        self.received = 0
+        self.dropped = 0
+        self._frame = None
+        self._closed = False
+        self._event = asyncio.Event()
+
+    def put(self, frame):
+        """Store a new frame, dropping any frame still waiting to be processed"""
+        self.received += 1
+        if self._frame is not None:
+            self.dropped += 1
+        self._frame = (self.received, frame)
+        self._event.set()
+
+    def close(self):
+        """Wake up the consumer and stop handing out frames"""
+        self._closed = True
+        self._event.set()
+
+    async def get(self):
+        """Wait for the newest frame as (frame_id, frame); returns None once closed"""
+        while self._frame is None:
+            if self._closed:
+                return None
+            await self._event.wait()
+            self._event.clear()
+        item, self._frame = self._frame, None
+        return item
+
+
+class PoseResult(NamedTuple):
+    """Result of one frame's pose inference, returned by the inference worker"""
+    landmarks: Optional[np.ndarray]  # first pose as a (33, 4) array, or None
+    model_tier: str  # tier that produced the landmarks
+    presence: float  # mean landmark presence
+    decode_scale: int  # libjpeg scale factor used to decode the frame (1 = full size)
+    roi_mode: str  # "crop", "full", "fallback" (crop lost the pose, full frame re-run) or "none" (reused)
+    timings_ms: dict  # per-stage worker time: decode, resize, color, motion, crop, detect_pose
+    reused: bool = False  # static frame: landmarks of the last inferred frame, no inference ran
+    poses: Optional[list] = None  # group sessions: every detected pose as a (33, 4) array
+    tier_ms: Optional[dict] = None  # inference time per tier run: the session's tier, and a re-run's bigger tier
+
+
+def decode_and_detect(contents, session_id, model_tier, timestamp_ms=None, num_poses=1):
+    """
+    Decode encoded image bytes, captured at `timestamp_ms`, and run pose
+    detection on the session's landmarker of `model_tier`. Runs on an inference worker.
+    Backends that do not track the pose themselves only see the region
+    around the previous frame's pose; when the crop loses it the full frame
+    is re-run.
+    Frames that did not move since the last inferred one skip inference and
+    reuse its landmarks (see FramePreprocessor.is_static). With `num_poses`
+    above 1 (group sessions) the full frame is searched for up to that many
+    people, returned in `poses`.
+    """
+    timings_ms = {}
+    buffers = frame_preprocessor.buffers_for(session_id)
+    # The buffers are reused for the session's next frame, so hold them until inference is done
+    with buffers.lock:
+        rgb_image, decode_scale = frame_preprocessor.preprocess(contents, buffers, timings_ms)
+        if rgb_image is None:
+            raise InvalidFrameError("Invalid image data")
+
+        if frame_preprocessor.is_static(rgb_image, buffers, timings_ms) and buffers.last_pose is not None:
+            landmarks, tier_used, presence, poses = buffers.last_pose
+            return PoseResult(landmarks, tier_used, presence, decode_scale, "none", timings_ms, reused=True,
+                              poses=poses)
+
+        if num_poses > 1:
+            started = time.perf_counter()
+            poses, tier_used, presence, tier_ms = _detect_poses(
+                rgb_image, session_id, model_tier, timestamp_ms, num_poses
+            )
+            timings_ms["detect_pose"] = (time.perf_counter() - started) * 1000
+            landmarks = poses[0] if poses else None
+            buffers.last_pose = (landmarks, tier_used, presence, poses)
+            return PoseResult(landmarks, tier_used, presence, decode_scale, "full", timings_ms, poses=poses,
+                              tier_ms=tier_ms)
+
+        landmarks = None
+        roi_mode = "full"
+        tier_ms = {}
+        started = time.perf_counter()
+        cropped, roi = None, None
+        # Backends that track the pose over the session's stream (MediaPipe VIDEO mode) pick their own
+        # region; crops of changing size mixed with full frames would break that tracking
+        if not pose_backend.tracks_pose:
+            cropped, roi = frame_preprocessor.crop(rgb_image, buffers, timings_ms)
+        if cropped is not None:
+            landmarks, tier_used, presence, run_ms = _detect_landmarks(cropped, session_id, model_tier, timestamp_ms)
+            tier_ms = run_ms
+            if landmarks is not None:
+                landmarks = map_landmarks_from_roi(landmarks, roi)
+                roi_mode = "crop"
+            else:
+                roi_mode = "fallback"
+        if landmarks is None:
+            landmarks, tier_used, presence, run_ms = _detect_landmarks(rgb_image, session_id, model_tier, timestamp_ms)
+            # A fallback frame costs both runs on its tiers
+            tier_ms = {tier: tier_ms.get(tier, 0.0) + run_ms.get(tier, 0.0) for tier in {**tier_ms, **run_ms}}
+        timings_ms["detect_pose"] = (time.perf_counter() - started) * 1000 - timings_ms.get("crop", 0.0)
+
+        if not pose_backend.tracks_pose:
+            frame_preprocessor.track(buffers, landmarks)
+        buffers.last_pose = (landmarks, tier_used, presence, None)
+
+    return PoseResult(landmarks, tier_used, presence, decode_scale, roi_mode, timings_ms, tier_ms=tier_ms)
+
+
+def _detect_landmarks(rgb_image, session_id, model_tier, timestamp_ms=None):
+    """
+    Run pose detection on an RGB image, returning (first pose as a (33, 4)
+    array or None, tier used, presence, inference ms per tier run)
+    """
+    poses, tier_used, presence, tier_ms = _detect_poses(rgb_image, session_id, model_tier, timestamp_ms)
+    return (poses[0] if poses else None), tier_used, presence, tier_ms
+
+
+def _detect_poses(rgb_image, session_id, model_tier, timestamp_ms=None, num_poses=1):
+    """
+    Run pose detection on an RGB image, returning (up to `num_poses` (33, 4)
+    arrays, tier used, presence, inference ms per tier run)
+    """
+    return pose_backend.detect_adaptive(
+        rgb_image, session_id, model_tier, timestamp_ms=timestamp_ms, num_poses=num_poses
+    )
+
+
+def release_worker_session(session_id):
+    """Release a session's landmarker leases and frame buffers in this worker process"""
+    release_pose_session(session_id)
+    frame_preprocessor.release(session_id)
+
+
+class FramePipeline:
+    """Run pose inference for a frame and feed the session's exercise detectors"""
+
+    def __init__(self, scheduler=inference_scheduler, tier_controller=model_tier_controller,
+                 recorder=landmark_recorder, advisor=capture_advisor):
+        self._scheduler = scheduler
+        self._tier_controller = tier_controller
+        self.recorder = recorder
+        self.advisor = advisor
+        # Detector updates of all sessions in one event-loop turn share one vectorized step
+        self.detection_batcher = DetectionBatcher()
+        self.stage_ms = {stage: Histogram(STAGE_BUCKETS_MS) for stage in FRAME_STAGES}
+        self.stage_ms["detect_exercises"] = self.detection_batcher.step_ms
+        # Frames run through the detectors, by whether a pose was found or predicted for a gap
+        self.pose_frames = {"detected": 0, "missing": 0, "predicted": 0}
+        # Frames that ran pose inference / reused the last landmarks because they were static
+        self.motion_gate = {"inferred": 0, "reused": 0}
+        self.decode_scales = {}
+        self.roi_modes = {}
+
+    def get_counters(self, session):
+        """Get the session's counters for the tracked exercises (plus any other active ones)"""
+        all_counters = session.exercise_detection.get_counters()
+        return {key: all_counters.get(key, 0) for key in self.reported_exercises(session)}
+
+    def active_exercises(self, session):
+        """Detector keys evaluated on the session's frames"""
+        return session.active_exercises or TRACKED_EXERCISES
+
+    def reported_exercises(self, session):
+        """Exercises reported in results: the tracked ones, then any other active ones"""
+        extra = [key for key in self.active_exercises(session) if key not in TRACKED_EXERCISES]
+        return TRACKED_EXERCISES + extra if extra else TRACKED_EXERCISES
+
+    def set_active_exercises(self, session, names):
+        """
+        Set the exercises detected for a session from workout exercise names
+        ("Push-ups") or detector keys ("push_up"); empty restores the tracked
+        exercises. Can be called mid-session: newly activated detectors start
+        from a fresh stage, counts are kept. Raises ValueError for unknown names.
+        """
+        keys = []
+        unknown = []
+        for name in names or []:
+            key = resolve_exercise_key(name)
+            if key is None:
+                unknown.append(name)
+            elif key not in keys:
+                keys.append(key)
+        if unknown:
+            raise ValueError(f"No detector for exercises: {', '.join(unknown)}")
+
+        previous = self.active_exercises(session)
+        sessions = [session] + (session.group_tracker.sessions() if session.group_tracker is not None else [])
+        for member in sessions:
+            for key in keys:
+                if key not in previous:
+                    member.exercise_detection.reset_stage(key)
+            member.active_exercises = tuple(keys) or None
+        return list(self.active_exercises(session))
+
+    def set_group_mode(self, session, max_people):
+        """
+        Count up to `max_people` people on the session's frames separately
+        (capped at GROUP_MAX_PEOPLE); 1 or less returns the session to one
+        person. Changing the size starts over with fresh tracks.
+        Returns the number of people tracked; raises ValueError for a session
+        being recorded (recordings hold one person's landmarks).
+        """
+        max_people = min(max_people, GROUP_MAX_PEOPLE)
+        if max_people > 1 and self.recorder.is_recording(session.session_id):
+            raise ValueError("Stop the session's recording before counting several people")
+        if session.group_tracker is not None:
+            session.group_tracker.close()
+            session.group_tracker = None
+        if max_people > 1:
+            session.group_tracker = GroupTracker(session.session_id, max_people)
+        return max(1, max_people)
+
+    def get_group_counters(self, session):
+        """
+        Get the counters of each open track of a group session, of the tracks
+        closed most recently, and summed over every closed track
+        """
+        tracker = session.group_tracker
+        reported = self.reported_exercises(session)
+        return {
+            "people": [
+                {"track_id": track_id, "exercises": self.get_counters(track.session)}
+                for track_id, track in tracker.tracks.items()
+            ],
+            "finished": [
+                {"track_id": track_id, "exercises": {key: counters.get(key, 0) for key in reported}}
+                for track_id, counters in tracker.finished.items()
+            ],
+            "finished_total": {key: tracker.finished_total.get(key, 0) for key in reported},
+        }
+
+    def reset_counters(self, session):
+        """Reset a session's counters; group sessions also drop their tracks"""
+        session.exercise_detection.reset_counters()
+        if session.group_tracker is not None:
+            self.set_group_mode(session, session.group_tracker.max_people)
+
+    def start_recording(self, session, name=None):
+        """
+        Start recording a session's landmarks (see LandmarkRecorder.start).
+        Group sessions can't be recorded: a recording holds one person's
+        landmarks, so raises ValueError for them.
+        """
+        if session.group_tracker is not None:
+            raise ValueError("Group sessions can't be recorded, return the session to one person first")
+        return self.recorder.start(session.session_id, name)
+
+    def stop_recording(self, session, ground_truth=None):
+        """
+        Stop recording a session's landmarks and return the Recording (None if
+        it was not recorded). Ground truth names are resolved like
+        set_active_exercises; raises ValueError for unknown names.
+        """
+        labels = {}
+        for name, reps in (ground_truth or {}).items():
+            key = resolve_exercise_key(name)
+            if key is None:
+                raise ValueError(f"No detector for exercise: {name}")
+            labels[key] = labels.get(key, 0) + reps
+        return self.recorder.stop(session.session_id, labels, session.exercise_detection.get_counters())
+
+    async def detect_frame(self, session, contents, timestamp_ms):
+        """Run pose inference on encoded image bytes captured at `timestamp_ms` and return the PoseResult"""
+        model_tier = self._tier_controller.choose(session)
+        num_poses = session.group_tracker.max_people if session.group_tracker is not None else 1
+        # Decode and inference run on the worker pool so the event loop stays responsive
+        pose = await self._scheduler.submit(
+            decode_and_detect, contents, session.session_id, model_tier, timestamp_ms, num_poses,
+            shard_key=session.session_id
+        )
+        for stage, elapsed_ms in pose.timings_ms.items():
+            self.stage_ms[stage].observe(elapsed_ms)
+        self.decode_scales[pose.decode_scale] = self.decode_scales.get(pose.decode_scale, 0) + 1
+        # Hints follow the exercises the session chose, not the default tracked set
+        self.advisor.record(session, session.active_exercises or (), len(contents),
+                            None if pose.reused else sum(pose.timings_ms.values()))
+        if pose.reused:
+            self.motion_gate["reused"] += 1
+            return pose
+        self.motion_gate["inferred"] += 1
+        self.roi_modes[pose.roi_mode] = self.roi_modes.get(pose.roi_mode, 0) + 1
+        # Each run counts against the tier it ran on; only the session's own tier drives its tier changes
+        for tier, elapsed_ms in pose.tier_ms.items():
+            if tier == model_tier:
+                self._tier_controller.record(session, tier, elapsed_ms)
+            else:
+                self._tier_controller.record_tier(tier, elapsed_ms)
+        return pose
+
+    async def process_frame(self, session, contents, timestamp_ms=None):
+        """
+        Process encoded image bytes for a session and return the detection
+        result. `timestamp_ms` is the client's capture time of the frame
+        (receive time when None); time-based detector rules run on it.
+        Group sessions return a result per person (see process_group_frame).
+        """
+        if session.group_tracker is not None:
+            return await self.process_group_frame(session, contents, timestamp_ms)
+        timestamp_ms = frame_timestamp(timestamp_ms)
+        pose = await self.detect_frame(session, contents, timestamp_ms)
+        result = await self.process_landmarks(session, pose.landmarks, timestamp_ms=timestamp_ms,
+                                              reused=pose.reused)
+        result["model_tier"] = pose.model_tier
+        result["capture_hints"] = session.capture_hints
+        return result
+
+    async def process_group_frame(self, session, contents, timestamp_ms=None):
+        """
+        Process a frame of a group session: one inference finds every person,
+        each pose is matched to a track, and every track's detectors run on
+        its own landmarks (all tracks share one detection step). Returns the
+        result of each person seen on the frame under `people`.
+        """
+        timestamp_ms = frame_timestamp(timestamp_ms)
+        tracker = session.group_tracker
+        pose = await self.detect_frame(session, contents, timestamp_ms)
+        if session.closed or session.group_tracker is not tracker:
+            # The session ended or its group mode changed during inference: the poses have no tracks
+            return {"detected": False, "people": [], "model_tier": pose.model_tier,
+                    "capture_hints": session.capture_hints}
+        assigned = tracker.assign(pose.poses or [], session.active_exercises)
+        results = await asyncio.gather(*(
+            self.process_landmarks(track.session, landmarks, timestamp_ms=timestamp_ms, reused=pose.reused)
+            for track, landmarks in assigned
+        ))
+        return {
+            "detected": bool(assigned),
+            "people": [
+                {"track_id": track.track_id, **result} for (track, _), result in zip(assigned, results)
+            ],
+            "model_tier": pose.model_tier,
+            "capture_hints": session.capture_hints,
+        }
+
+    async def process_frame_packed(self, session, contents, encoder, frame_id=None, dropped_frames=0,
+                                   timestamp_ms=None):
+        """
+        Process encoded image bytes and return the result packed by `encoder`
+        (a LandmarkEncoder), skipping the per-landmark JSON objects entirely.
+        """
+        timestamp_ms = frame_timestamp(timestamp_ms)
+        pose = await self.detect_frame(session, contents, timestamp_ms)
+        result = await self.process_landmarks(session, pose.landmarks, include_landmarks=False,
+                                              timestamp_ms=timestamp_ms, reused=pose.reused)
+        detections = result.get("current_detections") or {}
+        started = time.perf_counter()
+        body = encoder.encode(
+            pose.landmarks,
+            result["exercises"],
+            list(detections.values()),
+            MODEL_TIERS.index(pose.model_tier) + 1 if pose.model_tier in MODEL_TIERS else 0,
+            frame_id,
+            dropped_frames,
+        )
+        self.stage_ms["serialize"].observe((time.perf_counter() - started) * 1000)
+        return body
+
+    def encode_json(self, result):
+        """Serialize a result to JSON the way FastAPI's JSONResponse does, timing it"""
+        started = time.perf_counter()
+        body = json.dumps(result, ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+        self.stage_ms["serialize"].observe((time.perf_counter() - started) * 1000)
+        return body
+
+    async def process_landmarks(self, session, landmarks, include_landmarks=True, timestamp_ms=None, reused=False):
+        """
+        Run the session's exercise detectors on a (33, 4) landmark array (or None)
+        captured at `timestamp_ms` (receive time when None).
+        Clients that computed the landmarks themselves pass include_landmarks=False
+        so they are not echoed back. The detectors see the landmarks smoothed
+        (One-Euro filter, cutoff from the active exercises); a gap since the
+        session's previous frame is first filled with predicted frames (counted
+        in `predicted_frames`), and reps they complete are reported with the
+        frame's detections; `reused` frames (the last landmarks again, for a
+        static scene) are never predicted across. Returned landmarks are the
+        unsmoothed ones.
+        Exercises whose landmarks were not visible enough to run are listed in
+        `not_visible`.
+        """
+        timestamp_ms = frame_timestamp(timestamp_ms)
+        exercises = self.active_exercises(session)
+        self.recorder.record(session.session_id, landmarks, exercises, timestamp_ms)
+        self.pose_frames["missing" if landmarks is None else "detected"] += 1
+        predictor = session.landmark_predictor
+        smoother = session.landmark_smoother
+        if landmarks is None:
+            if predictor is not None:
+                predictor.reset()
+            if smoother is not None:
+                smoother.reset()
+            return self._no_pose_result(session, include_landmarks)
+
+        detector_landmarks = landmarks
+        if smoother is not None:
+            cutoff = smoothing_cutoff(tuple(exercises))
+            if cutoff > 0:
+                detector_landmarks = smoother.filter(landmarks, timestamp_ms, cutoff)
+            else:
+                smoother.reset()
+        predicted = []
+        if predictor is not None:
+            if reused:
+                predictor.hold(timestamp_ms)
+            else:
+                predicted = predictor.fill(detector_landmarks, timestamp_ms)
+        self.pose_frames["predicted"] += len(predicted)
+        # Only the session's active detectors run, batched with other sessions' frames
+        completed = {}
+        for frame, frame_timestamp_ms in predicted:
+            flags = await self.detection_batcher.detect(
+                session.exercise_detection, frame, exercises, frame_timestamp_ms
+            )
+            completed = {key: completed.get(key, False) or flag for key, flag in flags.items()}
+        current_detections = await self.detection_batcher.detect(
+            session.exercise_detection, detector_landmarks, exercises, timestamp_ms
+        )
+        if session.closed:
+            # Evicted or ended while the frame was in flight: its detector row is gone
+            return self._no_pose_result(session, include_landmarks)
+        if completed:
+            current_detections = {key: flag or completed[key] for key, flag in current_detections.items()}
+
+        filtered_current_detections = {
+            key: current_detections.get(key, False) for key in self.reported_exercises(session)
+        }
+        visibility = session.exercise_detection.get_visibility()
+
+        result = {
+            "detected": True,
+            "exercises": self.get_counters(session),
+            "current_detections": filtered_current_detections,
+            "not_visible": [key for key in filtered_current_detections if not visibility[key]],
+            "predicted_frames": len(predicted),
+        }
+        if include_landmarks:
+            result["landmarks"] = array_to_json(landmarks)
+        return result
+
+    def _no_pose_result(self, session, include_landmarks):
+        """Result of a frame whose landmarks were not run through the detectors"""
+        result = {
+            "detected": False,
+            "exercises": self.get_counters(session),
+        }
+        if include_landmarks:
+            result["landmarks"] = None
+        return result
+
+    def stats(self):
+        """Get per-stage frame timings, decode scales, crop / full-frame inference, skip and pose-found counts"""
+        frames = self.motion_gate["inferred"] + self.motion_gate["reused"]
+        return {
+            "stages_ms": {stage: histogram.snapshot() for stage, histogram in self.stage_ms.items()},
+            "decode_scales": {str(scale): count for scale, count in sorted(self.decode_scales.items())},
+            "roi_modes": dict(self.roi_modes),
+            "motion_gate": dict(self.motion_gate, skip_rate=self.motion_gate["reused"] / frames if frames else 0.0),
+            "capture": self.advisor.stats(),
+            "pose_frames": dict(self.pose_frames),
+            "detection_batches": self.detection_batcher.stats(),
+        }
+
+
+# Singleton instance
+frame_pipeline = FramePipeline()
+
+
+def _release_session_resources(session):
+    """Release an evicted session's worker-side resources on the worker that holds them"""
+    inference_executor.submit(release_worker_session, session.session_id, shard_key=session.session_id)
+    # Keep what an evicted session recorded so far (compressing it must not block the event loop)
+    recording = frame_pipeline.stop_recording(session)
+    if recording is not None:
+        landmark_recorder.save_in_background(recording)
+
+
+session_registry.add_eviction_listener(_release_session_resources)
@@ -0,0 +1,243 @@
+"""Frame preprocessing: reduced-scale JPEG decode into reusable per-session buffers"""
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import cv2
+from app.config import (
+    FRAME_TARGET_WIDTH, FRAME_BUFFER_SESSIONS, POSE_ROI_ENABLED, POSE_ROI_MARGIN, POSE_ROI_MAX_AREA,
+    MOTION_GATE_ENABLED, MOTION_GATE_PIXEL_DELTA, MOTION_GATE_THRESHOLD, MOTION_GATE_MAX_SKIPPED_FRAMES
+)
+from app.utils.roi import landmark_bounds, expand_roi, roi_area, roi_to_pixels
+
+# libjpeg can decode directly at 1/2, 1/4 and 1/8 scale
+REDUCED_SCALES = {
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+}
+
+# Smallest crop side, as a fraction of the frame, so a far-away pose still gets context
+ROI_MIN_SIZE = 0.2
+
+# Width of the grayscale thumbnail frames are compared on for motion gating
+MOTION_THUMBNAIL_WIDTH = 64
+
+# JPEG start-of-frame markers that carry the image size (all SOFn except DHT, JPG and DAC)
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _supports_rgb_decode():
+    """Check whether this OpenCV build can decode straight to RGB (IMREAD_COLOR_RGB)"""
+    flag = getattr(cv2, "IMREAD_COLOR_RGB", None)
+    if flag is None:
+        return False
+    probe = np.zeros((16, 16, 3), np.uint8)
+    probe[:, :, 2] = 255  # pure red in BGR
+    ok, encoded = cv2.imencode(".jpg", probe)
+    try:
+        decoded = cv2.imdecode(encoded, flag | REDUCED_SCALES[2])
+    except cv2.error:
+        return False
+    # Red must come out in the first channel
+    return ok and decoded is not None and decoded.ndim == 3 and decoded[0, 0, 0] > decoded[0, 0, 2]
+
+
+RGB_DECODE = _supports_rgb_decode()
+
+
+def jpeg_size(data):
+    """Read (width, height) from a JPEG's start-of-frame header without decoding, or None"""
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    index = 2
+    while index + 9 < len(data):
+        if data[index] != 0xFF:
+            return None
+        marker = data[index + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            index += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            # Markers without a length field
+            index += 2
+            continue
+        if marker in SOF_MARKERS:
+            height = (data[index + 5] << 8) | data[index + 6]
+            width = (data[index + 7] << 8) | data[index + 8]
+            return width, height
+        index += 2 + ((data[index + 2] << 8) | data[index + 3])
+    return None
+
+
+def reduced_scale(width, target_width):
+    """Largest libjpeg scale factor that still decodes at least `target_width` pixels wide"""
+    for scale in REDUCED_SCALES:
+        if width // scale >= target_width:
+            return scale
+    return 1
+
+
+class FrameBuffers:
+    """Destination buffers, tracked crop region and motion gate state reused across one session's frames"""
+
+    def __init__(self):
+        # Held while a frame is decoded into the buffers and run through the model
+        self.lock = threading.Lock()
+        # Normalized (x0, y0, x1, y1) crop for the next frame, None for the full frame
+        self.roi = None
+        # Thumbnail of the last frame that ran inference, its (landmarks, tier, presence, poses), static frames since
+        self.motion_reference = None
+        self.last_pose = None
+        self.static_frames = 0
+        self._arrays = {}
+
+    def get(self, name, shape):
+        """Get a uint8 buffer of `shape`, reallocating only when the frame size changes"""
+        array = self._arrays.get(name)
+        if array is None or array.shape != shape:
+            array = np.empty(shape, dtype=np.uint8)
+            self._arrays[name] = array
+        return array
+
+
+class FramePreprocessor:
+    """
+    Turns encoded frame bytes into the RGB image fed to the pose model.
+    JPEGs wider than the target are decoded directly at 1/2, 1/4 or 1/8 scale,
+    decoded straight to RGB when OpenCV supports it, and resized / converted
+    into per-session buffers that are reused across frames.
+    """
+
+    def __init__(self, target_width=FRAME_TARGET_WIDTH, max_buffer_sessions=FRAME_BUFFER_SESSIONS,
+                 roi_enabled=POSE_ROI_ENABLED, roi_margin=POSE_ROI_MARGIN, roi_max_area=POSE_ROI_MAX_AREA,
+                 motion_gate_enabled=MOTION_GATE_ENABLED, motion_pixel_delta=MOTION_GATE_PIXEL_DELTA,
+                 motion_threshold=MOTION_GATE_THRESHOLD, motion_max_skipped=MOTION_GATE_MAX_SKIPPED_FRAMES):
+        self.target_width = target_width
+        self.max_buffer_sessions = max_buffer_sessions
+        self.roi_enabled = roi_enabled
+        self.roi_margin = roi_margin
+        self.roi_max_area = roi_max_area
+        self.motion_gate_enabled = motion_gate_enabled
+        self.motion_pixel_delta = motion_pixel_delta
+        self.motion_threshold = motion_threshold
+        self.motion_max_skipped = motion_max_skipped
+        self._buffers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def buffers_for(self, session_id):
+        """Get the session's buffers (least recently used sessions lose theirs past the limit)"""
+        with self._lock:
+            buffers = self._buffers.get(session_id)
+            if buffers is None:
+                buffers = FrameBuffers()
+                self._buffers[session_id] = buffers
+                while len(self._buffers) > self.max_buffer_sessions:
+                    self._buffers.popitem(last=False)
+            else:
+                self._buffers.move_to_end(session_id)
+            return buffers
+
+    def release(self, session_id):
+        """Drop a session's buffers"""
+        with self._lock:
+            self._buffers.pop(session_id, None)
+
+    def preprocess(self, contents, buffers, timings):
+        """
+        Decode `contents` into an RGB uint8 image at most `target_width` wide.
+        Per-stage times in milliseconds are written to `timings`.
+        Returns (image, decode scale); the image is None when the bytes are not
+        a decodable image.
+        """
+        started = time.perf_counter()
+        size = jpeg_size(contents)
+        scale = reduced_scale(size[0], self.target_width) if size else 1
+        flags = cv2.IMREAD_IGNORE_ORIENTATION
+        if scale > 1:
+            flags |= REDUCED_SCALES[scale]
+        # The reduced grayscale flags plus a color flag give a reduced color decode
+        flags |= cv2.IMREAD_COLOR_RGB if RGB_DECODE else cv2.IMREAD_COLOR
+        img = cv2.imdecode(np.frombuffer(contents, np.uint8), flags)
+        now = time.perf_counter()
+        timings["decode"] = (now - started) * 1000
+        if img is None:
+            return None, scale
+
+        # Resize into the session's buffer when the decoded frame is still too wide
+        height, width = img.shape[:2]
+        if width > self.target_width:
+            new_height = int(height * self.target_width / width)
+            resized = buffers.get("resized", (new_height, self.target_width, 3))
+            cv2.resize(img, (self.target_width, new_height), dst=resized, interpolation=cv2.INTER_LINEAR)
+            img = resized
+        started, now = now, time.perf_counter()
+        timings["resize"] = (now - started) * 1000
+
+        if not RGB_DECODE:
+            rgb = buffers.get("rgb", img.shape)
+            cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=rgb)
+            img = rgb
+        timings["color"] = (time.perf_counter() - now) * 1000
+        return img, scale
+
+    def is_static(self, image, buffers, timings):
+        """
+        Compare a downsampled grayscale copy of the frame with the last frame
+        that ran inference. Returns True when too few pixels changed for the
+        pose to have moved, so the last landmarks can be reused; after
+        `motion_max_skipped` static frames in a row the frame counts as moved.
+        Otherwise the frame becomes the new reference.
+        """
+        if not self.motion_gate_enabled:
+            return False
+        started = time.perf_counter()
+        height, width = image.shape[:2]
+        size = (MOTION_THUMBNAIL_WIDTH, max(1, round(height * MOTION_THUMBNAIL_WIDTH / width)))
+        thumbnail = buffers.get("motion", (size[1], size[0], 3))
+        cv2.resize(image, size, dst=thumbnail, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(thumbnail, cv2.COLOR_RGB2GRAY)
+        reference = buffers.motion_reference
+        static = (
+            reference is not None
+            and reference.shape == gray.shape
+            and buffers.static_frames < self.motion_max_skipped
+            and np.count_nonzero(cv2.absdiff(gray, reference) > self.motion_pixel_delta)
+            < self.motion_threshold * gray.size
+        )
+        if static:
+            buffers.static_frames += 1
+        else:
+            buffers.static_frames = 0
+            buffers.motion_reference = gray
+        timings["motion"] = (time.perf_counter() - started) * 1000
+        return static
+
+    def crop(self, image, buffers, timings):
+        """
+        Crop an image to the session's tracked region of interest.
+        Returns (crop, normalized crop box), or (None, None) when there is no
+        region to crop to and the full frame should be used.
+        """
+        if buffers.roi is None:
+            return None, None
+        started = time.perf_counter()
+        height, width = image.shape[:2]
+        x0, y0, x1, y1 = roi_to_pixels(buffers.roi, width, height)
+        # MediaPipe needs a contiguous image; the crop is much smaller than the frame
+        cropped = np.ascontiguousarray(image[y0:y1, x0:x1])
+        timings["crop"] = (time.perf_counter() - started) * 1000
+        return cropped, (x0 / width, y0 / height, x1 / width, y1 / height)
+
+    def track(self, buffers, landmarks):
+        """Set the next frame's crop from this frame's full-frame landmarks (None = tracking lost)"""
+        if not self.roi_enabled or landmarks is None:
+            buffers.roi = None
+            return
+        roi = expand_roi(landmark_bounds(landmarks), self.roi_margin, ROI_MIN_SIZE)
+        buffers.roi = roi if roi_area(roi) <= self.roi_max_area else None
+
+
+# Singleton instance
+frame_preprocessor = FramePreprocessor()
@@ -0,0 +1,106 @@
+"""Stable track ids for the people of a group session, one camera for several people"""
+from collections import OrderedDict
+from app.config import GROUP_TRACK_MIN_IOU, GROUP_TRACK_MAX_MISSED_FRAMES, GROUP_MAX_FINISHED_TRACKS
+from app.services.session_registry import ExerciseSession
+from app.utils.roi import landmark_bounds, box_iou
+
+
+class Track:
+    """One person of a group: their landmark box and their own exercise session state"""
+
+    def __init__(self, track_id, session, bounds):
+        self.track_id = track_id
+        self.session = session
+        self.bounds = bounds
+        self.missed = 0
+
+
+class GroupTracker:
+    """
+    Assigns the poses detected on each frame of a group session to tracks.
+    A pose continues the track whose landmark box overlaps it most (IoU of at
+    least `min_iou`, greedy, best pairs first); other poses start new tracks.
+    Each track has its own ExerciseSession (detector row, smoothing,
+    prediction) so people are counted separately. Tracks that match no pose
+    for `max_missed` frames are closed; their final counts are kept: per
+    track for the last `max_finished` of them, summed over all of them in
+    `finished_total`.
+    """
+
+    def __init__(self, session_id, max_people, min_iou=GROUP_TRACK_MIN_IOU,
+                 max_missed=GROUP_TRACK_MAX_MISSED_FRAMES, max_finished=GROUP_MAX_FINISHED_TRACKS):
+        self.session_id = session_id
+        self.max_people = max_people
+        self.min_iou = min_iou
+        self.max_missed = max_missed
+        self.max_finished = max_finished
+        self.tracks = {}
+        # Counters of the most recently closed tracks, by track id, oldest first
+        self.finished = OrderedDict()
+        # Counters of every closed track, summed
+        self.finished_total = {}
+        self._next_id = 1
+
+    def assign(self, poses, active_exercises=None):
+        """
+        Match a frame's poses ((33, 4) arrays) to tracks; returns (track, landmarks)
+        pairs for every pose. New tracks run `active_exercises`.
+        """
+        bounds = [landmark_bounds(landmarks) for landmarks in poses]
+        pairs = sorted(
+            ((box_iou(track.bounds, box), track_id, index)
+             for track_id, track in self.tracks.items() for index, box in enumerate(bounds)),
+            reverse=True,
+        )
+        matched = {}
+        for iou, track_id, index in pairs:
+            if iou < self.min_iou:
+                break
+            if index not in matched and track_id not in matched.values():
+                matched[index] = track_id
+
+        assigned = []
+        for index, landmarks in enumerate(poses):
+            track = self.tracks.get(matched.get(index))
+            if track is None:
+                track = self._start(bounds[index], active_exercises)
+            track.bounds = bounds[index]
+            track.missed = 0
+            assigned.append((track, landmarks))
+
+        seen = {track.track_id for track, _ in assigned}
+        for track_id in [track_id for track_id in self.tracks if track_id not in seen]:
+            track = self.tracks[track_id]
+            track.missed += 1
+            if track.missed > self.max_missed:
+                self._finish(track_id)
+        return assigned
+
+    def _start(self, bounds, active_exercises):
+        """Open a track with a fresh exercise session"""
+        track_id = self._next_id
+        self._next_id += 1
+        session = ExerciseSession(f"{self.session_id}/{track_id}")
+        session.active_exercises = active_exercises
+        track = self.tracks[track_id] = Track(track_id, session, bounds)
+        return track
+
+    def _finish(self, track_id):
+        """Close a track, keeping its counts"""
+        track = self.tracks.pop(track_id)
+        counters = track.session.exercise_detection.get_counters()
+        track.session.close()
+        for key, count in counters.items():
+            self.finished_total[key] = self.finished_total.get(key, 0) + count
+        self.finished[track_id] = counters
+        while len(self.finished) > self.max_finished:
+            self.finished.popitem(last=False)
+
+    def sessions(self):
+        """Exercise sessions of the open tracks"""
+        return [track.session for track in self.tracks.values()]
+
+    def close(self):
+        """Close every track (the group session ended)"""
+        for track_id in list(self.tracks):
+            self._finish(track_id)
@@ -0,0 +1,156 @@
+"""Executor that runs pose inference off the event loop"""
+import asyncio
+import multiprocessing
+import zlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from app.config import INFERENCE_EXECUTOR, INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE
+
+
+class InferenceQueueFullError(RuntimeError):
+    """Raised when the inference queue is at capacity"""
+
+
+class InferenceExecutor:
+    """
+    Bounded executor for CPU-heavy inference work.
+    Each worker is a shard running one job at a time: a thread in "thread"
+    mode, a single process in "process" mode. Jobs with the same shard key
+    (the session id) always land on the same worker, so a session's frames
+    reach its VIDEO-mode landmarker in order and per-session tracking state
+    inside the worker stays consistent.
+    """
+
+    def __init__(self, kind=INFERENCE_EXECUTOR, workers=INFERENCE_WORKERS, queue_size=INFERENCE_QUEUE_SIZE):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown inference executor kind: {kind}")
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self._executors = []
+
+    def start(self, initializer=None):
+        """Create the worker pool; `initializer` runs once per worker process (or once in thread mode)"""
+        if self._executors:
+            return
+        if self.kind == "thread":
+            if initializer is not None:
+                initializer()
+            self._executors = [
+                ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"inference-{index}")
+                for index in range(self.workers)
+            ]
+        else:
+            # Spawn so workers never inherit MediaPipe graph threads from the parent
+            context = multiprocessing.get_context("spawn")
+            self._executors = [
+                ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=initializer)
+                for _ in range(self.workers)
+            ]
+
+    def shutdown(self):
+        """Stop the worker pool"""
+        for executor in self._executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._executors = []
+
+    @property
+    def queue_depth(self):
+        """Jobs waiting for a free worker"""
+        return max(0, self.in_flight - self.workers)
+
+    def has_capacity(self, pending=0):
+        """Whether one more job fits, counting `pending` jobs that are admitted but not yet submitted"""
+        return self.in_flight + pending < self.workers + self.queue_size
+
+    def reject(self):
+        """Count a rejected job and raise InferenceQueueFullError"""
+        self.rejected += 1
+        raise InferenceQueueFullError("Inference queue is full")
+
+    async def run(self, fn, *args, shard_key=None, weight=1, admitted=False):
+        """
+        Run `fn(*args)` on the pool, raising InferenceQueueFullError when the queue is full.
+        `weight` is the number of frames the job carries (batched jobs carry several);
+        `admitted` skips the capacity check for frames the caller already admitted.
+        """
+        if not admitted and not self.has_capacity():
+            self.reject()
+        if not self._executors:
+            self.start()
+
+        self.in_flight += weight
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor_for(shard_key), fn, *args)
+        finally:
+            self.in_flight -= weight
+            self.completed += weight
+
+    def submit(self, fn, *args, shard_key=None):
+        """Schedule `fn(*args)` without waiting for it (housekeeping jobs, not counted in the queue)"""
+        if not self._executors:
+            self.start()
+        return self._executor_for(shard_key).submit(fn, *args)
+
+    async def broadcast(self, fn, *args):
+        """Run `fn(*args)` once on every worker process (once in thread mode) and return the results"""
+        if not self._executors:
+            self.start()
+        # Thread shards share the process state, one call sees all of it
+        executors = self._executors if self.kind == "process" else self._executors[:1]
+        loop = asyncio.get_running_loop()
+        return await asyncio.gather(*[
+            loop.run_in_executor(executor, fn, *args) for executor in executors
+        ])
+
+    def stats(self):
+        """Get executor statistics"""
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def split_batch(self, shard_keys):
+        """
+        Split a batch into groups of indices that each run as one job: items
+        are grouped by the shard that owns their key.
+        """
+        groups = {}
+        for index, shard_key in enumerate(shard_keys):
+            groups.setdefault(self._shard_index(shard_key), []).append(index)
+        return list(groups.values())
+
+    def _shard_index(self, shard_key):
+        """Map a shard key to a process shard"""
+        if shard_key is None:
+            return 0
+        return zlib.crc32(shard_key.encode()) % self.workers
+
+    def _executor_for(self, shard_key):
+        """Pick the executor for a shard key"""
+        if len(self._executors) == 1:
+            return self._executors[0]
+        return self._executors[self._shard_index(shard_key)]
+
+
+def run_batch(calls):
+    """Run (fn, args) calls in order inside one worker job, returning each result or exception"""
+    results = []
+    for fn, args in calls:
+        try:
+            results.append(fn(*args))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+# Singleton instance
+inference_executor = InferenceExecutor()
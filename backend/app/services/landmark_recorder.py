@@ -0,0 +1,231 @@
+"""Record per-frame session landmarks to disk for offline detector replay"""
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import NamedTuple
+import numpy as np
+from app.config import LANDMARK_RECORDING_DIR, LANDMARK_RECORDING_MAX_FRAMES, LANDMARK_RECORDING_MAX_SESSIONS
+from app.services.exercise_detection import EXERCISES
+from app.utils.landmarks import NUM_LANDMARKS
+
+RECORDING_VERSION = 1
+RECORDING_SUFFIX = ".npz"
+
+
+class RecordingLimitError(RuntimeError):
+    """Raised when LANDMARK_RECORDING_MAX_SESSIONS sessions are already being recorded"""
+
+
+class Recording(NamedTuple):
+    """
+    A recorded session, as stored in a compressed .npz file:
+    landmarks (n, 33, 4) float32 (zeros where no pose was found), present (n,)
+    bool, timestamps_ms (n,) float64 capture times since the first frame,
+    active (n,) uint32 bit mask of the detectors that ran (bit i =
+    meta["exercises"][i]), and meta (version, session id, name, start time,
+    exercises, ground_truth, live_counts).
+    """
+    landmarks: np.ndarray
+    present: np.ndarray
+    timestamps_ms: np.ndarray
+    active: np.ndarray
+    meta: dict
+
+    def active_exercises(self, index):
+        """Detector keys that ran on frame `index`"""
+        mask = int(self.active[index])
+        return tuple(name for bit, name in enumerate(self.meta["exercises"]) if mask >> bit & 1)
+
+
+def save_recording(path, recording):
+    """Write a Recording as a compressed .npz file (`path` or an open binary file)"""
+    np.savez_compressed(
+        path,
+        landmarks=recording.landmarks,
+        present=recording.present,
+        timestamps_ms=recording.timestamps_ms,
+        active=recording.active,
+        meta=np.array(json.dumps(recording.meta)),
+    )
+
+
+def load_recording(path):
+    """Read a Recording written by save_recording"""
+    with np.load(path) as data:
+        meta = json.loads(str(data["meta"]))
+        if meta.get("version") != RECORDING_VERSION:
+            raise ValueError(f"{path}: unsupported recording version {meta.get('version')!r}")
+        return Recording(data["landmarks"], data["present"], data["timestamps_ms"], data["active"], meta)
+
+
+class _RecordingBuffer:
+    """Frames of one session collected in memory until the recording stops"""
+
+    def __init__(self, session_id, name):
+        self.session_id = session_id
+        self.name = name
+        self.started_at = datetime.now(timezone.utc)
+        self.start = None
+        self.landmarks = []
+        self.present = []
+        self.timestamps_ms = []
+        self.active = []
+
+
+class LandmarkRecorder:
+    """
+    Captures the landmarks of selected sessions (the pose of every frame
+    plus the detectors that ran on it) and writes each recording to
+    `directory` when it stops, for replay with `python -m benchmarks.replay`.
+    Recordings stop taking frames after `max_frames`; at most `max_sessions`
+    sessions are recorded at once. A recording never overwrites an existing
+    file: a taken name gets a numeric suffix.
+    """
+
+    def __init__(self, directory=LANDMARK_RECORDING_DIR, max_frames=LANDMARK_RECORDING_MAX_FRAMES,
+                 max_sessions=LANDMARK_RECORDING_MAX_SESSIONS):
+        self.directory = directory
+        self.max_frames = max_frames
+        self.max_sessions = max_sessions
+        self.saved_count = 0
+        self._buffers = {}
+        self._masks = {}
+        self._lock = threading.Lock()
+        # Background saves still running (keeps the tasks referenced)
+        self._save_tasks = set()
+
+    def start(self, session_id, name=None):
+        """
+        Start (or restart, discarding frames so far) recording a session; returns
+        the recording name. Raises RecordingLimitError when `max_sessions` other
+        sessions are being recorded.
+        """
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        name = re.sub(r"[^A-Za-z0-9_.-]+", "_", name or f"{session_id}-{stamp}")[:100]
+        with self._lock:
+            if session_id not in self._buffers and len(self._buffers) >= self.max_sessions:
+                raise RecordingLimitError(f"{self.max_sessions} sessions are already being recorded")
+            self._buffers[session_id] = _RecordingBuffer(session_id, name)
+        return name
+
+    def is_recording(self, session_id):
+        """Whether a session is being recorded"""
+        return session_id in self._buffers
+
+    def record(self, session_id, landmarks, exercises, timestamp_ms=None):
+        """
+        Add one frame of a session (landmarks: (33, 4) array or None), captured
+        at `timestamp_ms` (now when None), if it is being recorded
+        """
+        buffer = self._buffers.get(session_id)
+        if buffer is None or len(buffer.present) >= self.max_frames:
+            return
+        if timestamp_ms is None:
+            timestamp_ms = time.monotonic() * 1000
+        with self._lock:
+            if buffer.start is None:
+                buffer.start = timestamp_ms
+            buffer.timestamps_ms.append(timestamp_ms - buffer.start)
+            buffer.present.append(landmarks is not None)
+            buffer.landmarks.append(landmarks)
+            buffer.active.append(self._mask(exercises))
+
+    def _mask(self, exercises):
+        """Bit mask of a tuple of detector keys (cached per tuple)"""
+        mask = self._masks.get(exercises)
+        if mask is None:
+            mask = sum(1 << EXERCISES.index(name) for name in exercises)
+            self._masks[exercises] = mask
+        return mask
+
+    def stop(self, session_id, ground_truth=None, live_counts=None):
+        """
+        Stop recording a session and return its Recording (None if it was not
+        being recorded). `ground_truth` are labeled rep counts per detector key,
+        `live_counts` the counts the live detectors reached.
+        """
+        with self._lock:
+            buffer = self._buffers.pop(session_id, None)
+        if buffer is None:
+            return None
+        empty = np.zeros((NUM_LANDMARKS, 4), dtype=np.float32)
+        landmarks = np.array(
+            [frame if frame is not None else empty for frame in buffer.landmarks], dtype=np.float32
+        ).reshape(-1, NUM_LANDMARKS, 4)
+        meta = {
+            "version": RECORDING_VERSION,
+            "session_id": buffer.session_id,
+            "name": buffer.name,
+            "started_at": buffer.started_at.isoformat(),
+            "exercises": list(EXERCISES),
+            "ground_truth": dict(ground_truth or {}),
+            "live_counts": dict(live_counts or {}),
+        }
+        return Recording(
+            landmarks,
+            np.array(buffer.present, dtype=bool),
+            np.array(buffer.timestamps_ms, dtype=np.float64),
+            np.array(buffer.active, dtype=np.uint32),
+            meta,
+        )
+
+    def save(self, recording):
+        """
+        Write a recording into the recording directory and return its path.
+        When its name is taken the first free "<name>-<n>" is used instead
+        (meta["name"] is updated to match).
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        base = name = recording.meta["name"]
+        suffix = 1
+        while True:
+            path = os.path.join(self.directory, name + RECORDING_SUFFIX)
+            try:
+                # Exclusive create, so concurrent saves can't take the same file
+                file = open(path, "xb")
+                break
+            except FileExistsError:
+                suffix += 1
+                name = f"{base}-{suffix}"
+        recording.meta["name"] = name
+        with file:
+            save_recording(file, recording)
+        self.saved_count += 1
+        print(f"Saved landmark recording {path} ({len(recording.present)} frames)")
+        return path
+
+    def save_in_background(self, recording):
+        """
+        Save a recording without blocking the caller: on a worker thread when
+        called from the event loop, right away otherwise
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.save(recording)
+            return
+        task = loop.create_task(asyncio.to_thread(self.save, recording))
+        self._save_tasks.add(task)
+        task.add_done_callback(self._save_done)
+
+    def _save_done(self, task):
+        """Drop a finished background save, reporting a failure nothing else would see"""
+        self._save_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Saving landmark recording failed: {task.exception()!r}")
+
+    def stats(self):
+        """Get recorder statistics"""
+        return {
+            "directory": self.directory,
+            "recording_sessions": len(self._buffers),
+            "saved_recordings": self.saved_count,
+        }
+
+
+# Singleton instance
+landmark_recorder = LandmarkRecorder()
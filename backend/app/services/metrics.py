@@ -0,0 +1,60 @@
+"""Prometheus metrics of the frame pipeline, inference and sessions"""
+from app.services.capture_advisor import capture_advisor
+from app.services.frame_pipeline import frame_pipeline
+from app.services.inference_executor import inference_executor
+from app.services.landmark_recorder import landmark_recorder
+from app.services.pose_detection import inference_scheduler
+from app.services.session_registry import session_registry
+from app.utils.metrics import MetricsRegistry
+
+# Latency buckets of HTTP requests; survey / workout generation / TTS calls reach several seconds
+REQUEST_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+# Singleton instance
+metrics_registry = MetricsRegistry()
+
+
+def _register_app_metrics(registry):
+    """Expose the counters and histograms the services already keep"""
+    for stage, histogram in frame_pipeline.stage_ms.items():
+        registry.histogram(
+            "hiit_frame_stage_seconds",
+            "Time per frame stage (detect_exercises: per detection step, shared by its frames)",
+            histogram, {"stage": stage}, scale=0.001,
+        )
+    for pose in frame_pipeline.pose_frames:
+        registry.counter(
+            "hiit_frames_total", "Frames run through the exercise detectors: pose detected, missing, or predicted for a gap",
+            lambda pose=pose: frame_pipeline.pose_frames[pose], {"pose": pose},
+        )
+    for decision in frame_pipeline.motion_gate:
+        registry.counter(
+            "hiit_motion_gate_frames_total",
+            "Camera frames that ran pose inference, or reused the last landmarks because they were static",
+            lambda decision=decision: frame_pipeline.motion_gate[decision], {"decision": decision},
+        )
+    registry.counter("hiit_detection_steps_total", "Vectorized exercise detection steps",
+                     lambda: frame_pipeline.detection_batcher.steps)
+    registry.gauge("hiit_capture_capacity_fps", "Camera frames per second the workers can take at the measured worker time",
+                   capture_advisor.capacity_fps)
+    registry.gauge("hiit_streaming_sessions", "Sessions that sent a camera frame in the last advisor window",
+                   lambda: capture_advisor.streaming_sessions)
+    registry.gauge("hiit_active_sessions", "Live exercise sessions", lambda: len(session_registry))
+    registry.counter("hiit_evicted_sessions_total", "Sessions evicted as idle or over capacity",
+                     lambda: session_registry.evicted_count)
+    registry.gauge("hiit_recording_sessions", "Sessions whose landmarks are being recorded",
+                   lambda: landmark_recorder.stats()["recording_sessions"])
+
+    registry.gauge("hiit_inference_in_flight", "Inference jobs running or queued", lambda: inference_executor.in_flight)
+    registry.gauge("hiit_inference_queue_depth", "Inference jobs waiting for a worker",
+                   lambda: inference_executor.queue_depth)
+    registry.counter("hiit_inference_completed_total", "Inference jobs completed", lambda: inference_executor.completed)
+    registry.counter("hiit_inference_rejected_total", "Frames rejected because the inference queue was full",
+                     lambda: inference_executor.rejected)
+    registry.histogram("hiit_inference_batch_size", "Frames per dispatched inference batch",
+                       inference_scheduler.batch_sizes)
+    registry.histogram("hiit_inference_queue_wait_seconds", "Time frames wait in the inference scheduler",
+                       inference_scheduler.queue_wait_ms, scale=0.001)
+
+
+_register_app_metrics(metrics_registry)
@@ -0,0 +1,135 @@
+"""Interface of the pose models the frame pipeline can run"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from app.config import POSE_MODEL_TIERS, POSE_DEFAULT_TIER, POSE_RERUN_PRESENCE_THRESHOLD
+
+
+class ModelPool:
+    """
+    Interchangeable models without per-session state, shared by the worker
+    threads: a call takes any idle model and another is loaded while all are
+    busy, up to `size`. Loading runs outside the pool lock, so callers of
+    loaded models are not held up by it.
+    """
+
+    def __init__(self, load, size):
+        self.size = max(1, size)
+        self._load = load
+        self._idle = []
+        self._loaded = 0  # models loaded or loading
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        return self._loaded
+
+    @contextmanager
+    def acquire(self):
+        """Hold an idle model (loading one if the pool has room, waiting otherwise) for the with-block"""
+        with self._condition:
+            while not self._idle and self._loaded >= self.size:
+                self._condition.wait()
+            model = self._idle.pop() if self._idle else None
+            if model is None:
+                self._loaded += 1
+        if model is None:
+            try:
+                model = self._load()
+            except Exception:
+                with self._condition:
+                    self._loaded -= 1
+                    self._condition.notify()
+                raise
+        try:
+            yield model
+        finally:
+            with self._condition:
+                self._idle.append(model)
+                self._condition.notify()
+
+    def warm_up(self):
+        """Load the first model now instead of on the first frame"""
+        with self.acquire():
+            pass
+
+
+class PoseBackend(ABC):
+    """
+    A pose model run on RGB frames inside the inference workers.
+    Backends return every pose as a (33, 4) float32 array of normalized x, y,
+    z, visibility in MediaPipe landmark order, so ROI tracking, smoothing and
+    the exercise detectors work the same whichever model produced them.
+    Tiers (lite, full, heavy) are the backend's models from fastest to most
+    accurate; sessions move between them (ModelTierController). Presence is
+    on each backend's own scale, so each has its own `rerun_threshold`.
+    """
+
+    name = None
+    # Whether the backend tracks each session's pose across its frames itself; otherwise the
+    # frame pipeline crops frames to the previous pose (POSE_ROI_*)
+    tracks_pose = False
+
+    def __init__(self, tiers=POSE_MODEL_TIERS, default_tier=POSE_DEFAULT_TIER,
+                 rerun_threshold=POSE_RERUN_PRESENCE_THRESHOLD):
+        self.tiers = list(tiers) or ["full"]
+        self.default_tier = default_tier if default_tier in self.tiers else self.tiers[len(self.tiers) // 2]
+        self.rerun_threshold = rerun_threshold
+
+    def warm_up(self):
+        """Load the default tier's model now instead of on the first frame"""
+
+    def next_tier(self, tier, step):
+        """Get the tier `step` places above (positive) or below (negative) `tier`, or None"""
+        index = self.tiers.index(tier) + step
+        if 0 <= index < len(self.tiers):
+            return self.tiers[index]
+        return None
+
+    @abstractmethod
+    def detect(self, rgb_image, session_id=None, tier=None, timestamp_ms=None, num_poses=1):
+        """
+        Detect up to `num_poses` poses in an RGB image of a session, captured
+        at `timestamp_ms`. Returns (list of (33, 4) arrays, mean presence of
+        the first pose or 0 without one).
+        """
+
+    def detect_image(self, rgb_image, tier=None, num_poses=1):
+        """
+        Detect poses in a lone frame, outside any session's video stream (a
+        re-run on another tier); returns the same as detect. Backends without
+        per-session state just run detect.
+        """
+        return self.detect(rgb_image, None, tier, None, num_poses)
+
+    def detect_adaptive(self, rgb_image, session_id=None, tier=None, rerun_threshold=None, timestamp_ms=None,
+                        num_poses=1):
+        """
+        Detect poses on `tier` and, when a pose was found but its presence is below
+        `rerun_threshold` (the backend's own by default), re-run the frame on the next bigger tier as a lone
+        frame, so that tier's session stream is not fed an occasional frame.
+        Frames with no pose at all are not re-run (empty frames are common between sets).
+        Returns (poses, tier used, presence, inference ms per tier run).
+        """
+        tier = tier or self.default_tier
+        if rerun_threshold is None:
+            rerun_threshold = self.rerun_threshold
+        started = time.perf_counter()
+        poses, presence = self.detect(rgb_image, session_id, tier, timestamp_ms, num_poses)
+        tier_ms = {tier: (time.perf_counter() - started) * 1000}
+
+        bigger_tier = self.next_tier(tier, 1)
+        if bigger_tier is not None and 0 < presence < rerun_threshold:
+            started = time.perf_counter()
+            rerun_poses, rerun_presence = self.detect_image(rgb_image, bigger_tier, num_poses)
+            tier_ms[bigger_tier] = (time.perf_counter() - started) * 1000
+            if rerun_presence > presence:
+                return rerun_poses, bigger_tier, rerun_presence, tier_ms
+        return poses, tier, presence, tier_ms
+
+    def release(self, session_id):
+        """Release what the backend holds for a session (nothing by default)"""
+
+    def stats(self):
+        """Get backend statistics"""
+        return {"backend": self.name, "default_tier": self.default_tier}
@@ -1,60 +1,430 @@
-"""MediaPipe pose detection service"""
+"""MediaPipe pose detection service, the configured pose backend and inference scheduling"""
+import asyncio
 import os
+import threading
 import time
 import urllib.request
 import mediapipe as mp
 from mediapipe.tasks import python
 from mediapipe.tasks.python import vision
-from app.config import MODEL_PATH, MODEL_URL
-
-
-class PoseDetectionService:
-    """Service for MediaPipe pose detection"""
-    
-    def __init__(self):
-        self._pose_landmarker = None
-        self._frame_timestamp_ms = int(time.time() * 1000)
-        self._initialize_model()
-    
-    def _initialize_model(self):
-        """Initialize MediaPipe pose landmarker model"""
-        # Download model file if it doesn't exist
-        if not os.path.exists(MODEL_PATH):
+from app.config import (
+    MODEL_PATHS, MODEL_URLS, POSE_MODEL_TIERS, POSE_DEFAULT_TIER, POSE_LATENCY_BUDGET_MS, POSE_RERUN_PRESENCE_THRESHOLD,
+    POSE_POOL_SIZE, INFERENCE_BATCH_WINDOW_MS, INFERENCE_MAX_BATCH_SIZE, DEFAULT_FRAME_INTERVAL_MS, POSE_BACKEND
+)
+from app.services.inference_executor import inference_executor, run_batch
+from app.services.pose_backend import PoseBackend, ModelPool
+from app.services.yolo_pose import YoloPoseBackend
+from app.utils.landmarks import landmarks_to_array
+from app.utils.metrics import Histogram
+
+# Model tier controller tuning
+LATENCY_SMOOTHING = 0.2  # EWMA weight of the newest frame
+TIER_CHANGE_COOLDOWN_FRAMES = 30  # frames between tier changes of one session
+HIGH_LOAD = 1.0  # in-flight jobs per worker above which sessions step down
+LOW_LOAD = 0.5  # in-flight jobs per worker below which sessions may step up
+UPGRADE_HEADROOM = 0.8  # a bigger tier must be expected to fit in this share of the budget
+TIER_LATENCY_MAX_AGE_SECONDS = 60  # older per-tier latency measurements are not trusted
+
+# Histogram buckets for the inference scheduler
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+QUEUE_WAIT_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 250)
+
+
+class PooledLandmarker:
+    """
+    A VIDEO-mode PoseLandmarker with its own lock and monotonic timestamp clock.
+    The clock advances by the real time between frames of the same session
+    (from their capture timestamps), so MediaPipe's tracking and smoothing see
+    the actual frame rate; it always moves forward by at least 1 ms.
+    """
+
+    def __init__(self, index, tier, landmarker, num_poses=1):
+        self.index = index
+        self.tier = tier
+        self.num_poses = num_poses
+        self.sessions = 0
+        self._landmarker = landmarker
+        self._last_timestamp_ms = 0
+        self._last_frame = (None, None)  # (session id, capture timestamp) of the previous frame
+        # The landmarker graph is not thread-safe and VIDEO mode needs increasing timestamps
+        self._lock = threading.Lock()
+
+    def detect(self, mp_image, session_id=None, timestamp_ms=None):
+        """Run pose detection on the next frame of this instance's video stream, captured at `timestamp_ms`"""
+        with self._lock:
+            last_session, last_capture_ms = self._last_frame
+            interval_ms = DEFAULT_FRAME_INTERVAL_MS
+            if timestamp_ms is not None and last_capture_ms is not None and session_id == last_session:
+                interval_ms = timestamp_ms - last_capture_ms
+            self._last_frame = (session_id, timestamp_ms)
+            self._last_timestamp_ms += max(1, int(round(interval_ms)))
+            return self._landmarker.detect_for_video(mp_image, self._last_timestamp_ms)
+
+
+def pose_presence(detection_result):
+    """Mean landmark presence of the first pose (0 when no pose was detected)"""
+    if not detection_result.pose_landmarks:
+        return 0.0
+    landmarks = detection_result.pose_landmarks[0]
+    values = [
+        lm.presence if getattr(lm, "presence", None) is not None else lm.visibility
+        for lm in landmarks
+    ]
+    return sum(values) / len(values)
+
+
+class PoseDetectionService(PoseBackend):
+    """
+    Pose backend running MediaPipe pose detection.
+    Holds a pool of landmarker instances per model tier (lite, full, heavy)
+    and number of poses (1, or more for group sessions).
+    Each session leases one instance of a tier and keeps it while it is active,
+    so its frames form one continuous video stream and MediaPipe can track the
+    pose instead of re-detecting it every frame. Sessions only share an
+    instance once there are more sessions than instances; a session that
+    moves to another tier or pose count returns its old instance, so it only
+    holds one at a time. Lone frames (re-runs on a bigger tier) go to
+    separate IMAGE-mode landmarkers shared by everyone.
+    """
+
+    name = "mediapipe"
+    # VIDEO mode derives each frame's region from the previous frame's landmarks
+    tracks_pose = True
+
+    def __init__(self, pool_size=POSE_POOL_SIZE, tiers=POSE_MODEL_TIERS, default_tier=POSE_DEFAULT_TIER,
+                 rerun_threshold=POSE_RERUN_PRESENCE_THRESHOLD):
+        super().__init__(tiers, default_tier, rerun_threshold)
+        self.pool_size = max(1, pool_size)
+        # (tier, num_poses) -> instances
+        self._instances = {(tier, 1): [] for tier in self.tiers}
+        # (tier, num_poses) -> ModelPool of IMAGE-mode landmarkers
+        self._image_pools = {}
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        """Download every tier's model and load the default tier now instead of on the first frame"""
+        for tier in self.tiers:
+            self._ensure_model_file(tier)
+        with self._lock:
+            if not self._instances[(self.default_tier, 1)]:
+                self._add_instance(self.default_tier, 1)
+
+    def _ensure_model_file(self, tier):
+        """Download a tier's model file if it doesn't exist"""
+        model_path = MODEL_PATHS[tier]
+        if not os.path.exists(model_path):
             try:
-                print("Downloading pose landmarker model...")
-                urllib.request.urlretrieve(MODEL_URL, MODEL_PATH)
+                print(f"Downloading pose landmarker model ({tier})...")
+                urllib.request.urlretrieve(MODEL_URLS[tier], model_path)
                 print("Model downloaded successfully!")
             except Exception as e:
                 print(f"Error downloading model: {e}")
                 print("Please ensure you have an internet connection and try again.")
                 raise
-        
+
+    def _create_landmarker(self, tier, num_poses=1, video=True):
+        """Create a MediaPipe pose landmarker for a model tier, detecting up to `num_poses` people"""
+        self._ensure_model_file(tier)
+
         # Initialize MediaPipe Pose Landmarker
         BaseOptions = mp.tasks.BaseOptions
         PoseLandmarker = vision.PoseLandmarker
         PoseLandmarkerOptions = vision.PoseLandmarkerOptions
         VisionRunningMode = vision.RunningMode
-        
-        # Use VIDEO mode for better performance with sequential frames
+
+        # Use VIDEO mode for better performance with sequential frames, IMAGE mode for lone frames
         options = PoseLandmarkerOptions(
-            base_options=BaseOptions(model_asset_path=MODEL_PATH),
-            running_mode=VisionRunningMode.VIDEO,
-            num_poses=1,
+            base_options=BaseOptions(model_asset_path=MODEL_PATHS[tier]),
+            running_mode=VisionRunningMode.VIDEO if video else VisionRunningMode.IMAGE,
+            num_poses=num_poses,
             min_pose_detection_confidence=0.5,
             min_pose_presence_confidence=0.5,
             min_tracking_confidence=0.5,
             output_segmentation_masks=False
         )
-        
-        self._pose_landmarker = PoseLandmarker.create_from_options(options)
-    
-    def detect_pose(self, mp_image):
-        """Detect pose in a MediaPipe image"""
-        # Increment timestamp for VIDEO mode (~30 FPS)
-        self._frame_timestamp_ms += 33
-        detection_result = self._pose_landmarker.detect_for_video(mp_image, self._frame_timestamp_ms)
-        return detection_result
-
-
-# Singleton instance
-pose_detection_service = PoseDetectionService()
+
+        return PoseLandmarker.create_from_options(options)
+
+    def _add_instance(self, tier, num_poses):
+        """Create a new pooled instance of a tier and pose count (caller holds the lock)"""
+        instances = self._instances.setdefault((tier, num_poses), [])
+        instance = PooledLandmarker(len(instances), tier, self._create_landmarker(tier, num_poses), num_poses)
+        instances.append(instance)
+        return instance
+
+    def lease(self, session_id, tier=None, num_poses=1):
+        """Get the session's instance of a tier and pose count, leasing the least used one if needed"""
+        tier = tier or self.default_tier
+        with self._lock:
+            instance = self._leases.get((session_id, tier, num_poses))
+            if instance is not None:
+                return instance
+
+            # The session moved to another tier or group size: its old landmarkers go back to the pool
+            for key in [key for key in self._leases if key[0] == session_id]:
+                self._leases.pop(key).sessions -= 1
+
+            instances = self._instances.get((tier, num_poses), [])
+            instance = min(instances, key=lambda item: item.sessions, default=None)
+            if instance is None or (instance.sessions > 0 and len(instances) < self.pool_size):
+                instance = self._add_instance(tier, num_poses)
+            instance.sessions += 1
+            self._leases[(session_id, tier, num_poses)] = instance
+            return instance
+
+    def release(self, session_id):
+        """Return all of a session's instances to the pool"""
+        with self._lock:
+            for key in [key for key in self._leases if key[0] == session_id]:
+                self._leases.pop(key).sessions -= 1
+
+    def detect_pose(self, mp_image, session_id=None, tier=None, timestamp_ms=None, num_poses=1):
+        """
+        Detect up to `num_poses` poses in a MediaPipe image (captured at
+        `timestamp_ms`) on the session's leased instance of a tier
+        """
+        return self.lease(session_id, tier, num_poses).detect(mp_image, session_id, timestamp_ms)
+
+    def detect(self, rgb_image, session_id=None, tier=None, timestamp_ms=None, num_poses=1):
+        """Detect up to `num_poses` poses in an RGB image; returns ((33, 4) arrays, presence of the first pose)"""
+        mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_image)
+        result = self.detect_pose(mp_image, session_id, tier, timestamp_ms, num_poses)
+        # Poses as compact arrays (cheap to pass between processes)
+        return [landmarks_to_array(pose) for pose in result.pose_landmarks], pose_presence(result)
+
+    def detect_image(self, rgb_image, tier=None, num_poses=1):
+        """Detect poses in a lone frame on a shared IMAGE-mode landmarker; returns the same as detect"""
+        tier = tier or self.default_tier
+        with self._lock:
+            pool = self._image_pools.get((tier, num_poses))
+            if pool is None:
+                pool = self._image_pools[(tier, num_poses)] = ModelPool(
+                    lambda: self._create_landmarker(tier, num_poses, video=False), self.pool_size
+                )
+        mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_image)
+        with pool.acquire() as landmarker:
+            result = landmarker.detect(mp_image)
+        return [landmarks_to_array(pose) for pose in result.pose_landmarks], pose_presence(result)
+
+    def stats(self):
+        """Get pool statistics"""
+        with self._lock:
+            return {
+                "backend": self.name,
+                "image_landmarkers": {
+                    tier if num_poses == 1 else f"{tier}x{num_poses}": len(pool)
+                    for (tier, num_poses), pool in self._image_pools.items()
+                },
+                "pool_size": self.pool_size,
+                "default_tier": self.default_tier,
+                "leased_sessions": len({key[0] for key in self._leases}),
+                "sessions_per_instance": {
+                    tier if num_poses == 1 else f"{tier}x{num_poses}": [instance.sessions for instance in instances]
+                    for (tier, num_poses), instances in self._instances.items()
+                },
+            }
+
+
+class ModelTierController:
+    """
+    Chooses the model tier for each session's next frame.
+    A session steps down a tier when its smoothed inference latency exceeds the
+    budget or the executor is backed up, and steps back up when the bigger tier
+    is expected to fit the budget and the executor has headroom. Tier changes
+    are rate-limited so sessions don't oscillate.
+    """
+
+    def __init__(self, tiers=POSE_MODEL_TIERS, default_tier=POSE_DEFAULT_TIER,
+                 latency_budget_ms=POSE_LATENCY_BUDGET_MS, executor=inference_executor):
+        self.tiers = list(tiers) or ["full"]
+        self.default_tier = default_tier if default_tier in self.tiers else self.tiers[len(self.tiers) // 2]
+        self.latency_budget_ms = latency_budget_ms
+        self.tier_latency_ms = {}
+        self._tier_measured_at = {}
+        self._executor = executor
+
+    def choose(self, session):
+        """Get the tier to use for the session's next frame"""
+        if session.model_tier not in self.tiers:
+            session.model_tier = self.default_tier
+            session.tier_frames = 0
+        return session.model_tier
+
+    def record_tier(self, tier, inference_ms):
+        """Record one inference run's time on a tier"""
+        previous = self.tier_latency_ms.get(tier, inference_ms)
+        self.tier_latency_ms[tier] = previous + LATENCY_SMOOTHING * (inference_ms - previous)
+        self._tier_measured_at[tier] = time.monotonic()
+
+    def record(self, session, tier, inference_ms):
+        """Record the inference time of a frame on the session's tier and move the session between tiers if needed"""
+        self.record_tier(tier, inference_ms)
+        if session.inference_ms is None:
+            session.inference_ms = inference_ms
+        else:
+            session.inference_ms += LATENCY_SMOOTHING * (inference_ms - session.inference_ms)
+
+        session.tier_frames += 1
+        if session.tier_frames < TIER_CHANGE_COOLDOWN_FRAMES:
+            return
+
+        load = self._executor.in_flight / self._executor.workers
+        index = self.tiers.index(session.model_tier)
+        if index > 0 and (session.inference_ms > self.latency_budget_ms or load > HIGH_LOAD):
+            self._move(session, self.tiers[index - 1])
+        elif index < len(self.tiers) - 1 and load < LOW_LOAD:
+            bigger_tier = self.tiers[index + 1]
+            expected_ms = self._expected_latency_ms(bigger_tier, session.inference_ms)
+            if expected_ms < self.latency_budget_ms * UPGRADE_HEADROOM:
+                self._move(session, bigger_tier)
+
+    def _expected_latency_ms(self, tier, current_ms):
+        """Expected latency of a bigger tier, from a recent measurement if there is one"""
+        measured_at = self._tier_measured_at.get(tier)
+        if measured_at is not None and time.monotonic() - measured_at < TIER_LATENCY_MAX_AGE_SECONDS:
+            return self.tier_latency_ms[tier]
+        # Without a recent measurement assume the bigger model costs about twice as much
+        return current_ms * 2
+
+    def _move(self, session, tier):
+        """Switch a session to another tier and restart its cooldown"""
+        session.model_tier = tier
+        session.inference_ms = self.tier_latency_ms.get(tier)
+        session.tier_frames = 0
+
+    def stats(self):
+        """Get controller statistics"""
+        return {
+            "tiers": self.tiers,
+            "default_tier": self.default_tier,
+            "latency_budget_ms": self.latency_budget_ms,
+            "tier_latency_ms": dict(self.tier_latency_ms),
+        }
+
+
+class InferenceScheduler:
+    """
+    Micro-batching front end for the inference executor.
+    Frames submitted by different sessions within `window_ms` are collected and
+    dispatched as one batch: the batch is split into at most one job per worker
+    (per shard in process mode), each job runs its frames back to back, and the
+    results are fanned back out to the waiting requests. Batch sizes and the
+    time frames spent waiting in the scheduler are recorded as histograms.
+    """
+
+    def __init__(self, executor=inference_executor, window_ms=INFERENCE_BATCH_WINDOW_MS,
+                 max_batch_size=INFERENCE_MAX_BATCH_SIZE):
+        self.window_ms = window_ms
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_ms = Histogram(QUEUE_WAIT_BUCKETS_MS)
+        self._executor = executor
+        self._pending = []
+        self._flush_handle = None
+        # Running batch jobs, referenced until done so they are not garbage collected
+        self._tasks = set()
+
+    async def submit(self, fn, *args, shard_key=None):
+        """Run `fn(*args)` on the executor as part of the next batch and return its result"""
+        if self.window_ms <= 0:
+            return await self._executor.run(fn, *args, shard_key=shard_key)
+        if not self._executor.has_capacity(len(self._pending)):
+            self._executor.reject()
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((fn, args, shard_key, future, time.perf_counter()))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window_ms / 1000, self._flush)
+        return await future
+
+    def _flush(self):
+        """Dispatch everything collected so far"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        now = time.perf_counter()
+        self.batch_sizes.observe(len(batch))
+        for _, _, _, _, enqueued_at in batch:
+            self.queue_wait_ms.observe((now - enqueued_at) * 1000)
+
+        for indices in self._executor.split_batch([item[2] for item in batch]):
+            task = asyncio.ensure_future(self._run_group([batch[index] for index in indices]))
+            self._tasks.add(task)
+            task.add_done_callback(self._task_done)
+
+    def _task_done(self, task):
+        """Drop a finished batch job, reporting a failure nothing else would see"""
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Inference batch job failed: {task.exception()!r}")
+
+    async def _run_group(self, group):
+        """Run one group of the batch as a single executor job and resolve its futures"""
+        calls = [(fn, args) for fn, args, _, _, _ in group]
+        try:
+            results = await self._executor.run(
+                run_batch, calls, shard_key=group[0][2], weight=len(group), admitted=True
+            )
+        except Exception as e:
+            results = [e] * len(group)
+
+        for (_, _, _, future, _), result in zip(group, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        """Get scheduler statistics"""
+        return {
+            "window_ms": self.window_ms,
+            "max_batch_size": self.max_batch_size,
+            "pending": len(self._pending),
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+        }
+
+
+# Pose backends by POSE_BACKEND name
+POSE_BACKENDS = {
+    PoseDetectionService.name: PoseDetectionService,
+    YoloPoseBackend.name: YoloPoseBackend,
+}
+
+
+def create_pose_backend(name=POSE_BACKEND, **kwargs):
+    """Create the pose backend registered under `name`; raises ValueError for unknown names"""
+    if name not in POSE_BACKENDS:
+        raise ValueError(f"Unknown pose backend {name}, expected one of: {', '.join(POSE_BACKENDS)}")
+    return POSE_BACKENDS[name](**kwargs)
+
+
+# Singleton instances
+pose_backend = create_pose_backend()
+model_tier_controller = ModelTierController()
+inference_scheduler = InferenceScheduler()
+
+
+def warm_up_pose_model():
+    """Load this process's pose model (used as the inference worker initializer)"""
+    pose_backend.warm_up()
+
+
+def release_pose_session(session_id):
+    """Release a session's pose model lease in this process"""
+    pose_backend.release(session_id)
+
+
+def get_pose_stats():
+    """Get this process's pose backend statistics"""
+    return pose_backend.stats()
@@ -0,0 +1,155 @@
+"""Per-session exercise state registry"""
+import threading
+import time
+from collections import OrderedDict
+from app.config import (
+    SESSION_MAX_COUNT, SESSION_IDLE_TIMEOUT_SECONDS,
+    LANDMARK_PREDICTION_ENABLED, LANDMARK_PREDICTION_MIN_INTERVAL_MS, LANDMARK_PREDICTION_MAX_GAP_MS,
+    LANDMARK_SMOOTHING_ENABLED, LANDMARK_SMOOTHING_BETA, LANDMARK_SMOOTHING_DERIVATIVE_CUTOFF_HZ
+)
+from app.services.exercise_detection import ExerciseDetectionService
+from app.utils.landmark_prediction import LandmarkPredictor
+from app.utils.landmark_smoothing import OneEuroFilter
+
+# Session used by clients that do not send a session id
+DEFAULT_SESSION_ID = "default"
+
+
+class ExerciseSession:
+    """State owned by a single workout session"""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.exercise_detection = ExerciseDetectionService()
+        # Detector keys run on each frame; None runs the default tracked exercises
+        self.active_exercises = None
+        # Pose model tier chosen for this session and its smoothed inference time
+        self.model_tier = None
+        self.inference_ms = None
+        self.tier_frames = 0
+        # Encoder of binary /process-frame responses (keeps the delta base between requests)
+        self.landmark_encoder = None
+        # Capture rate / width / JPEG quality recommended to the client, and the quality it is stepping
+        self.capture_hints = None
+        self.jpeg_quality = None
+        # Fills gaps between the session's frames with predicted landmarks (None when disabled)
+        self.landmark_predictor = (
+            LandmarkPredictor(LANDMARK_PREDICTION_MIN_INTERVAL_MS, LANDMARK_PREDICTION_MAX_GAP_MS)
+            if LANDMARK_PREDICTION_ENABLED else None
+        )
+        # Smooths the landmarks the detectors see (None when disabled)
+        self.landmark_smoother = (
+            OneEuroFilter(LANDMARK_SMOOTHING_BETA, LANDMARK_SMOOTHING_DERIVATIVE_CUTOFF_HZ)
+            if LANDMARK_SMOOTHING_ENABLED else None
+        )
+        # Tracks the people of a group session (one camera, several people); None for one person
+        self.group_tracker = None
+        # Set once the session is evicted or ended; frames still in flight must not touch its state
+        self.closed = False
+        self.created_at = time.monotonic()
+        self.last_seen = self.created_at
+
+    def touch(self):
+        """Mark the session as active now"""
+        self.last_seen = time.monotonic()
+
+    def close(self):
+        """Free the session's detector state rows"""
+        self.closed = True
+        self.exercise_detection.release()
+        if self.group_tracker is not None:
+            self.group_tracker.close()
+
+
+class SessionRegistry:
+    """
+    Registry of exercise sessions keyed by session id.
+    Sessions are kept in least-recently-used order; idle sessions are dropped
+    after `idle_timeout` seconds and the oldest ones are evicted once
+    `max_sessions` is exceeded, so memory stays bounded.
+    """
+
+    def __init__(self, max_sessions=SESSION_MAX_COUNT, idle_timeout=SESSION_IDLE_TIMEOUT_SECONDS):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.evicted_count = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._eviction_listeners = []
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def add_eviction_listener(self, callback):
+        """Register a callback(session) invoked when a session is evicted or removed"""
+        self._eviction_listeners.append(callback)
+
+    def get(self, session_id):
+        """Get the session for `session_id`, creating it if needed"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = ExerciseSession(session_id)
+                self._sessions[session_id] = session
+            else:
+                self._sessions.move_to_end(session_id)
+            session.touch()
+            evicted = self._evict_locked(session.last_seen)
+        self._notify(evicted)
+        return session
+
+    def peek(self, session_id):
+        """Get an existing session without creating it or refreshing its LRU position"""
+        return self._sessions.get(session_id)
+
+    def remove(self, session_id):
+        """Remove a session, returning True if it existed"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        self._notify([session])
+        return True
+
+    def evict_idle(self):
+        """Drop sessions that exceeded the idle timeout, returning how many were dropped"""
+        with self._lock:
+            evicted = self._evict_locked(time.monotonic())
+        self._notify(evicted)
+        return len(evicted)
+
+    def stats(self):
+        """Get registry statistics"""
+        return {
+            "active_sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "idle_timeout_seconds": self.idle_timeout,
+            "evicted_sessions": self.evicted_count,
+        }
+
+    def _evict_locked(self, now):
+        """Evict idle and over-capacity sessions (caller holds the lock)"""
+        evicted = []
+        # The OrderedDict is in last-seen order, so idle sessions are at the front
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_seen < self.idle_timeout:
+                break
+            del self._sessions[session_id]
+            evicted.append(session)
+        while len(self._sessions) > self.max_sessions:
+            _, session = self._sessions.popitem(last=False)
+            evicted.append(session)
+        self.evicted_count += len(evicted)
+        return evicted
+
+    def _notify(self, sessions):
+        """Run eviction listeners outside the registry lock, then close the sessions"""
+        for session in sessions:
+            for callback in self._eviction_listeners:
+                callback(session)
+            session.close()
+
+
+# Singleton instance
+session_registry = SessionRegistry()
@@ -0,0 +1,73 @@
+"""Ultralytics YOLO-pose backend, run on the CPU"""
+from app.config import (
+    POSE_MODEL_TIERS, POSE_DEFAULT_TIER, POSE_POOL_SIZE, YOLO_POSE_MODELS, YOLO_POSE_IMAGE_SIZE,
+    YOLO_POSE_MIN_CONFIDENCE, YOLO_POSE_RERUN_CONFIDENCE_THRESHOLD, YOLO_POSE_TORCH_THREADS
+)
+from app.services.pose_backend import ModelPool, PoseBackend
+from app.utils.landmarks import keypoints_to_array
+
+
+class YoloPoseBackend(PoseBackend):
+    """
+    Pose backend running YOLO-pose on the CPU.
+    YOLO-pose finds every person in one pass and keeps no state between
+    frames, so models are not leased per session: a frame takes any idle
+    model of its tier, and another is loaded while all are busy (up to
+    `pool_size` per tier). Its 17 COCO keypoints are mapped onto the 33
+    MediaPipe landmarks (keypoints_to_array), so z is always 0.
+    """
+
+    name = "yolo"
+
+    def __init__(self, pool_size=POSE_POOL_SIZE, tiers=POSE_MODEL_TIERS, default_tier=POSE_DEFAULT_TIER,
+                 models=YOLO_POSE_MODELS, image_size=YOLO_POSE_IMAGE_SIZE, min_confidence=YOLO_POSE_MIN_CONFIDENCE,
+                 torch_threads=YOLO_POSE_TORCH_THREADS, rerun_threshold=YOLO_POSE_RERUN_CONFIDENCE_THRESHOLD):
+        super().__init__(tiers, default_tier, rerun_threshold)
+        self.pool_size = max(1, pool_size)
+        self.models = models
+        self.image_size = image_size
+        self.min_confidence = min_confidence
+        self.torch_threads = torch_threads
+        self._pools = {tier: ModelPool(lambda tier=tier: self._load(tier), self.pool_size) for tier in self.tiers}
+
+    def warm_up(self):
+        """Load the default tier's model now instead of on the first frame"""
+        self._pools[self.default_tier].warm_up()
+
+    def _load(self, tier):
+        """Load a tier's YOLO-pose model"""
+        # Imported here so torch is only loaded by deployments that choose this backend
+        import torch
+        from ultralytics import YOLO
+
+        if self.torch_threads > 0:
+            torch.set_num_threads(self.torch_threads)
+        print(f"Loading YOLO-pose model {self.models[tier]} ({tier})...")
+        return YOLO(self.models[tier], task="pose")
+
+    def detect(self, rgb_image, session_id=None, tier=None, timestamp_ms=None, num_poses=1):
+        """Detect up to `num_poses` people in an RGB image; returns ((33, 4) arrays, presence of the first pose)"""
+        with self._pools[tier or self.default_tier].acquire() as model:
+            # Ultralytics reads NumPy images as BGR
+            result = model.predict(
+                rgb_image[:, :, ::-1], imgsz=self.image_size, conf=self.min_confidence, max_det=num_poses,
+                device="cpu", verbose=False
+            )[0]
+
+        keypoints = result.keypoints
+        if keypoints is None or keypoints.conf is None or len(keypoints) == 0:
+            return [], 0.0
+        # People come sorted by detection confidence
+        points = keypoints.xyn.cpu().numpy()
+        confidence = keypoints.conf.cpu().numpy()
+        poses = [keypoints_to_array(pose, pose_confidence) for pose, pose_confidence in zip(points, confidence)]
+        return poses, float(confidence[0].mean())
+
+    def stats(self):
+        """Get loaded model statistics"""
+        return {
+            "backend": self.name,
+            "pool_size": self.pool_size,
+            "default_tier": self.default_tier,
+            "models_per_tier": {tier: len(pool) for tier, pool in self._pools.items()},
+        }
@@ -0,0 +1,217 @@
+"""Per-frame kinematic features computed from a (33, 4) landmark array in one vectorized pass"""
+import math
+import numpy as np
+from app.utils.constants import PoseLandmark as L
+
+
+class Feature:
+    """Indices into the per-frame feature vector read by the exercise detectors"""
+    # Joint angles in degrees (0-180), vertex in the middle
+    LEFT_KNEE_ANGLE = 0  # left hip, knee, ankle
+    RIGHT_KNEE_ANGLE = 1  # right hip, knee, ankle
+    LEFT_ELBOW_ANGLE = 2  # left shoulder, elbow, wrist
+    RIGHT_ELBOW_ANGLE = 3  # right shoulder, elbow, wrist
+    LEFT_BODY_ANGLE = 4  # left shoulder, hip, ankle
+    # Distances in normalized image coordinates
+    ARM_SPAN = 5  # left wrist to right wrist
+    LEG_SPAN = 6  # left ankle to right ankle
+    # Direction of the wrist seen from the shoulder, in degrees (-180-180)
+    LEFT_WRIST_DIRECTION = 7
+    RIGHT_WRIST_DIRECTION = 8
+    # Raw coordinates
+    LEFT_SHOULDER_Y = 9
+    LEFT_WRIST_Y = 10
+    LEFT_HIP_X = 11
+    LEFT_HIP_Y = 12
+    RIGHT_HIP_X = 13
+    RIGHT_HIP_Y = 14
+    LEFT_KNEE_Y = 15
+    RIGHT_KNEE_Y = 16
+    LEFT_ANKLE_X = 17
+    RIGHT_ANKLE_X = 18
+    # Mean height of the left / right pair
+    WRIST_Y = 19
+    SHOULDER_Y = 20
+    HIP_Y = 21
+    KNEE_Y = 22
+    ANKLE_Y = 23
+    # Combined features
+    ELBOW_ANGLE = 24  # mean of the two elbow angles
+    WRIST_DIRECTION = 25  # mean of the two wrist directions, wrapped to 0-360
+
+
+NUM_FEATURES = 26
+
+# (feature, first point, vertex, last point)
+ANGLES = (
+    (Feature.LEFT_KNEE_ANGLE, L.LEFT_HIP, L.LEFT_KNEE, L.LEFT_ANKLE),
+    (Feature.RIGHT_KNEE_ANGLE, L.RIGHT_HIP, L.RIGHT_KNEE, L.RIGHT_ANKLE),
+    (Feature.LEFT_ELBOW_ANGLE, L.LEFT_SHOULDER, L.LEFT_ELBOW, L.LEFT_WRIST),
+    (Feature.RIGHT_ELBOW_ANGLE, L.RIGHT_SHOULDER, L.RIGHT_ELBOW, L.RIGHT_WRIST),
+    (Feature.LEFT_BODY_ANGLE, L.LEFT_SHOULDER, L.LEFT_HIP, L.LEFT_ANKLE),
+)
+
+# (feature, point, point)
+DISTANCES = (
+    (Feature.ARM_SPAN, L.LEFT_WRIST, L.RIGHT_WRIST),
+    (Feature.LEG_SPAN, L.LEFT_ANKLE, L.RIGHT_ANKLE),
+)
+
+# (feature, from point, to point)
+DIRECTIONS = (
+    (Feature.LEFT_WRIST_DIRECTION, L.LEFT_SHOULDER, L.LEFT_WRIST),
+    (Feature.RIGHT_WRIST_DIRECTION, L.RIGHT_SHOULDER, L.RIGHT_WRIST),
+)
+
+# (feature, point, axis: 0 = x, 1 = y)
+COORDINATES = (
+    (Feature.LEFT_SHOULDER_Y, L.LEFT_SHOULDER, 1),
+    (Feature.LEFT_WRIST_Y, L.LEFT_WRIST, 1),
+    (Feature.LEFT_HIP_X, L.LEFT_HIP, 0),
+    (Feature.LEFT_HIP_Y, L.LEFT_HIP, 1),
+    (Feature.RIGHT_HIP_X, L.RIGHT_HIP, 0),
+    (Feature.RIGHT_HIP_Y, L.RIGHT_HIP, 1),
+    (Feature.LEFT_KNEE_Y, L.LEFT_KNEE, 1),
+    (Feature.RIGHT_KNEE_Y, L.RIGHT_KNEE, 1),
+    (Feature.LEFT_ANKLE_X, L.LEFT_ANKLE, 0),
+    (Feature.RIGHT_ANKLE_X, L.RIGHT_ANKLE, 0),
+)
+
+# (feature, point, point): mean y of the two points
+MEAN_HEIGHTS = (
+    (Feature.WRIST_Y, L.LEFT_WRIST, L.RIGHT_WRIST),
+    (Feature.SHOULDER_Y, L.LEFT_SHOULDER, L.RIGHT_SHOULDER),
+    (Feature.HIP_Y, L.LEFT_HIP, L.RIGHT_HIP),
+    (Feature.KNEE_Y, L.LEFT_KNEE, L.RIGHT_KNEE),
+    (Feature.ANKLE_Y, L.LEFT_ANKLE, L.RIGHT_ANKLE),
+)
+
+
+# The vector is laid out table by table, so each table fills one contiguous slice
+assert [row[0] for row in ANGLES + DISTANCES + DIRECTIONS + COORDINATES + MEAN_HEIGHTS] == list(range(Feature.ELBOW_ANGLE))
+
+
+def _feature_landmarks():
+    """Landmark indices each feature is computed from, indexed by feature"""
+    points = {row[0]: tuple(row[1:]) for row in ANGLES + DISTANCES + DIRECTIONS}
+    points.update({feature: (point,) for feature, point, _ in COORDINATES})
+    points.update({feature: (first, second) for feature, first, second in MEAN_HEIGHTS})
+    points[Feature.ELBOW_ANGLE] = points[Feature.LEFT_ELBOW_ANGLE] + points[Feature.RIGHT_ELBOW_ANGLE]
+    points[Feature.WRIST_DIRECTION] = points[Feature.LEFT_WRIST_DIRECTION] + points[Feature.RIGHT_WRIST_DIRECTION]
+    return tuple(points[feature] for feature in range(NUM_FEATURES))
+
+
+# Landmarks read by each feature, so detectors can be skipped when theirs are not visible
+FEATURE_LANDMARKS = _feature_landmarks()
+
+# Every limb / span vector the features need, as (from point, to point): the
+# two limbs of each angle, then the wrist directions, then the distances
+_VECTORS = (
+    [(row[2], row[1]) for row in ANGLES]
+    + [(row[2], row[3]) for row in ANGLES]
+    + [(row[1], row[2]) for row in DIRECTIONS]
+    + [(row[2], row[1]) for row in DISTANCES]
+)
+_FIRST_LIMBS = slice(0, len(ANGLES))
+_LAST_LIMBS = slice(len(ANGLES), 2 * len(ANGLES))
+_SPANS = slice(2 * len(ANGLES) + len(DIRECTIONS), len(_VECTORS))
+_DIRECTIONS = slice(2 * len(ANGLES), _SPANS.start)
+
+
+def _linear_map():
+    """
+    Matrix turning the flattened (33 * 2) xy coordinates into every linear
+    quantity at once: vector x components, vector y components, coordinates,
+    mean heights. The weights are 0, +-1 and 0.5, so results are exact.
+    """
+    columns = []
+    for axis in (0, 1):
+        for start, end in _VECTORS:
+            column = np.zeros(66)
+            column[end * 2 + axis] += 1.0
+            column[start * 2 + axis] -= 1.0
+            columns.append(column)
+    for _, point, axis in COORDINATES:
+        column = np.zeros(66)
+        column[point * 2 + axis] = 1.0
+        columns.append(column)
+    for _, first, second in MEAN_HEIGHTS:
+        column = np.zeros(66)
+        column[first * 2 + 1] = 0.5
+        column[second * 2 + 1] = 0.5
+        columns.append(column)
+    return np.stack(columns, axis=1)
+
+
+_LINEAR = _linear_map()
+_VECTOR_COUNT = len(_VECTORS)
+_FIRST_COORDINATE = Feature.LEFT_SHOULDER_Y
+
+
+def compute_features(landmarks):
+    """
+    Compute every detector feature from a (33, 4) landmark array (or a stack of
+    shape (n, 33, 4)). Angles match geometry.calculate_angle, distances
+    geometry.calculate_distance. Returns a float64 array of NUM_FEATURES values
+    (or (n, NUM_FEATURES)).
+    """
+    landmarks = np.asarray(landmarks)
+    xy = landmarks[..., :2].astype(np.float64).reshape(landmarks.shape[:-2] + (66,))
+
+    # One matrix product gives all limb vectors, coordinates and mean heights
+    linear = xy @ _LINEAR
+    vector_x = linear[..., :_VECTOR_COUNT]
+    vector_y = linear[..., _VECTOR_COUNT:2 * _VECTOR_COUNT]
+    directions = np.arctan2(vector_y[..., :_SPANS.start], vector_x[..., :_SPANS.start])
+
+    out = np.empty(landmarks.shape[:-2] + (NUM_FEATURES,))
+    # Joint angles: difference of the two limb directions, folded into 0-180
+    angles = np.abs((directions[..., _LAST_LIMBS] - directions[..., _FIRST_LIMBS]) * 180.0 / np.pi)
+    out[..., Feature.LEFT_KNEE_ANGLE:Feature.ARM_SPAN] = np.minimum(angles, 360 - angles)
+    out[..., Feature.ARM_SPAN:Feature.LEFT_WRIST_DIRECTION] = np.sqrt(
+        vector_x[..., _SPANS] ** 2 + vector_y[..., _SPANS] ** 2
+    )
+    out[..., Feature.LEFT_WRIST_DIRECTION:_FIRST_COORDINATE] = np.degrees(directions[..., _DIRECTIONS])
+    out[..., _FIRST_COORDINATE:Feature.ELBOW_ANGLE] = linear[..., 2 * _VECTOR_COUNT:]
+    out[..., Feature.ELBOW_ANGLE] = (out[..., Feature.LEFT_ELBOW_ANGLE] + out[..., Feature.RIGHT_ELBOW_ANGLE]) / 2
+    out[..., Feature.WRIST_DIRECTION] = np.mod(
+        (out[..., Feature.LEFT_WRIST_DIRECTION] + out[..., Feature.RIGHT_WRIST_DIRECTION]) / 2, 360
+    )
+    return out
+
+
+# The tables as offsets into a flattened (33 * 4) frame, for compute_features_row
+_ROW_ANGLES = tuple((feature, first * 4, vertex * 4, last * 4) for feature, first, vertex, last in ANGLES)
+_ROW_DISTANCES = tuple((feature, first * 4, second * 4) for feature, first, second in DISTANCES)
+_ROW_DIRECTIONS = tuple((feature, start * 4, end * 4) for feature, start, end in DIRECTIONS)
+_ROW_COORDINATES = tuple((feature, point * 4 + axis) for feature, point, axis in COORDINATES)
+_ROW_MEAN_HEIGHTS = tuple((feature, first * 4 + 1, second * 4 + 1) for feature, first, second in MEAN_HEIGHTS)
+
+
+def compute_features_row(landmarks):
+    """
+    compute_features of a single (33, 4) frame in plain Python floats, as a
+    list: for one frame NumPy's per-call overhead costs more than the
+    arithmetic. Values agree with compute_features up to the last bit
+    (NumPy's vectorized arctan2 rounds some results differently).
+    """
+    p = landmarks.ravel().tolist()
+    atan2 = math.atan2
+    out = [0.0] * NUM_FEATURES
+    for feature, first, vertex, last in _ROW_ANGLES:
+        x, y = p[vertex], p[vertex + 1]
+        radians = atan2(p[last + 1] - y, p[last] - x) - atan2(p[first + 1] - y, p[first] - x)
+        angle = abs(radians * 180.0 / math.pi)
+        out[feature] = min(angle, 360 - angle)
+    for feature, first, second in _ROW_DISTANCES:
+        dx, dy = p[first] - p[second], p[first + 1] - p[second + 1]
+        out[feature] = math.sqrt(dx * dx + dy * dy)
+    for feature, start, end in _ROW_DIRECTIONS:
+        out[feature] = atan2(p[end + 1] - p[start + 1], p[end] - p[start]) * (180.0 / math.pi)
+    for feature, offset in _ROW_COORDINATES:
+        out[feature] = p[offset]
+    for feature, first, second in _ROW_MEAN_HEIGHTS:
+        out[feature] = 0.5 * p[first] + 0.5 * p[second]
+    out[Feature.ELBOW_ANGLE] = (out[Feature.LEFT_ELBOW_ANGLE] + out[Feature.RIGHT_ELBOW_ANGLE]) / 2
+    out[Feature.WRIST_DIRECTION] = (out[Feature.LEFT_WRIST_DIRECTION] + out[Feature.RIGHT_WRIST_DIRECTION]) / 2 % 360
+    return out
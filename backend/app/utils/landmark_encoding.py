@@ -0,0 +1,155 @@
+"""Compact binary encoding of detection results for bandwidth-sensitive clients"""
+import struct
+import numpy as np
+from app.utils.landmarks import NUM_LANDMARKS
+
+# Response formats a client can ask for; "json" is the regular JSON response
+RESPONSE_FORMATS = ("json", "float32", "int16", "int16-delta")
+# Formats whose frames depend on the previous one: only for ordered streams (WebSocket), not
+# independent HTTP responses that can be lost or arrive out of order
+STREAM_ONLY_FORMATS = ("int16-delta",)
+
+# Media type of binary responses; the format is also accepted as `application/x-landmarks-<format>`
+BINARY_MEDIA_TYPE = "application/x-landmarks"
+
+FORMAT_VERSION = 1
+
+# Payload encodings written in the header
+ENCODING_NONE = 0  # no pose detected, no payload
+ENCODING_FLOAT32 = 1  # (33, 4) little-endian float32
+ENCODING_INT16 = 2  # (33, 4) little-endian int16, value = round(x * QUANT_SCALE)
+ENCODING_INT8_DELTA = 3  # (33, 4) int8 difference to the previous frame's int16 values
+
+# Quantization step of 1/8192: covers -4..4 in normalized coordinates,
+# well below one pixel at camera resolutions
+QUANT_SCALE = 8192
+
+# version, encoding, model tier code, counter count, sequence, frame id, dropped frames, detection bits
+HEADER = struct.Struct("<BBBBIIHH")
+# The header is followed by one uint16 rep count per exercise (detection bit i belongs to the
+# same exercise as count i), then the landmark payload. The exercise names are not in the
+# packet: HTTP responses carry them, comma separated and in count order, in the X-Exercises
+# header, and the WebSocket stream sends a {"type": "exercises", "exercises": [...]} text
+# message before the first result and before any result whose exercise list changed.
+
+
+def quantize(landmarks):
+    """Quantize a (33, 4) float landmark array to int16"""
+    scaled = np.rint(landmarks * QUANT_SCALE)
+    return np.clip(scaled, -32768, 32767).astype(np.int16)
+
+
+def dequantize(quantized):
+    """Convert int16 quantized landmarks back to float32"""
+    return quantized.astype(np.float32) / QUANT_SCALE
+
+
+def parse_response_format(value):
+    """Map a `format` query value or an Accept header to a response format, or None if neither names one"""
+    if not value:
+        return None
+    for part in value.split(","):
+        media_type = part.split(";")[0].strip().lower()
+        if media_type in RESPONSE_FORMATS:
+            return media_type
+        if media_type == BINARY_MEDIA_TYPE:
+            return "float32"
+        prefix = BINARY_MEDIA_TYPE + "-"
+        if media_type.startswith(prefix) and media_type[len(prefix):] in RESPONSE_FORMATS:
+            return media_type[len(prefix):]
+    return None
+
+
+class LandmarkEncoder:
+    """
+    Packs detection results into a fixed 16-byte header, the counters as
+    uint16 and the landmark payload. One encoder serves one ordered stream of
+    responses: with "int16-delta" each frame is sent as int8 deltas against
+    the previous frame when every delta fits, and as an int16 keyframe
+    otherwise, so the client must apply responses in sequence order.
+    """
+
+    def __init__(self, response_format):
+        if response_format not in RESPONSE_FORMATS or response_format == "json":
+            raise ValueError(f"Unknown binary response format: {response_format}")
+        self.response_format = response_format
+        self.sequence = 0
+        # Exercise names of the last encoded result's counters, in order
+        self.exercises = []
+        self._previous = None
+
+    def reset(self):
+        """Force the next frame to be a keyframe"""
+        self._previous = None
+
+    def encode(self, landmarks, counters, detections, tier_code=0, frame_id=None, dropped_frames=0):
+        """
+        Encode one result. `counters` maps exercise names to rep counts (sent
+        in that order, names kept in `exercises`), `detections` is a list of
+        rep-completed flags (bit i of the detection bits) and `tier_code` the
+        1-based model tier index (0 = client landmarks).
+        """
+        self.sequence += 1
+        self.exercises = list(counters)
+        encoding, payload = self._encode_landmarks(landmarks)
+        detection_bits = 0
+        for index, completed in enumerate(detections):
+            if completed:
+                detection_bits |= 1 << index
+        header = HEADER.pack(
+            FORMAT_VERSION, encoding, tier_code, len(counters), self.sequence & 0xFFFFFFFF,
+            (self.sequence if frame_id is None else frame_id) & 0xFFFFFFFF,
+            min(dropped_frames, 0xFFFF), detection_bits
+        )
+        counter_bytes = np.clip(np.asarray(list(counters.values()), dtype=np.int64), 0, 0xFFFF).astype("<u2").tobytes()
+        return header + counter_bytes + payload
+
+    def _encode_landmarks(self, landmarks):
+        """Pick the payload encoding for one frame and return (encoding, payload bytes)"""
+        if landmarks is None:
+            self._previous = None
+            return ENCODING_NONE, b""
+        if self.response_format == "float32":
+            return ENCODING_FLOAT32, landmarks.astype("<f4").tobytes()
+
+        quantized = quantize(landmarks)
+        previous, self._previous = self._previous, quantized
+        if self.response_format == "int16-delta" and previous is not None:
+            delta = quantized.astype(np.int32) - previous
+            if np.abs(delta).max() <= 127:
+                return ENCODING_INT8_DELTA, delta.astype(np.int8).tobytes()
+        return ENCODING_INT16, quantized.astype("<i2").tobytes()
+
+
+def decode_result(data, previous=None):
+    """
+    Decode a binary result into (header dict, counters, landmarks or None).
+    `previous` is the int16 quantized landmarks of the previous frame, needed
+    for delta frames; the returned header carries this frame's in "quantized".
+    Reference implementation for clients.
+    """
+    version, encoding, tier_code, counter_count, sequence, frame_id, dropped, bits = HEADER.unpack_from(data)
+    offset = HEADER.size
+    counters = np.frombuffer(data, dtype="<u2", count=counter_count, offset=offset).tolist()
+    offset += counter_count * 2
+    header = {
+        "version": version, "encoding": encoding, "model_tier_code": tier_code, "sequence": sequence,
+        "frame_id": frame_id, "dropped_frames": dropped, "detection_bits": bits, "quantized": None,
+    }
+    count = NUM_LANDMARKS * 4
+    if encoding == ENCODING_NONE:
+        return header, counters, None
+    if encoding == ENCODING_FLOAT32:
+        landmarks = np.frombuffer(data, dtype="<f4", count=count, offset=offset).reshape(NUM_LANDMARKS, 4)
+        return header, counters, landmarks
+    if encoding == ENCODING_INT16:
+        quantized = np.frombuffer(data, dtype="<i2", count=count, offset=offset).reshape(NUM_LANDMARKS, 4)
+    elif encoding == ENCODING_INT8_DELTA:
+        if previous is None:
+            raise ValueError("Delta frame without a previous frame")
+        delta = np.frombuffer(data, dtype=np.int8, count=count, offset=offset).reshape(NUM_LANDMARKS, 4)
+        quantized = (previous.astype(np.int32) + delta).astype(np.int16)
+    else:
+        raise ValueError(f"Unknown landmark encoding: {encoding}")
+    header["quantized"] = quantized
+    return header, counters, dequantize(quantized)
@@ -0,0 +1,106 @@
+"""Per-session motion model that fills gaps between landmark frames with predicted frames"""
+from collections import deque
+import numpy as np
+
+# EWMA weight of the newest frame-to-frame velocity
+VELOCITY_SMOOTHING = 0.5
+
+# Gaps up to this many times the stream's usual frame spacing are left alone (regular frames)
+MIN_GAP_INTERVALS = 1.5
+
+# Recent frame spacings the usual spacing is the median of, and how many are needed before predicting
+SPACING_WINDOW = 15
+MIN_SPACING_SAMPLES = 3
+
+
+class LandmarkPredictor:
+    """
+    Constant-velocity model over the 33 landmarks of one ordered stream of
+    frames. The stream's usual frame spacing is the median of its recent
+    spacings (at least `min_interval_ms`). When a frame arrives more than 1.5
+    usual spacings after the previous one, fill() returns predicted frames,
+    spaced like the stream's frames, for the missing timestamps:
+    each coordinate follows the parabola that leaves the previous frame with
+    the tracked velocity and ends on the new frame, so a turning point between
+    the two real frames (the bottom of a squat) shows up in the predicted
+    frames. Visibility is interpolated linearly.
+    """
+
+    def __init__(self, min_interval_ms, max_gap_ms):
+        self.min_interval_ms = min_interval_ms
+        self.max_gap_ms = max_gap_ms
+        self.spacings_ms = deque(maxlen=SPACING_WINDOW)
+        self.reset()
+
+    @property
+    def interval_ms(self):
+        """The stream's usual frame spacing, or None until enough frames were seen"""
+        if len(self.spacings_ms) < MIN_SPACING_SAMPLES:
+            return None
+        return max(self.min_interval_ms, float(np.median(self.spacings_ms)))
+
+    def reset(self):
+        """Forget the stream (pose lost): the next frame starts a new one"""
+        self.landmarks = None
+        self.timestamp_ms = None
+        # Per-millisecond x, y, z velocity of each landmark
+        self.velocity = None
+
+    def fill(self, landmarks, timestamp_ms):
+        """
+        Predicted (landmarks, timestamp_ms) frames for the gap before a (33, 4)
+        frame captured at `timestamp_ms`, oldest first (empty when there is no
+        gap to fill); the frame then becomes the previous one
+        """
+        predicted = []
+        if self.landmarks is not None:
+            gap = timestamp_ms - self.timestamp_ms
+            if gap <= 0:
+                return predicted
+            interval_ms = self.interval_ms
+            if self.velocity is not None and interval_ms is not None \
+                    and MIN_GAP_INTERVALS * interval_ms < gap <= self.max_gap_ms:
+                predicted = self._predict(landmarks, gap, interval_ms)
+            self._observe(gap)
+            secant = (landmarks[:, :3] - self.landmarks[:, :3]) / gap
+            if self.velocity is None:
+                self.velocity = secant
+            else:
+                self.velocity += VELOCITY_SMOOTHING * (secant - self.velocity)
+        self.landmarks = np.array(landmarks, dtype=np.float32)
+        self.timestamp_ms = timestamp_ms
+        return predicted
+
+    def hold(self, timestamp_ms):
+        """
+        A frame that reused the previous landmarks (the motion gate found the
+        scene static) at `timestamp_ms`: the stream moves to its time standing
+        still, so the next real frame is not taken for the end of a gap
+        """
+        if self.landmarks is None or timestamp_ms <= self.timestamp_ms:
+            return
+        self._observe(timestamp_ms - self.timestamp_ms)
+        self.timestamp_ms = timestamp_ms
+        if self.velocity is not None:
+            self.velocity[:] = 0
+
+    def _observe(self, gap):
+        """Track the spacing of two consecutive frames (longer gaps than max_gap_ms are outliers)"""
+        if gap <= self.max_gap_ms:
+            self.spacings_ms.append(gap)
+
+    def _predict(self, landmarks, gap, interval_ms):
+        """Frames along the path from the previous frame to `landmarks`, `gap` ms later"""
+        count = int(round(gap / interval_ms)) - 1
+        step = gap / (count + 1)
+        start = self.landmarks
+        # x(s) = x0 + v0 s + a s^2 with x(gap) = x1
+        acceleration = (landmarks[:, :3] - start[:, :3] - self.velocity * gap) / (gap * gap)
+        frames = []
+        for index in range(1, count + 1):
+            elapsed = index * step
+            frame = np.empty_like(start)
+            frame[:, :3] = start[:, :3] + self.velocity * elapsed + acceleration * (elapsed * elapsed)
+            frame[:, 3] = start[:, 3] + (landmarks[:, 3] - start[:, 3]) * (elapsed / gap)
+            frames.append((frame, self.timestamp_ms + elapsed))
+        return frames
@@ -0,0 +1,51 @@
+"""One-Euro filter over landmark arrays, for low-latency jitter removal"""
+import math
+import numpy as np
+
+
+def smoothing_factor(cutoff_hz, elapsed_s):
+    """Exponential smoothing weight of a new sample for a low-pass cutoff (scalar or array)"""
+    tau = 1.0 / (2 * math.pi * cutoff_hz)
+    return 1.0 / (1.0 + tau / elapsed_s)
+
+
+class OneEuroFilter:
+    """
+    One-Euro filter over the x, y, z of the 33 landmarks of one ordered
+    stream of frames, vectorized over the (33, 3) array. Each landmark's
+    cutoff is `min_cutoff_hz` plus `beta` times its smoothed speed (normalized
+    units per second): a landmark at rest is smoothed hard, a moving one
+    follows with little lag. Visibility passes through unchanged.
+    """
+
+    def __init__(self, beta, derivative_cutoff_hz):
+        self.beta = beta
+        self.derivative_cutoff_hz = derivative_cutoff_hz
+        self.reset()
+
+    def reset(self):
+        """Forget the stream (pose lost): the next frame passes through as is"""
+        self.position = None
+        self.speed = None
+        self.timestamp_ms = None
+
+    def filter(self, landmarks, timestamp_ms, min_cutoff_hz):
+        """Smoothed copy of a (33, 4) frame captured at `timestamp_ms`"""
+        smoothed = np.array(landmarks, dtype=np.float32)
+        if self.position is None:
+            self.position = smoothed[:, :3].copy()
+            self.speed = np.zeros((len(smoothed), 1), dtype=np.float32)
+            self.timestamp_ms = timestamp_ms
+            return smoothed
+        if timestamp_ms <= self.timestamp_ms:
+            # Out-of-order or repeated capture time: keep the current estimate
+            smoothed[:, :3] = self.position
+            return smoothed
+        elapsed_s = (timestamp_ms - self.timestamp_ms) / 1000
+        speed = np.linalg.norm(smoothed[:, :3] - self.position, axis=1, keepdims=True) / elapsed_s
+        self.speed += smoothing_factor(self.derivative_cutoff_hz, elapsed_s) * (speed - self.speed)
+        alpha = smoothing_factor(min_cutoff_hz + self.beta * self.speed, elapsed_s)
+        self.position += alpha * (smoothed[:, :3] - self.position)
+        self.timestamp_ms = timestamp_ms
+        smoothed[:, :3] = self.position
+        return smoothed
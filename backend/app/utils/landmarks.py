@@ -0,0 +1,91 @@
+"""Conversions between MediaPipe landmark lists and NumPy landmark arrays"""
+import numpy as np
+
+# Number of landmarks in a MediaPipe pose
+NUM_LANDMARKS = 33
+
+# COCO keypoint (of the 17 YOLO-pose detects) each MediaPipe landmark is taken from; landmarks COCO
+# lacks (eye corners, mouth, hands, heels, toes) take the nearest keypoint
+COCO_KEYPOINT_SOURCES = np.array([
+    0,  # nose
+    1, 1, 1, 2, 2, 2,  # eyes (inner, center, outer)
+    3, 4,  # ears
+    0, 0,  # mouth
+    5, 6, 7, 8, 9, 10,  # shoulders, elbows, wrists
+    9, 10, 9, 10, 9, 10,  # pinkies, index fingers, thumbs
+    11, 12, 13, 14, 15, 16,  # hips, knees, ankles
+    15, 16, 15, 16,  # heels, foot indices
+])
+
+
+def landmarks_to_array(landmarks):
+    """Convert a MediaPipe landmark list to a (33, 4) float32 array of x, y, z, visibility"""
+    return np.array(
+        [(lm.x, lm.y, lm.z, lm.visibility) for lm in landmarks],
+        dtype=np.float32
+    )
+
+
+def keypoints_to_array(keypoints, confidence):
+    """
+    Convert (17, 2) normalized COCO keypoints and their (17,) confidences to a
+    (33, 4) float32 landmark array; confidence becomes visibility, z is 0
+    """
+    array = np.zeros((NUM_LANDMARKS, 4), dtype=np.float32)
+    array[:, :2] = keypoints[COCO_KEYPOINT_SOURCES]
+    array[:, 3] = confidence[COCO_KEYPOINT_SOURCES]
+    return array
+
+
+def array_to_json(array):
+    """Convert a (33, 4) landmark array to the JSON landmark list returned by the API"""
+    return [
+        {"x": x, "y": y, "z": z, "visibility": visibility}
+        for x, y, z, visibility in array.tolist()
+    ]
+
+
+# Size of a packed little-endian float32 (33, 4) landmark array
+LANDMARK_ARRAY_BYTES = NUM_LANDMARKS * 4 * 4
+
+
+def parse_landmark_bytes(data):
+    """
+    Parse a packed little-endian float32 (33, 4) landmark array.
+    An empty payload means no pose was detected and returns None.
+    """
+    if len(data) == 0:
+        return None
+    if len(data) != LANDMARK_ARRAY_BYTES:
+        raise ValueError(f"Expected {LANDMARK_ARRAY_BYTES} bytes of float32 landmarks, got {len(data)}")
+    array = np.frombuffer(data, dtype="<f4").reshape(NUM_LANDMARKS, 4).astype(np.float32)
+    return _validate_array(array)
+
+
+def parse_landmark_json(value):
+    """
+    Parse landmarks sent as JSON: 33 [x, y, z, visibility] lists or 33
+    {"x", "y", "z", "visibility"} objects. None or an empty list means no pose.
+    """
+    if not value:
+        return None
+    if not isinstance(value, list) or len(value) != NUM_LANDMARKS:
+        raise ValueError(f"Expected a list of {NUM_LANDMARKS} landmarks")
+    try:
+        if isinstance(value[0], dict):
+            rows = [(lm["x"], lm["y"], lm.get("z", 0.0), lm.get("visibility", 1.0)) for lm in value]
+        else:
+            rows = value
+        array = np.array(rows, dtype=np.float32)
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Landmarks must be [x, y, z, visibility] lists or {x, y, z, visibility} objects")
+    if array.shape != (NUM_LANDMARKS, 4):
+        raise ValueError(f"Expected landmarks of shape ({NUM_LANDMARKS}, 4), got {array.shape}")
+    return _validate_array(array)
+
+
+def _validate_array(array):
+    """Reject arrays with NaN or infinite values"""
+    if not np.isfinite(array).all():
+        raise ValueError("Landmarks must be finite numbers")
+    return array
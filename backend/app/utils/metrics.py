@@ -0,0 +1,203 @@
+"""Lightweight in-process metrics and their Prometheus text exposition"""
+import bisect
+import threading
+import time
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Histogram with fixed bucket upper bounds, cheap enough to observe every frame"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """Record one value"""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value
+
+    def percentile(self, fraction):
+        """Estimate a percentile (0-1) by interpolating inside the matching bucket"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+        if total == 0:
+            return 0.0
+        rank = fraction * total
+        seen = 0
+        lower = 0.0
+        for upper, count in zip(self.buckets, counts):
+            if count and seen + count >= rank:
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+        # Value fell in the overflow bucket; the largest bound is the best estimate
+        return self.buckets[-1] if self.buckets else 0.0
+
+    def totals(self):
+        """Get (cumulative count per bucket bound, total count, sum) in one consistent read"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+            value_sum = self._sum
+        cumulative = []
+        running = 0
+        for count in counts[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, total, value_sum
+
+    def snapshot(self):
+        """Get count, sum, mean, cumulative bucket counts and estimated percentiles"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+            value_sum = self._sum
+        cumulative = {}
+        running = 0
+        for upper, count in zip(self.buckets, counts):
+            running += count
+            cumulative[str(upper)] = running
+        cumulative["+Inf"] = total
+        return {
+            "count": total,
+            "sum": value_sum,
+            "mean": value_sum / total if total else 0.0,
+            "buckets": cumulative,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+        }
+
+
+def _format_labels(labels, extra=None):
+    """Render a label dict as {name="value",...} (empty string without labels)"""
+    items = list(labels.items()) + (list(extra.items()) if extra else [])
+    if not items:
+        return ""
+    escaped = (
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in items
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value):
+    """Render a sample value the way Prometheus expects"""
+    if value == float("inf"):
+        return "+Inf"
+    return f"{value:.10g}" if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    Metric families rendered in the Prometheus text format at scrape time.
+    Histograms are existing Histogram objects (with a `scale`, e.g. 0.001 to
+    expose millisecond histograms in seconds); counters and gauges are
+    callables read on scrape, so recording costs nothing beyond what the
+    instrumented code already does.
+    """
+
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _add(self, kind, name, help_text, source, labels, scale=1.0):
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = {"kind": kind, "help": help_text, "children": []}
+            elif family["kind"] != kind:
+                raise ValueError(f"Metric {name} is already registered as a {family['kind']}")
+            family["children"].append((dict(labels or {}), source, scale))
+
+    def histogram(self, name, help_text, histogram, labels=None, scale=1.0):
+        """Expose a Histogram (values multiplied by `scale`)"""
+        self._add("histogram", name, help_text, histogram, labels, scale)
+
+    def counter(self, name, help_text, value, labels=None):
+        """Expose a monotonically increasing value read from `value()`"""
+        self._add("counter", name, help_text, value, labels)
+
+    def gauge(self, name, help_text, value, labels=None):
+        """Expose a current value read from `value()`"""
+        self._add("gauge", name, help_text, value, labels)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            families = [(name, dict(family, children=list(family["children"])))
+                        for name, family in self._families.items()]
+        lines = []
+        for name, family in families:
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['kind']}")
+            for labels, source, scale in family["children"]:
+                if family["kind"] != "histogram":
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(source())}")
+                    continue
+                cumulative, total, value_sum = source.totals()
+                for upper, count in zip(source.buckets, cumulative):
+                    lines.append(f"{name}_bucket{_format_labels(labels, {'le': _format_value(float(upper * scale))})} {count}")
+                lines.append(f"{name}_bucket{_format_labels(labels, {'le': '+Inf'})} {total}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(float(value_sum * scale))}")
+                lines.append(f"{name}_count{_format_labels(labels)} {total}")
+        return "\n".join(lines) + "\n"
+
+
+def _route_template(scope):
+    """
+    Path template of the matched route (/surveys/{survey_id}), so label
+    cardinality stays bounded; unmatched paths share one label
+    """
+    route = scope.get("route")
+    template = getattr(route, "path_format", None)
+    return template if template else "unmatched"
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request into a histogram per
+    (route template, method, status) registered on a MetricsRegistry.
+    WebSocket and lifespan traffic pass through untouched.
+    """
+
+    def __init__(self, app, registry, name, buckets_ms):
+        self.app = app
+        self.registry = registry
+        self.name = name
+        self.buckets_ms = buckets_ms
+        self._histograms = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            key = (_route_template(scope), scope["method"], status[0])
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets_ms)
+                self.registry.histogram(
+                    self.name, "HTTP request latency in seconds", histogram,
+                    {"route": key[0], "method": key[1], "status": key[2]}, scale=0.001,
+                )
+            histogram.observe((time.perf_counter() - started) * 1000)
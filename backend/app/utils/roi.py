@@ -0,0 +1,70 @@
+"""Region-of-interest helpers for pose-tracked cropping"""
+import numpy as np
+
+# Fewer visible landmarks than this and the box is computed from all landmarks
+MIN_VISIBLE_LANDMARKS = 8
+
+
+def landmark_bounds(landmarks, min_visibility=0.5):
+    """Bounding box (x0, y0, x1, y1) of the visible landmarks of a (33, 4) array, in normalized coordinates"""
+    visible = landmarks[landmarks[:, 3] >= min_visibility]
+    if len(visible) < MIN_VISIBLE_LANDMARKS:
+        visible = landmarks
+    x0, y0 = visible[:, :2].min(axis=0)
+    x1, y1 = visible[:, :2].max(axis=0)
+    return float(x0), float(y0), float(x1), float(y1)
+
+
+def expand_roi(bounds, margin, min_size):
+    """Grow a box by `margin` of its size on every side, to at least `min_size`, clamped to the frame"""
+    x0, y0, x1, y1 = bounds
+    width = max(x1 - x0, min_size)
+    height = max(y1 - y0, min_size)
+    center_x = (x0 + x1) / 2
+    center_y = (y0 + y1) / 2
+    half_width = width * (0.5 + margin)
+    half_height = height * (0.5 + margin)
+    return (
+        max(0.0, center_x - half_width),
+        max(0.0, center_y - half_height),
+        min(1.0, center_x + half_width),
+        min(1.0, center_y + half_height),
+    )
+
+
+def roi_area(roi):
+    """Fraction of the frame covered by a normalized box"""
+    x0, y0, x1, y1 = roi
+    return max(0.0, x1 - x0) * max(0.0, y1 - y0)
+
+
+def box_iou(first, second):
+    """Intersection over union of two normalized (x0, y0, x1, y1) boxes"""
+    intersection = roi_area((
+        max(first[0], second[0]), max(first[1], second[1]),
+        min(first[2], second[2]), min(first[3], second[3]),
+    ))
+    union = roi_area(first) + roi_area(second) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def roi_to_pixels(roi, width, height):
+    """Convert a normalized box to integer pixel bounds (x0, y0, x1, y1)"""
+    x0, y0, x1, y1 = roi
+    return (
+        int(np.floor(x0 * width)),
+        int(np.floor(y0 * height)),
+        int(np.ceil(x1 * width)),
+        int(np.ceil(y1 * height)),
+    )
+
+
+def map_landmarks_from_roi(landmarks, roi):
+    """Map a (33, 4) array detected on a crop back to full-frame normalized coordinates"""
+    x0, y0, x1, y1 = roi
+    mapped = landmarks.copy()
+    mapped[:, 0] = x0 + landmarks[:, 0] * (x1 - x0)
+    mapped[:, 1] = y0 + landmarks[:, 1] * (y1 - y0)
+    # MediaPipe's z uses roughly the same scale as x
+    mapped[:, 2] = landmarks[:, 2] * (x1 - x0)
+    return mapped
@@ -0,0 +1,52 @@
+"""
+Exercise detection throughput across many concurrent sessions.
+
+Compares stepping each session on its own (one ExerciseDetectionService call
+per session, as before batching) against advancing every session in one
+DetectorStore step, for the 4 tracked exercises.
+
+Run from the backend directory:
+    python -m benchmarks.detector_store [--sessions 100 1000 5000] [--steps 20]
+"""
+import argparse
+import time
+import numpy as np
+from app.services.detector_store import DetectorStore
+from app.services.exercise_detection import ExerciseDetectionService, exercise_engine
+from app.utils.kinematics import compute_features
+
+TRACKED = ("push_up", "squat", "jumping_jack", "arm_circle")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--steps", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'sessions':>8} {'per-session calls':>20} {'one store step':>16} {'speedup':>8} {'bytes/session':>14}")
+    for sessions in args.sessions:
+        store = DetectorStore(exercise_engine, capacity=sessions)
+        services = [ExerciseDetectionService(store) for _ in range(sessions)]
+        frames = rng.random((args.steps, sessions, 33, 4)).astype(np.float32)
+
+        started = time.perf_counter()
+        for frame in frames:
+            for service, landmarks in zip(services, frame):
+                service.detect_exercises(landmarks, TRACKED)
+        looped = (time.perf_counter() - started) / args.steps
+
+        rows = [service.row for service in services]
+        exercise_ids = [services[0].exercise_ids(TRACKED)] * sessions
+        started = time.perf_counter()
+        for frame in frames:
+            store.step(rows, exercise_ids, compute_features(frame), None, frame[:, :, 3])
+        batched = (time.perf_counter() - started) / args.steps
+
+        print(f"{sessions:>8} {looped * 1e3:>17.2f} ms {batched * 1e3:>13.2f} ms {looped / batched:>7.1f}x"
+              f" {store.bytes_per_session:>14}")
+
+
+if __name__ == "__main__":
+    main()
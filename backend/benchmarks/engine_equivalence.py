@@ -0,0 +1,174 @@
+"""
+Checks that the exercise engine's two code paths, and the detectors it
+replaced, count the same reps.
+
+Replays landmark streams (random smooth motion, plus the frames of any
+recordings given) through the DetectorStore twice: every session stepped
+together, so the engine runs its vectorized NumPy path, and each session
+stepped on its own, which runs the plain-Python step_row path a lone
+session's frame takes. Both see the same features. They must agree exactly
+on every frame's completed reps and on the state they leave behind (stages,
+counts, registers, visibility timers), on 30 FPS frames without timestamps
+and on jittered timestamps with gaps, missing timestamps and occluded
+landmarks. On the 30 FPS frames the engine's reps must also match the
+reference detectors (benchmarks/reference_detectors.py) frame by frame,
+except for the time-based exercises, which count real time instead of
+frames since capture timestamps reach the detectors. The plain-Python
+feature pass is checked against the vectorized one as well.
+Exits with status 1 on any mismatch.
+
+Run from the backend directory:
+    python -m benchmarks.engine_equivalence [recordings/ ...] [--streams 30] [--frames 1500] [--seed 0]
+"""
+import argparse
+import sys
+from collections import namedtuple
+import numpy as np
+from app.services.detector_store import DetectorStore
+from app.services.exercise_detection import EXERCISES, exercise_engine
+from app.services.exercise_engine import SCALAR_MAX_ROWS
+from app.services.landmark_recorder import load_recording
+from app.utils.kinematics import compute_features, compute_features_row
+from benchmarks.reference_detectors import ReferenceDetectors
+from benchmarks.replay import recording_paths
+
+Landmark = namedtuple("Landmark", ["x", "y", "z", "visibility"])
+
+# Plank holds, jump squat and arm circle velocities run on elapsed time; the reference counts frames
+TIME_BASED = ("plank", "jump_squat", "arm_circle")
+STATE = ("stage", "count", "registers", "visible", "hidden_ms", "last_timestamp_ms")
+
+
+def synthetic_streams(count, frames, rng):
+    """
+    (count, frames, 33, 4) float32 landmarks, each coordinate a noisy sine of
+    its own amplitude and frequency; visibilities stay high with slow dips
+    """
+    t = np.arange(frames)[:, None, None]
+    streams = []
+    for _ in range(count):
+        base = rng.random((33, 4))
+        amplitude = rng.random((33, 4)) * rng.random() * 0.6
+        frequency = rng.random((33, 4)) * 0.3 + 0.05
+        stream = base + amplitude * np.sin(frequency * t + base * 6) + rng.normal(0, 0.01, (frames, 33, 4))
+        stream[:, :, 3] = np.clip(0.8 + 0.4 * np.sin(frequency[:, 3] * t[:, :, 0] / 4 + base[:, 3] * 6), 0, 1)
+        streams.append(stream)
+    return np.array(streams, dtype=np.float32)
+
+
+def recorded_streams(paths, frames):
+    """The detected poses of each recording as a stream, looped or cut to `frames`"""
+    streams = []
+    for path in recording_paths(paths):
+        recording = load_recording(path)
+        poses = recording.landmarks[recording.present]
+        if len(poses):
+            streams.append(poses[np.arange(frames) % len(poses)].astype(np.float32))
+    return np.array(streams, dtype=np.float32).reshape(-1, frames, 33, 4)
+
+
+def jittered_timestamps(count, frames, rng):
+    """Capture times 15-80 ms apart with occasional 2 s gaps; every 50th frame has none (NaN)"""
+    intervals = rng.uniform(15, 80, (count, frames))
+    intervals[rng.random((count, frames)) < 0.01] = 2000
+    timestamps = np.cumsum(intervals, axis=1)
+    timestamps[:, ::50] = np.nan
+    return timestamps
+
+
+def replay_engine(streams, timestamps=None, gated=False):
+    """
+    Step every stream through one store all together and through another one
+    session at a time, on the same features; `gated` passes the visibilities.
+    Returns each store's (sessions, frames, exercises) reps completed and the
+    names of the STATE arrays the two stores ended up disagreeing on.
+    """
+    sessions, frames = streams.shape[:2]
+    ids = [np.arange(len(EXERCISES), dtype=np.intp)] * sessions
+    together = DetectorStore(exercise_engine, capacity=sessions)
+    alone = DetectorStore(exercise_engine, capacity=sessions)
+    rows = [together.allocate() for _ in range(sessions)]
+    alone_rows = [alone.allocate() for _ in range(sessions)]
+    hits_together = np.zeros((sessions, frames, len(EXERCISES)), dtype=bool)
+    hits_alone = np.zeros_like(hits_together)
+    for index in range(frames):
+        frame = streams[:, index]
+        features = compute_features(frame)
+        times = None if timestamps is None else timestamps[:, index]
+        visibility = frame[:, :, 3] if gated else None
+        hits_together[:, index] = together.step(rows, ids, features, times, visibility)
+        for session, row in enumerate(alone_rows):
+            one = slice(session, session + 1)
+            hits_alone[session, index] = alone.step(
+                [row], ids[:1], features[one], None if times is None else times[one],
+                None if visibility is None else visibility[one],
+            )[0]
+    differing = []
+    for name in STATE:
+        a, b = getattr(together, name)[rows], getattr(alone, name)[alone_rows]
+        if not np.array_equal(a, b, equal_nan=a.dtype.kind == "f"):
+            differing.append(name)
+    return hits_together, hits_alone, differing
+
+
+def replay_reference(streams):
+    """(sessions, frames, exercises) reps the reference detectors complete on each stream"""
+    hits = np.zeros((len(streams), streams.shape[1], len(EXERCISES)), dtype=bool)
+    for session, stream in enumerate(streams):
+        detectors = ReferenceDetectors()
+        for index, frame in enumerate(stream):
+            detected = detectors.detect_all_exercises([Landmark(*values) for values in frame.tolist()])
+            hits[session, index] = [detected[key] for key in EXERCISES]
+    return hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="Recording files or directories of recordings to replay too")
+    parser.add_argument("--streams", type=int, default=30, help="Random landmark streams")
+    parser.add_argument("--frames", type=int, default=1500, help="Frames per stream")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    streams = synthetic_streams(args.streams, args.frames, rng)
+    if args.paths:
+        streams = np.concatenate([streams, recorded_streams(args.paths, args.frames)])
+    if len(streams) * len(EXERCISES) <= SCALAR_MAX_ROWS:
+        raise SystemExit(f"Need more than {SCALAR_MAX_ROWS // len(EXERCISES)} streams to run the vectorized path")
+    print(f"{len(streams)} streams x {args.frames} frames, {len(EXERCISES)} exercises\n")
+    failed = False
+
+    frames = streams.reshape(-1, 33, 4)
+    difference = max(float(np.abs(compute_features_row(frame) - features).max())
+                     for frame, features in zip(frames, compute_features(frames)))
+    print(f"features, plain Python vs vectorized: max difference {difference:.1e}")
+    failed |= difference > 1e-9
+
+    timestamps = jittered_timestamps(len(streams), args.frames, rng)
+    runs = {}
+    for label, times, gated in (("30 FPS", None, False), ("jittered timestamps, occlusion", timestamps, True)):
+        hits_together, hits_alone, differing = runs[label] = replay_engine(streams, times, gated)
+        frames_differing = int((hits_together != hits_alone).any(axis=2).sum())
+        print(f"vectorized vs step_row, {label}: {frames_differing} frames differ,"
+              f" state {'differs in ' + ', '.join(differing) if differing else 'identical'}")
+        failed |= frames_differing > 0 or bool(differing)
+
+    engine_hits = runs["30 FPS"][0]
+    reference_hits = replay_reference(streams)
+    print(f"\n{'exercise':<18} {'reference':>10} {'engine':>8} {'frames differing':>17}")
+    for column, key in enumerate(EXERCISES):
+        differing = int((engine_hits[:, :, column] != reference_hits[:, :, column]).sum())
+        label = f"{key} *" if key in TIME_BASED else key
+        print(f"{label:<18} {int(reference_hits[:, :, column].sum()):>10} {int(engine_hits[:, :, column].sum()):>8}"
+              f" {differing:>17}")
+        failed |= differing > 0 and key not in TIME_BASED
+    print("* time-based: counts real time since capture timestamps, not compared")
+
+    if failed:
+        print("\nFAIL: the engine paths or the reference detectors disagree")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Per-frame cost of feature extraction and exercise detection.
+
+Compares the scalar geometry helpers the detectors used to call (one
+calculate_angle / calculate_distance per detector, on MediaPipe-style
+landmark objects) against the single vectorized compute_features pass and
+the plain-Python compute_features_row a lone session's frame uses, then
+times one session's detection call - the reference detectors
+(benchmarks/reference_detectors.py) running all 11 exercises against the
+engine running all 11, the 4 tracked and a single one, called directly and
+through the DetectionBatcher the frame pipeline uses - and the exercise
+engine stepping many sessions at once. Each row is its fastest of --repeats
+rounds over the same random frames; the rows of a table run interleaved,
+so load changes on the machine hit them alike and the ratios to the
+reference hold between runs.
+
+Run from the backend directory:
+    python -m benchmarks.kinematics [--frames 2000] [--sessions 1000] [--repeats 5]
+"""
+import argparse
+import asyncio
+import math
+import time
+from collections import namedtuple
+import numpy as np
+from app.services.detector_store import DetectionBatcher
+from app.services.exercise_detection import ExerciseDetectionService, EXERCISES, exercise_engine
+from app.utils.constants import PoseLandmark as L
+from app.utils.geometry import calculate_angle, calculate_distance
+from app.utils.kinematics import Feature, compute_features, compute_features_row
+from benchmarks.reference_detectors import ReferenceDetectors
+
+Landmark = namedtuple("Landmark", ["x", "y", "z", "visibility"])
+
+TRACKED = ["push_up", "squat", "jumping_jack", "arm_circle"]
+
+
+def scalar_features(lms):
+    """The angles / distances the detectors used to compute, one geometry call per detector"""
+    knee = [calculate_angle(lms[L.LEFT_HIP], lms[L.LEFT_KNEE], lms[L.LEFT_ANKLE]) for _ in range(4)]
+    return knee + [
+        calculate_angle(lms[L.RIGHT_HIP], lms[L.RIGHT_KNEE], lms[L.RIGHT_ANKLE]),
+        calculate_angle(lms[L.LEFT_SHOULDER], lms[L.LEFT_ELBOW], lms[L.LEFT_WRIST]),
+        calculate_angle(lms[L.RIGHT_SHOULDER], lms[L.RIGHT_ELBOW], lms[L.RIGHT_WRIST]),
+        calculate_angle(lms[L.LEFT_SHOULDER], lms[L.LEFT_HIP], lms[L.LEFT_ANKLE]),
+        calculate_distance(lms[L.LEFT_WRIST], lms[L.RIGHT_WRIST]),
+        calculate_distance(lms[L.LEFT_ANKLE], lms[L.RIGHT_ANKLE]),
+        calculate_distance(lms[L.LEFT_WRIST], lms[L.RIGHT_WRIST]),
+        calculate_distance(lms[L.LEFT_ANKLE], lms[L.RIGHT_ANKLE]),
+        math.degrees(math.atan2(lms[L.LEFT_WRIST].y - lms[L.LEFT_SHOULDER].y,
+                                lms[L.LEFT_WRIST].x - lms[L.LEFT_SHOULDER].x)),
+        math.degrees(math.atan2(lms[L.RIGHT_WRIST].y - lms[L.RIGHT_SHOULDER].y,
+                                lms[L.RIGHT_WRIST].x - lms[L.RIGHT_SHOULDER].x)),
+    ]
+
+
+def time_per_frame_us(fn, frames):
+    """Average microseconds of fn(frame) over all frames"""
+    started = time.perf_counter()
+    for frame in frames:
+        fn(frame)
+    return (time.perf_counter() - started) / len(frames) * 1e6
+
+
+def batched_per_frame_us(service, frames, exercises):
+    """time_per_frame_us of one session's frames awaited one by one through a DetectionBatcher"""
+    batcher = DetectionBatcher()
+
+    async def run():
+        for landmarks in frames:
+            await batcher.detect(service, landmarks, exercises)
+
+    started = time.perf_counter()
+    asyncio.run(run())
+    return (time.perf_counter() - started) / len(frames) * 1e6
+
+
+def fastest_us(timers, repeats):
+    """
+    Run each timer (a function returning us/frame) once per round, for a
+    warm-up round and `repeats` measured ones, and return each one's fastest
+    round: interleaving keeps load changes on the machine from favoring one
+    """
+    timers[0]()
+    best = [math.inf] * len(timers)
+    for _ in range(repeats):
+        for index, timer in enumerate(timers):
+            best[index] = min(best[index], timer())
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=2000)
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--repeats", type=int, default=5, help="Passes per row; the fastest is reported")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    arrays = [rng.random((33, 4)).astype(np.float32) for _ in range(args.frames)]
+    landmark_lists = [[Landmark(*row) for row in array.tolist()] for array in arrays]
+
+    # Same values every way
+    vector = compute_features(arrays[0])
+    assert math.isclose(vector[Feature.LEFT_KNEE_ANGLE], scalar_features(landmark_lists[0])[0], abs_tol=1e-9)
+    assert np.allclose(vector, compute_features_row(arrays[0]), rtol=0, atol=1e-9)
+
+    reference = ReferenceDetectors()
+    service = ExerciseDetectionService()
+    indices = range(args.frames)
+    rows = [
+        ("features: scalar geometry calls", lambda i: scalar_features(landmark_lists[i])),
+        ("features: vectorized pass", lambda i: compute_features(arrays[i]).tolist()),
+        ("features: scalar row pass", lambda i: compute_features_row(arrays[i])),
+    ]
+    for (name, _), elapsed in zip(rows, fastest_us(
+            [lambda fn=fn: time_per_frame_us(fn, indices) for _, fn in rows], args.repeats)):
+        print(f"{name:<36} {elapsed:8.1f} us/frame")
+
+    # One session's detection call, also relative to the reference detectors of the same rounds
+    rows = [("reference detectors, all 11",
+             lambda: time_per_frame_us(lambda i: reference.detect_all_exercises(landmark_lists[i]), indices))]
+    for exercises in (EXERCISES, TRACKED, ("squat",)):
+        label = f"detect {len(exercises)} exercise" + ("s" if len(exercises) > 1 else "")
+        rows.append((label, lambda exercises=exercises: time_per_frame_us(
+            lambda i: service.detect_exercises(arrays[i], exercises), indices)))
+        rows.append((label + ", via batcher",
+                     lambda exercises=exercises: batched_per_frame_us(service, arrays, exercises)))
+    timings = fastest_us([timer for _, timer in rows], args.repeats)
+    for (name, _), elapsed in zip(rows, timings):
+        print(f"{name:<36} {elapsed:8.1f} us/frame {elapsed / timings[0]:5.2f}x reference")
+
+    # Every exercise of every session advanced by one engine step
+    exercise = np.tile(np.arange(len(EXERCISES)), args.sessions)
+    stage, count, registers = exercise_engine.initial_state(exercise)
+    features = compute_features(rng.random((len(exercise), 33, 4)))
+    steps = max(1, args.frames // 100)
+    started = time.perf_counter()
+    for _ in range(steps):
+        stage, count, registers, _ = exercise_engine.step(exercise, stage, count, registers, features, 33.0)
+    elapsed = (time.perf_counter() - started) / steps * 1e6
+    print(f"{'engine step, ' + str(args.sessions) + ' sessions x 11':<36} {elapsed:8.1f} us/frame"
+          f" ({elapsed / args.sessions:.1f} us/session)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+Load generator: N simulated webcam clients against a running backend.
+
+Each client has its own session and sends JPEG frames (a directory of
+recorded frames, looped, or synthetic ones) at a fixed frame rate, either
+as POST /api/process-frame requests or over the /api/ws/frames WebSocket.
+Like the frontend, an HTTP client skips a frame while its previous request
+is still in flight; over the WebSocket the server drops frames it cannot
+keep up with.
+
+Reports throughput, p50/p95/p99 latency, skipped / dropped / rejected (503)
+frames and, when the server process is known (--spawn or --server-pid), its
+CPU use and memory. --max-p95-ms / --min-throughput / --max-error-rate
+make the command exit with status 1 when missed, so capacity regressions can
+gate a release; a run in which no frame completed always fails.
+
+Run from the backend directory:
+    python -m benchmarks.loadgen --spawn --clients 20 --fps 15 --duration 30 [--frames recorded_frames/]
+    python -m benchmarks.loadgen --url http://127.0.0.1:8000 --mode ws --format int16-delta --clients 50
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import cv2
+import httpx
+import numpy as np
+import psutil
+import websockets
+from app.utils.landmark_encoding import HEADER, RESPONSE_FORMATS
+
+FRAME_PATTERNS = ("*.jpg", "*.jpeg", "*.JPG", "*.JPEG")
+# Time allowed after the run for answers to frames already sent
+DRAIN_SECONDS = 5.0
+SERVER_START_TIMEOUT_SECONDS = 300
+
+
+class ClientStats:
+    """Counters and latencies of all simulated clients"""
+
+    def __init__(self):
+        self.sent = 0
+        self.completed = 0
+        self.skipped = 0  # not sent: the client's previous request was still in flight
+        self.dropped = 0  # sent but never answered (dropped by the server)
+        self.rejected = 0  # 503: inference queue full
+        self.errors = 0
+        self.latencies_ms = []
+
+
+def load_frames(directory, count, width, height):
+    """JPEG frames from a directory, or `count` synthetic frames of a moving shape on a gradient"""
+    if directory:
+        paths = sorted(path for pattern in FRAME_PATTERNS for path in glob.glob(os.path.join(directory, pattern)))
+        if not paths:
+            raise SystemExit(f"No JPEG frames in {directory}")
+        frames = []
+        for path in paths:
+            with open(path, "rb") as f:
+                frames.append(f.read())
+        return frames
+
+    gradient = np.linspace(0, 255, width, dtype=np.uint8)[None, :, None].repeat(height, axis=0).repeat(3, axis=2)
+    frames = []
+    for index in range(count):
+        image = gradient.copy()
+        x = int((index / count) * (width - width // 4))
+        cv2.rectangle(image, (x, height // 4), (x + width // 4, height * 3 // 4), (40, 120, 220), -1)
+        ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        frames.append(encoded.tobytes())
+    return frames
+
+
+async def http_client(index, client, args, frames, stats, started, deadline):
+    """One webcam client posting frames to /api/process-frame"""
+    interval = 1 / args.fps
+    params = {"session_id": f"loadgen-{index}"}
+    if args.format != "json":
+        params["format"] = args.format
+    loop = asyncio.get_running_loop()
+
+    async def send(contents):
+        sent_at = time.perf_counter()
+        try:
+            response = await client.post(
+                "/api/process-frame", params=params, files={"file": ("frame.jpg", contents, "image/jpeg")},
+                headers={"X-Capture-Timestamp": f"{sent_at * 1000:.1f}"},
+            )
+        except httpx.HTTPError:
+            stats.errors += 1
+            return
+        if response.status_code == 200:
+            stats.completed += 1
+            stats.latencies_ms.append((time.perf_counter() - sent_at) * 1000)
+        elif response.status_code == 503:
+            stats.rejected += 1
+        else:
+            stats.errors += 1
+
+    # Clients start spread over one frame interval
+    next_tick = started + interval * index / args.clients
+    frame_index = index
+    in_flight = None
+    while next_tick < deadline:
+        await asyncio.sleep(max(0.0, next_tick - loop.time()))
+        next_tick += interval
+        if in_flight is not None and not in_flight.done():
+            stats.skipped += 1
+            continue
+        stats.sent += 1
+        in_flight = asyncio.ensure_future(send(frames[frame_index % len(frames)]))
+        frame_index += 1
+    if in_flight is not None:
+        await in_flight
+
+
+async def ws_client(index, args, frames, stats, started, deadline):
+    """One webcam client streaming frames over /api/ws/frames"""
+    interval = 1 / args.fps
+    url = args.url.replace("http", "ws", 1) + f"/api/ws/frames?session_id=loadgen-{index}"
+    if args.format != "json":
+        url += f"&format={args.format}"
+    loop = asyncio.get_running_loop()
+    sent_at = {}
+
+    async def receive(ws):
+        async for message in ws:
+            if isinstance(message, bytes):
+                frame_id = HEADER.unpack_from(message)[5]
+            else:
+                result = json.loads(message)
+                frame_id = result.get("frame_id")
+                if result.get("type") == "error":
+                    stats.errors += 1
+                    sent_at.pop(frame_id, None)
+                    continue
+            sent = sent_at.pop(frame_id, None)
+            if sent is not None:
+                stats.completed += 1
+                stats.latencies_ms.append((time.perf_counter() - sent) * 1000)
+            # Results come back in order, so older unanswered frames were dropped
+            while sent_at and next(iter(sent_at)) < frame_id:
+                sent_at.pop(next(iter(sent_at)))
+                stats.dropped += 1
+
+    try:
+        async with websockets.connect(url, max_size=None) as ws:
+            receiver = asyncio.ensure_future(receive(ws))
+            next_tick = started + interval * index / args.clients
+            frame_id = 0
+            while next_tick < deadline:
+                await asyncio.sleep(max(0.0, next_tick - loop.time()))
+                next_tick += interval
+                frame_id += 1
+                sent_at[frame_id] = time.perf_counter()
+                stats.sent += 1
+                await ws.send(frames[(index + frame_id) % len(frames)])
+            # Give the server time to answer what it still has, then count the rest as dropped
+            drain_until = loop.time() + DRAIN_SECONDS
+            while sent_at and loop.time() < drain_until:
+                await asyncio.sleep(0.05)
+            receiver.cancel()
+    except (OSError, websockets.WebSocketException):
+        stats.errors += 1
+    stats.dropped += len(sent_at)
+
+
+def free_port():
+    """An unused local TCP port"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def spawn_server(port):
+    """Start uvicorn on `port` from the backend directory and wait until it answers"""
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=backend,
+    )
+    url = f"http://127.0.0.1:{port}"
+    started = time.monotonic()
+    while time.monotonic() - started < SERVER_START_TIMEOUT_SECONDS:
+        if process.poll() is not None:
+            raise SystemExit(f"Server exited with status {process.returncode}")
+        try:
+            if httpx.get(url + "/api/sessions/stats", timeout=1).status_code == 200:
+                return process, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise SystemExit("Server did not start in time")
+
+
+def cpu_seconds(process):
+    """User + system CPU seconds of a process and its children (inference worker processes)"""
+    total = 0.0
+    for proc in [process] + process.children(recursive=True):
+        try:
+            times = proc.cpu_times()
+        except psutil.NoSuchProcess:
+            continue
+        total += times.user + times.system
+    return total
+
+
+def rss_mb(process):
+    """Resident memory of a process and its children in MB"""
+    total = 0
+    for proc in [process] + process.children(recursive=True):
+        try:
+            total += proc.memory_info().rss
+        except psutil.NoSuchProcess:
+            continue
+    return total / 1e6
+
+
+async def run(args, frames):
+    """Run every client for `duration` seconds; returns (stats, seconds from the first frame to the last answer)"""
+    stats = ClientStats()
+    loop = asyncio.get_running_loop()
+    started = loop.time() + 0.5
+    deadline = started + args.duration
+    if args.mode == "ws":
+        await asyncio.gather(*[
+            ws_client(index, args, frames, stats, started, deadline) for index in range(args.clients)
+        ])
+    else:
+        limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+        async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+            await asyncio.gather(*[
+                http_client(index, client, args, frames, stats, started, deadline) for index in range(args.clients)
+            ])
+    return stats, loop.time() - started
+
+
+def summarize(args, stats, elapsed, cpu, memory):
+    """Summary dict of one run"""
+    latencies = np.array(stats.latencies_ms) if stats.latencies_ms else np.zeros(1)
+    summary = {
+        "mode": args.mode,
+        "format": args.format,
+        "clients": args.clients,
+        "target_fps": args.fps,
+        "duration_s": round(elapsed, 2),
+        "sent": stats.sent,
+        "completed": stats.completed,
+        "throughput_fps": round(stats.completed / elapsed, 1) if elapsed > 0 else 0.0,
+        "per_client_fps": round(stats.completed / elapsed / args.clients, 2) if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "p50": round(float(np.percentile(latencies, 50)), 1),
+            "p95": round(float(np.percentile(latencies, 95)), 1),
+            "p99": round(float(np.percentile(latencies, 99)), 1),
+            "max": round(float(latencies.max()), 1),
+        },
+        "skipped": stats.skipped,
+        "dropped": stats.dropped,
+        "rejected": stats.rejected,
+        "errors": stats.errors,
+        # Share of sent frames that were rejected (503) or failed
+        "error_rate": round((stats.rejected + stats.errors) / stats.sent, 4) if stats.sent else 0.0,
+    }
+    if cpu is not None and elapsed > 0:
+        summary["server_cpu_percent"] = round(cpu / elapsed * 100, 1)
+        summary["server_rss_mb"] = round(memory, 1)
+    return summary
+
+
+def print_summary(summary):
+    """Human readable summary"""
+    latency = summary["latency_ms"]
+    print(f"{summary['clients']} clients x {summary['target_fps']} fps over {summary['mode']}"
+          f" ({summary['format']}), {summary['duration_s']} s")
+    print(f"  throughput   {summary['throughput_fps']} frames/s ({summary['per_client_fps']} per client)")
+    print(f"  latency ms   p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}")
+    print(f"  frames       sent {summary['sent']}  completed {summary['completed']}  skipped {summary['skipped']}"
+          f"  dropped {summary['dropped']}  rejected {summary['rejected']}  errors {summary['errors']}"
+          f"  (error rate {summary['error_rate']:.1%})")
+    if "server_cpu_percent" in summary:
+        print(f"  server       cpu {summary['server_cpu_percent']}% of one core  rss {summary['server_rss_mb']} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Backend URL (ignored with --spawn)")
+    parser.add_argument("--spawn", action="store_true", help="Start a local uvicorn server for the run")
+    parser.add_argument("--server-pid", type=int, help="Measure CPU / memory of this server process")
+    parser.add_argument("--frames", help="Directory of JPEG frames (default: synthetic frames)")
+    parser.add_argument("--synthetic-frames", type=int, default=60)
+    parser.add_argument("--width", type=int, default=1280, help="Synthetic frame width")
+    parser.add_argument("--height", type=int, default=720, help="Synthetic frame height")
+    parser.add_argument("--mode", choices=("http", "ws"), default="http")
+    parser.add_argument("--format", choices=RESPONSE_FORMATS, default="json")
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--fps", type=float, default=15)
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of load")
+    parser.add_argument("--timeout", type=float, default=30, help="HTTP request timeout in seconds")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    parser.add_argument("--max-p95-ms", type=float, help="Fail if p95 latency is above this")
+    parser.add_argument("--min-throughput", type=float, help="Fail if completed frames/s is below this")
+    parser.add_argument("--max-error-rate", type=float,
+                        help="Fail if the share of sent frames rejected or failed (0-1) is above this")
+    args = parser.parse_args()
+
+    frames = load_frames(args.frames, args.synthetic_frames, args.width, args.height)
+    server = None
+    process = None
+    if args.spawn:
+        server, args.url = spawn_server(free_port())
+        process = psutil.Process(server.pid)
+    elif args.server_pid:
+        process = psutil.Process(args.server_pid)
+
+    try:
+        cpu_before = cpu_seconds(process) if process else None
+        stats, elapsed = asyncio.run(run(args, frames))
+        cpu = cpu_seconds(process) - cpu_before if process else None
+        memory = rss_mb(process) if process else None
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    summary = summarize(args, stats, elapsed, cpu, memory)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary)
+
+    failures = []
+    if summary["completed"] == 0:
+        # Latency and throughput gates would pass on the placeholder zeros
+        failures.append("no frame completed")
+    if args.max_p95_ms is not None and summary["latency_ms"]["p95"] > args.max_p95_ms:
+        failures.append(f"p95 latency {summary['latency_ms']['p95']} ms > {args.max_p95_ms} ms")
+    if args.min_throughput is not None and summary["throughput_fps"] < args.min_throughput:
+        failures.append(f"throughput {summary['throughput_fps']} frames/s < {args.min_throughput}")
+    if args.max_error_rate is not None and summary["error_rate"] > args.max_error_rate:
+        failures.append(f"error rate {summary['error_rate']:.1%} > {args.max_error_rate:.1%}")
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Compare pose backends (MediaPipe, YOLO-pose) on recorded workout videos.
+
+Landmark recordings only hold one backend's output, so backends are compared
+on the videos themselves: every frame of each video is decoded to
+FRAME_TARGET_WIDTH (as the live pipeline decodes uploads), run through each
+backend in this process and its first pose fed to fresh exercise detectors
+with the video's timestamps. Reported per backend and video:
+  - inference latency per frame (p50 / p95) and frames/s on one worker
+  - CPU time per frame spent in the backend (process time, all of its
+    threads), which decides how many sessions a deployment's cores can serve
+  - share of frames with a pose, and counted reps against the labeled
+    ground truth (--labels JSON: {"<video name>": {"squat": 10, ...}})
+
+With --record DIR each backend's landmarks are also written as landmark
+recordings, so benchmarks.replay can evaluate detector changes against
+either backend. With --max-error the command exits with status 1 when any
+count is off by more.
+
+Run from the backend directory:
+    python -m benchmarks.pose_backends videos/ --labels labels.json [--backends mediapipe,yolo]
+                                               [--tier full] [--exercises labeled|all|squat,lunge]
+                                               [--smooth] [--record recordings/]
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import cv2
+import numpy as np
+from app.config import FRAME_TARGET_WIDTH, LANDMARK_SMOOTHING_BETA, LANDMARK_SMOOTHING_DERIVATIVE_CUTOFF_HZ
+from app.services.detector_store import DetectorStore
+from app.services.exercise_detection import (
+    ExerciseDetectionService, EXERCISES, exercise_engine, resolve_exercise_key, smoothing_cutoff
+)
+from app.services.landmark_recorder import LandmarkRecorder
+from app.services.pose_detection import POSE_BACKENDS, create_pose_backend
+from app.utils.landmark_smoothing import OneEuroFilter
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi", ".mkv", ".webm")
+DEFAULT_FPS = 30.0  # used when a video does not report its frame rate
+
+
+def video_paths(paths):
+    """Expand directories into the videos they contain"""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(sorted(
+                name for name in glob.glob(os.path.join(path, "*")) if name.lower().endswith(VIDEO_EXTENSIONS)
+            ))
+        else:
+            found.append(path)
+    return found
+
+
+def video_name(path):
+    """Name a video is labeled by: its file name without extension"""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def read_frames(path, target_width=FRAME_TARGET_WIDTH):
+    """Decode a video frame by frame, yielding (RGB frame no wider than `target_width`, capture timestamp in ms)"""
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise SystemExit(f"Cannot open video {path}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+    index = 0
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                return
+            height, width = frame.shape[:2]
+            if width > target_width:
+                frame = cv2.resize(frame, (target_width, round(height * target_width / width)),
+                                   interpolation=cv2.INTER_AREA)
+            yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), index * 1000.0 / fps
+            index += 1
+    finally:
+        capture.release()
+
+
+def video_exercises(truth, mode):
+    """Detector keys to run on a video: its labeled exercises, every detector, or a fixed list"""
+    if mode == "labeled":
+        return tuple(key for key in truth if key in EXERCISES) or EXERCISES
+    keys = EXERCISES if mode == "all" else tuple(resolve_exercise_key(name) for name in mode.split(","))
+    if None in keys:
+        raise SystemExit(f"Unknown exercise in --exercises {mode}")
+    return keys
+
+
+def cost_columns(latencies_ms, cpu_seconds):
+    """Latency p50 / p95, frames/s on one worker and CPU ms per frame, formatted as table columns"""
+    if not latencies_ms:
+        return f"{0:>8.1f} {0:>8.1f} {0:>9.1f} {0:>8.1f}"
+    p50, p95 = np.percentile(latencies_ms, [50, 95])
+    rate = 1000 / max(1e-9, float(np.mean(latencies_ms)))
+    return f"{p50:>8.1f} {p95:>8.1f} {rate:>9.1f} {cpu_seconds * 1000 / len(latencies_ms):>8.1f}"
+
+
+def run_video(backend, path, exercises, tier, smooth=False, recorder=None):
+    """
+    Run a backend on every frame of a video and its first pose through fresh
+    detectors; returns (counts, per-frame latencies in ms, CPU seconds in the backend, frames with a pose)
+    """
+    name = video_name(path)
+    service = ExerciseDetectionService(DetectorStore(exercise_engine, capacity=1))
+    smoother = OneEuroFilter(LANDMARK_SMOOTHING_BETA, LANDMARK_SMOOTHING_DERIVATIVE_CUTOFF_HZ) if smooth else None
+    cutoff = smoothing_cutoff(exercises)
+    latencies_ms = []
+    found = 0
+    if recorder is not None:
+        recorder.start(name, f"{name}-{backend.name}")
+    cpu_seconds = 0.0
+    for rgb_image, timestamp_ms in read_frames(path):
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        poses, _ = backend.detect(rgb_image, name, tier, timestamp_ms)
+        cpu_seconds += time.process_time() - cpu_started
+        latencies_ms.append((time.perf_counter() - started) * 1000)
+        landmarks = poses[0] if poses else None
+        if recorder is not None:
+            recorder.record(name, landmarks, exercises, timestamp_ms)
+        if landmarks is None:
+            if smoother is not None:
+                smoother.reset()
+            continue
+        found += 1
+        if smoother is not None and cutoff > 0:
+            landmarks = smoother.filter(landmarks, timestamp_ms, cutoff)
+        service.detect_exercises(landmarks, exercises, timestamp_ms)
+    backend.release(name)
+    counts = service.get_counters()
+    service.release()
+    return counts, latencies_ms, cpu_seconds, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="Video files or directories of videos")
+    parser.add_argument("--labels", help="JSON file of ground truth rep counts per video name")
+    parser.add_argument("--backends", default=",".join(POSE_BACKENDS), help="Comma separated pose backends to compare")
+    parser.add_argument("--tier", default="full", help="Model tier of every backend (lite, full, heavy)")
+    parser.add_argument("--exercises", default="labeled",
+                        help="Detectors to run: 'labeled' (the video's labels), 'all', or a comma separated list")
+    parser.add_argument("--smooth", action="store_true", help="Smooth landmarks with the One-Euro filter")
+    parser.add_argument("--record", help="Also write each backend's landmarks as recordings to this directory")
+    parser.add_argument("--max-error", type=int, default=None,
+                        help="Exit with status 1 if any rep count is off by more than this")
+    args = parser.parse_args()
+
+    paths = video_paths(args.paths)
+    if not paths:
+        raise SystemExit("No videos found")
+    labels = {}
+    if args.labels:
+        with open(args.labels) as f:
+            labels = json.load(f)
+    recorder = LandmarkRecorder(args.record) if args.record else None
+
+    videos = []
+    for path in paths:
+        truth = {resolve_exercise_key(key) or key: reps for key, reps in labels.get(video_name(path), {}).items()}
+        videos.append((path, truth, video_exercises(truth, args.exercises)))
+
+    worst_error = 0
+    summary = []
+    for backend_name in args.backends.split(","):
+        try:
+            backend = create_pose_backend(backend_name, tiers=[args.tier], default_tier=args.tier)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        backend.warm_up()
+        print(f"\n{backend_name} ({args.tier})")
+        print(f"{'video':<28} {'frames':>7} {'p50 ms':>8} {'p95 ms':>8} {'frames/s':>9} {'cpu ms':>8} {'pose':>6}"
+              f"  exercise: counted / truth (error)")
+        all_latencies = []
+        all_cpu = 0.0
+        all_errors = []
+        for path, truth, exercises in videos:
+            name = video_name(path)
+            counts, latencies_ms, cpu_seconds, found = run_video(
+                backend, path, exercises, args.tier, args.smooth, recorder
+            )
+            if recorder is not None:
+                recorder.save(recorder.stop(name, truth, counts))
+            all_latencies.extend(latencies_ms)
+            all_cpu += cpu_seconds
+            cells = []
+            for key in sorted(truth):
+                error = counts.get(key, 0) - truth[key]
+                all_errors.append(abs(error))
+                worst_error = max(worst_error, abs(error))
+                cells.append(f"{key}: {counts.get(key, 0)} / {truth[key]} ({error:+d})")
+            if not truth:
+                cells = [f"{key}: {count}" for key, count in counts.items() if count]
+            print(f"{name:<28} {len(latencies_ms):>7} {cost_columns(latencies_ms, cpu_seconds)} "
+                  f"{found / max(1, len(latencies_ms)):>6.0%}  {', '.join(cells) or '-'}")
+        summary.append((backend_name, all_latencies, all_cpu, all_errors))
+
+    # One line per backend, to choose a deployment's backend by CPU cost and accuracy
+    print(f"\n{'backend':<12} {'p50 ms':>8} {'p95 ms':>8} {'frames/s':>9} {'cpu ms':>8} {'mean |error|':>13}")
+    for backend_name, latencies_ms, cpu_seconds, errors in summary:
+        print(f"{backend_name:<12} {cost_columns(latencies_ms, cpu_seconds)} {np.mean(errors) if errors else 0:>13.2f}")
+
+    if args.max_error is not None and worst_error > args.max_error:
+        print(f"\nFAIL: rep count off by {worst_error} (allowed {args.max_error})")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Replay landmark recordings through the exercise detectors, offline.
+
+Streams every frame of each recording (written by the landmark recorder,
+see POST /api/session/recording) through a fresh ExerciseDetectionService as
+fast as possible, with the recorded capture timestamps, and reports:
+  - frames/sec per recording, and for all recordings stepped together as
+    concurrent sessions of one detector store
+  - time per frame of each detector run on its own
+  - counted reps against the labeled ground truth, and the error
+
+Ground truth comes from the recording (given when it was stopped) or from a
+--labels JSON file: {"<recording name>": {"squat": 10, ...}}. With
+--max-error the command exits with status 1 when any count is off by more,
+so it can gate detector / threshold changes.
+
+--stride N replays only every Nth frame, as a server skipping frames would
+see them; --predict fills the gaps with predicted landmarks and --smooth
+runs the One-Euro filter the way the live pipeline does
+(LANDMARK_PREDICTION_* / LANDMARK_SMOOTHING_* settings), so counts can be
+compared with and without them.
+
+Run from the backend directory:
+    python -m benchmarks.replay recordings/ [--labels labels.json] [--exercises recorded|all|squat,lunge]
+                                            [--stride 2] [--predict] [--smooth]
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import numpy as np
+from app.config import (
+    LANDMARK_PREDICTION_MIN_INTERVAL_MS, LANDMARK_PREDICTION_MAX_GAP_MS,
+    LANDMARK_SMOOTHING_BETA, LANDMARK_SMOOTHING_DERIVATIVE_CUTOFF_HZ
+)
+from app.services.detector_store import DetectorStore
+from app.services.exercise_detection import (
+    ExerciseDetectionService, EXERCISES, exercise_engine, resolve_exercise_key, smoothing_cutoff
+)
+from app.services.landmark_recorder import load_recording, RECORDING_SUFFIX
+from app.utils.kinematics import compute_features
+from app.utils.landmark_prediction import LandmarkPredictor
+from app.utils.landmark_smoothing import OneEuroFilter
+
+
+def recording_paths(paths):
+    """Expand directories into the recordings they contain"""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(sorted(glob.glob(os.path.join(path, "*" + RECORDING_SUFFIX))))
+        else:
+            found.append(path)
+    return found
+
+
+def frame_exercises(recording, mode):
+    """Detector keys to run on each frame: as recorded, every detector, or a fixed list"""
+    if mode == "recorded":
+        return [recording.active_exercises(index) for index in range(len(recording.present))]
+    keys = EXERCISES if mode == "all" else tuple(resolve_exercise_key(name) for name in mode.split(","))
+    if None in keys:
+        raise SystemExit(f"Unknown exercise in --exercises {mode}")
+    return [keys] * len(recording.present)
+
+
+def replay(recording, exercises, stride=1, predict=False, smooth=False):
+    """
+    Run every `stride`th frame of a recording through fresh detectors, smoothing
+    landmarks when `smooth` and filling gaps with predicted landmarks when
+    `predict`; returns (counts, seconds spent detecting)
+    """
+    service = ExerciseDetectionService(DetectorStore(exercise_engine, capacity=1))
+    predictor = (
+        LandmarkPredictor(LANDMARK_PREDICTION_MIN_INTERVAL_MS, LANDMARK_PREDICTION_MAX_GAP_MS) if predict else None
+    )
+    smoother = OneEuroFilter(LANDMARK_SMOOTHING_BETA, LANDMARK_SMOOTHING_DERIVATIVE_CUTOFF_HZ) if smooth else None
+    started = time.perf_counter()
+    for landmarks, present, timestamp_ms, keys in list(zip(
+        recording.landmarks, recording.present, recording.timestamps_ms, exercises
+    ))[::stride]:
+        if not present:
+            if predictor is not None:
+                predictor.reset()
+            if smoother is not None:
+                smoother.reset()
+        elif keys:
+            cutoff = smoothing_cutoff(keys) if smoother is not None else 0
+            if cutoff > 0:
+                landmarks = smoother.filter(landmarks, timestamp_ms, cutoff)
+            elif smoother is not None:
+                smoother.reset()
+            for frame, frame_timestamp_ms in (predictor.fill(landmarks, timestamp_ms) if predictor else ()):
+                service.detect_exercises(frame, keys, frame_timestamp_ms)
+            service.detect_exercises(landmarks, keys, timestamp_ms)
+    elapsed = time.perf_counter() - started
+    return service.get_counters(), elapsed
+
+
+def replay_together(recordings, exercises):
+    """Step all recordings as concurrent sessions of one store, frame by frame; returns seconds"""
+    store = DetectorStore(exercise_engine, capacity=len(recordings))
+    services = [ExerciseDetectionService(store) for _ in recordings]
+    started = time.perf_counter()
+    for index in range(max(len(recording.present) for recording in recordings)):
+        rows, ids, frames, timestamps_ms = [], [], [], []
+        for service, recording, keys in zip(services, recordings, exercises):
+            if index < len(recording.present) and recording.present[index] and keys[index]:
+                rows.append(service.row)
+                ids.append(service.exercise_ids(keys[index]))
+                frames.append(recording.landmarks[index])
+                timestamps_ms.append(recording.timestamps_ms[index])
+        if rows:
+            frames = np.stack(frames)
+            store.step(rows, ids, compute_features(frames), timestamps_ms, frames[:, :, 3])
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="Recording files or directories of recordings")
+    parser.add_argument("--labels", help="JSON file of ground truth rep counts per recording name")
+    parser.add_argument("--exercises", default="recorded",
+                        help="Detectors to run: 'recorded' (as live), 'all', or a comma separated list")
+    parser.add_argument("--stride", type=int, default=1, help="Replay only every Nth frame")
+    parser.add_argument("--predict", action="store_true", help="Fill gaps between frames with predicted landmarks")
+    parser.add_argument("--smooth", action="store_true", help="Smooth landmarks with the One-Euro filter")
+    parser.add_argument("--max-error", type=int, default=None,
+                        help="Exit with status 1 if any rep count is off by more than this")
+    args = parser.parse_args()
+
+    paths = recording_paths(args.paths)
+    if not paths:
+        raise SystemExit("No recordings found")
+    labels = {}
+    if args.labels:
+        with open(args.labels) as f:
+            labels = json.load(f)
+
+    recordings = [load_recording(path) for path in paths]
+    exercises = [frame_exercises(recording, args.exercises) for recording in recordings]
+
+    worst_error = 0
+    total_frames = 0
+    total_seconds = 0.0
+    print(f"{'recording':<32} {'frames':>7} {'frames/s':>10}  exercise: counted / truth (error)")
+    for recording, keys in zip(recordings, exercises):
+        name = recording.meta["name"]
+        counts, elapsed = replay(recording, keys, args.stride, args.predict, args.smooth)
+        frames = int(recording.present[::args.stride].sum())
+        total_frames += frames
+        total_seconds += elapsed
+        truth = {resolve_exercise_key(key) or key: reps
+                 for key, reps in labels.get(name, recording.meta.get("ground_truth", {})).items()}
+        cells = []
+        for key in sorted(truth):
+            error = counts.get(key, 0) - truth[key]
+            worst_error = max(worst_error, abs(error))
+            cells.append(f"{key}: {counts.get(key, 0)} / {truth[key]} ({error:+d})")
+        if not truth:
+            cells = [f"{key}: {count}" for key, count in counts.items() if count]
+        rate = frames / elapsed if elapsed else 0.0
+        print(f"{name:<32} {frames:>7} {rate:>10.0f}  {', '.join(cells) or '-'}")
+
+    if total_seconds:
+        print(f"\n{'all, one session at a time':<32} {total_frames:>7} {total_frames / total_seconds:>10.0f}")
+    # Detector throughput below is measured over every recorded frame
+    recorded_frames = sum(int(recording.present.sum()) for recording in recordings)
+    together = replay_together(recordings, exercises)
+    if together:
+        print(f"{'all, stepped together':<32} {recorded_frames:>7} {recorded_frames / together:>10.0f}")
+
+    # Each detector on its own, over every recording
+    print(f"\n{'detector':<20} {'us/frame':>10}")
+    for key in EXERCISES:
+        single = [[(key,)] * len(recording.present) for recording in recordings]
+        seconds = sum(replay(recording, keys)[1] for recording, keys in zip(recordings, single))
+        print(f"{key:<20} {seconds / max(1, recorded_frames) * 1e6:>10.1f}")
+
+    if args.max_error is not None and worst_error > args.max_error:
+        print(f"\nFAIL: rep count off by {worst_error} (allowed {args.max_error})")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()